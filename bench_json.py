@@ -0,0 +1,139 @@
+# Benchmark do codificador JSON do bot (chatbot.json_dumps/json_loads com JSON_CODEC=json e com
+# JSON_CODEC=orjson) nos documentos reais: o payload do webhook messages.upsert e contextos de
+# conversa de tamanhos diferentes (o formato compacto gravado hoje e o formato antigo, com as
+# listas de registros dentro do contexto). O orjson chamado direto aparece só como limite superior.
+#   python bench_json.py [--seconds 0.5]
+import argparse
+import json
+import time
+
+import chatbot
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Função para montar um payload messages.upsert como o enviado pela Evolution API
+def webhook_payload():
+    return {
+        "event": "messages.upsert",
+        "instance": chatbot.EVOLUTION_INSTANCE,
+        "data": {
+            "key": {"remoteJid": "5511987654321@s.whatsapp.net", "fromMe": False, "id": "3EB0C767D26A8B9F4E21"},
+            "pushName": "João da Silva",
+            "message": {"conversation": "Quero registrar a entrada de 50 sacos de adubo NPK 10-10-10"},
+            "messageType": "conversation",
+            "messageTimestamp": 1717171717,
+            "owner": chatbot.EVOLUTION_INSTANCE,
+            "source": "android",
+        },
+        "destination": "http://127.0.0.1:5000/webhook",
+        "date_time": "2024-05-31T12:08:37.000Z",
+        "sender": "5511912345678@s.whatsapp.net",
+        "server_url": chatbot.EVOLUTION_API_URL,
+        "apikey": "B6D711FCDE4D4FD5936544120E713976",
+    }
+
+
+# Função para montar o contexto de um agricultor cadastrado no meio de um fluxo (formato gravado hoje)
+def compact_context():
+    context = {field: f"valor de {field}" for field in chatbot.MANDATORY_REGISTRATION_FIELDS}
+    context.update({
+        "nome_completo": "João da Silva",
+        "cpf": "12345678901",
+        "localizacao": {"cidade": "Ribeirão Preto", "estado": "São Paulo", "pais": "Brasil"},
+        "last_interaction_time": 1717171717.123,
+        "controle_estoque_ativo": True,
+        "registro_entrada_estoque_ativo": True,
+        "registro_entrada_estoque_etapa": 3,
+        "dados_entrada_estoque_registro": {"nome_item": "adubo npk 10-10-10", "quantidade": "50 sacos"},
+    })
+    return chatbot.compact_conversation_state(context)
+
+
+# Função para montar um contexto no formato antigo: todas as flags e as listas de registros no documento
+def legacy_context(records):
+    context = chatbot.expand_conversation_state(compact_context())
+    context["registros_estoque"] = [
+        {"nome_item": f"item {i}", "quantidade": f"{i} kg", "data_entrada": "01/05/2024", "data_fabricacao": "01/01/2024",
+         "data_vencimento": "01/01/2026", "numero_lote": f"L{i:05d}"}
+        for i in range(records)
+    ]
+    context["registros_vacinacao"] = [
+        {"animal_id": f"vaca {i}", "vacina": "aftosa", "data_vacinacao": "10/04/2024"} for i in range(records)
+    ]
+    return context
+
+
+# Função para montar um payload com um número de mais de 64 bits (passa pelo fallback da biblioteca padrão)
+def large_int_payload():
+    payload = webhook_payload()
+    payload["data"]["messageTimestamp"] = 123456789012345678901234
+    return payload
+
+
+# Função para medir quantas operações por segundo a função faz durante `seconds` segundos
+def ops_per_second(func, seconds):
+    calls = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(50):
+            func()
+        calls += 50
+    return calls / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara json (biblioteca padrão) e orjson nos documentos do bot.")
+    parser.add_argument("--seconds", type=float, default=0.5, help="tempo de medição de cada caso")
+    args = parser.parse_args()
+
+    documents = [
+        ("payload do webhook", webhook_payload()),
+        ("contexto compacto", compact_context()),
+        ("contexto completo (formato antigo, 0 registros)", legacy_context(0)),
+        ("contexto antigo com 100 registros", legacy_context(100)),
+        ("contexto antigo com 1000 registros", legacy_context(1000)),
+        ("payload com inteiro de mais de 64 bits", large_int_payload()),
+    ]
+    in_use = chatbot.USE_ORJSON
+    # O que o bot executa (json_dumps/json_loads com as opções, a busca por números longos e o
+    # fallback), com USE_ORJSON como JSON_CODEC=json e JSON_CODEC=orjson deixariam
+    codecs = [("bot/json", False, chatbot.json_dumps, chatbot.json_loads)]
+    if orjson is not None:
+        codecs.append(("bot/orjson", True, chatbot.json_dumps, chatbot.json_loads))
+        codecs.append(("orjson puro (limite)", None, lambda obj: orjson.dumps(obj).decode(), orjson.loads))
+    else:
+        print("orjson não está instalado: medindo só JSON_CODEC=json.")
+    print(f"Codificador em uso pelo bot: {'orjson' if in_use else 'json'} (JSON_CODEC={chatbot.JSON_CODEC})\n")
+
+    print(f"{'documento':<50} {'bytes':>8} {'codec':>20} {'dumps/s':>12} {'loads/s':>12}")
+    for name, document in documents:
+        encoded = json.dumps(document)
+        baseline = None
+        for codec_name, use_orjson, dumps, loads in codecs:
+            if use_orjson is not None:
+                chatbot.USE_ORJSON = use_orjson
+            # Os codificadores precisam ler de volta o mesmo documento (o orjson puro não lê/grava
+            # inteiros de mais de 64 bits: fica de fora nesses documentos)
+            try:
+                assert loads(dumps(document)) == json.loads(encoded)
+            except (AssertionError, TypeError) if use_orjson is None else ():
+                print(f"{name:<50} {len(encoded.encode()):>8} {codec_name:>20} {'não suportado':>25}")
+                continue
+            dumps_rate = ops_per_second(lambda: dumps(document), args.seconds)
+            loads_rate = ops_per_second(lambda: loads(encoded), args.seconds)
+            speedup = ""
+            if baseline is None:
+                baseline = (dumps_rate, loads_rate)
+            else:
+                speedup = f"  ({dumps_rate / baseline[0]:.1f}x / {loads_rate / baseline[1]:.1f}x)"
+            print(f"{name:<50} {len(encoded.encode()):>8} {codec_name:>20} {dumps_rate:>12,.0f} {loads_rate:>12,.0f}{speedup}")
+    chatbot.USE_ORJSON = in_use
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,40 @@
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from datetime import datetime, timedelta
 import locale
+import logging
+import logging.handlers
 import os
+import queue
+import sys
 import requests
+from requests.adapters import HTTPAdapter
 import openpyxl
 from dotenv import load_dotenv
 import openai
 import re
 import json
+import random
+import argparse
+import atexit
+import gzip
+import select
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
+import threading
 import time # Importar a biblioteca time
+import contextvars
+import copy
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+try:
+    import orjson
+except ImportError: # opcional: sem ele o JSON usa a biblioteca padrão
+    orjson = None
 
 # Carregando variáveis de ambiente
 load_dotenv()
@@ -23,7 +48,56 @@ except:
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 AUTH_KEY = os.getenv("AUTH_KEY")
-EVOLUTION_API_URL = "https://1f27-45-169-217-33.ngrok-free.app"
+# Endereço e instância da Evolution API (em testes de carga, apontar para o evolution_stub.py)
+EVOLUTION_API_URL = os.getenv("EVOLUTION_API_URL", "http://127.0.0.1:8080").rstrip("/")
+EVOLUTION_INSTANCE = os.getenv("EVOLUTION_INSTANCE", "campointeligente")
+
+# Cliente HTTP da Evolution API: conexões keep-alive reaproveitadas (por processo) e timeouts
+EVOLUTION_HTTP_POOL_SIZE = int(os.getenv("EVOLUTION_HTTP_POOL_SIZE", 10))
+EVOLUTION_HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("EVOLUTION_HTTP_CONNECT_TIMEOUT_SECONDS", 3))
+EVOLUTION_HTTP_READ_TIMEOUT_SECONDS = float(os.getenv("EVOLUTION_HTTP_READ_TIMEOUT_SECONDS", 10))
+
+# Fila de envio das mensagens: threads em segundo plano (0 = envio síncrono no próprio webhook),
+# limite de mensagens pendentes e limites de taxa (mensagens/s e rajada) por número e por instância
+OUTBOUND_SENDER_THREADS = int(os.getenv("OUTBOUND_SENDER_THREADS", 4))
+OUTBOUND_QUEUE_MAX_PENDING = int(os.getenv("OUTBOUND_QUEUE_MAX_PENDING", 10000))
+# Com a fila de envio cheia, quem responde espera até este tempo por espaço (segura o processamento
+# de novos webhooks); se não abrir, a mensagem vai para a dead letter
+OUTBOUND_QUEUE_PUT_TIMEOUT_SECONDS = float(os.getenv("OUTBOUND_QUEUE_PUT_TIMEOUT_SECONDS", 10))
+OUTBOUND_NUMBER_RATE_PER_SECOND = float(os.getenv("OUTBOUND_NUMBER_RATE_PER_SECOND", 2))
+OUTBOUND_NUMBER_BURST = float(os.getenv("OUTBOUND_NUMBER_BURST", 3))
+OUTBOUND_INSTANCE_RATE_PER_SECOND = float(os.getenv("OUTBOUND_INSTANCE_RATE_PER_SECOND", 20))
+OUTBOUND_INSTANCE_BURST = float(os.getenv("OUTBOUND_INSTANCE_BURST", 20))
+OUTBOUND_DRAIN_TIMEOUT_SECONDS = float(os.getenv("OUTBOUND_DRAIN_TIMEOUT_SECONDS", 10))
+# Processamento dos webhooks em segundo plano: a rota só valida e enfileira o evento (por número) e
+# responde na hora; WEBHOOK_WORKER_THREADS threads processam a fila (0 = processa dentro da requisição)
+WEBHOOK_WORKER_THREADS = int(os.getenv("WEBHOOK_WORKER_THREADS", 8))
+WEBHOOK_QUEUE_MAX_PENDING = int(os.getenv("WEBHOOK_QUEUE_MAX_PENDING", 1000))
+WEBHOOK_LOCK_ATTEMPTS = int(os.getenv("WEBHOOK_LOCK_ATTEMPTS", 3))
+WEBHOOK_DRAIN_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT_SECONDS", 20))
+# Agrupamento de rajadas (opcional, 0 = desligado): textos do mesmo número que chegam com menos de
+# WEBHOOK_BURST_WINDOW_MS entre si viram uma única entrada (separados por espaço), segurando a
+# primeira mensagem no máximo WEBHOOK_BURST_MAX_HOLD_MS
+WEBHOOK_BURST_WINDOW_MS = float(os.getenv("WEBHOOK_BURST_WINDOW_MS", 0))
+WEBHOOK_BURST_MAX_HOLD_MS = float(os.getenv("WEBHOOK_BURST_MAX_HOLD_MS", 4 * WEBHOOK_BURST_WINDOW_MS))
+# Deduplicação dos eventos reenviados pela Evolution API (pelo id da mensagem do WhatsApp): conjunto
+# em memória com os ids recentes e tabela processed_webhook_events (mantida por WEBHOOK_DEDUP_TTL_SECONDS)
+WEBHOOK_DEDUP_TTL_SECONDS = float(os.getenv("WEBHOOK_DEDUP_TTL_SECONDS", 86400))
+WEBHOOK_DEDUP_MEMORY_SIZE = int(os.getenv("WEBHOOK_DEDUP_MEMORY_SIZE", 50000))
+# Novas tentativas de envio (backoff exponencial com jitter dentro de um orçamento de tempo) e
+# reenvio periódico das mensagens que ainda assim falharam (tabela outbound_dead_letters)
+OUTBOUND_RETRY_BUDGET_SECONDS = float(os.getenv("OUTBOUND_RETRY_BUDGET_SECONDS", 30))
+OUTBOUND_RETRY_BASE_DELAY_SECONDS = float(os.getenv("OUTBOUND_RETRY_BASE_DELAY_SECONDS", 0.5))
+OUTBOUND_RETRY_MAX_DELAY_SECONDS = float(os.getenv("OUTBOUND_RETRY_MAX_DELAY_SECONDS", 8))
+OUTBOUND_DEAD_LETTER_REPLAY_INTERVAL_SECONDS = float(os.getenv("OUTBOUND_DEAD_LETTER_REPLAY_INTERVAL_SECONDS", 60))
+OUTBOUND_DEAD_LETTER_REPLAY_BATCH_SIZE = int(os.getenv("OUTBOUND_DEAD_LETTER_REPLAY_BATCH_SIZE", 50))
+OUTBOUND_DEAD_LETTER_MAX_REPLAYS = int(os.getenv("OUTBOUND_DEAD_LETTER_MAX_REPLAYS", 20))
+# Tamanho máximo de uma mensagem de texto do WhatsApp (respostas seguidas são agrupadas até este limite)
+WHATSAPP_MAX_MESSAGE_LENGTH = int(os.getenv("WHATSAPP_MAX_MESSAGE_LENGTH", 4096))
+# Relatórios longos são enviados em páginas (quebradas entre registros) de até REPORT_PAGE_MAX_CHARS
+# caracteres; cada resposta leva no máximo REPORT_PAGES_PER_REPLY páginas e o resto vem com "mais"
+REPORT_PAGE_MAX_CHARS = min(int(os.getenv("REPORT_PAGE_MAX_CHARS", WHATSAPP_MAX_MESSAGE_LENGTH)), WHATSAPP_MAX_MESSAGE_LENGTH)
+REPORT_PAGES_PER_REPLY = max(int(os.getenv("REPORT_PAGES_PER_REPLY", 3)), 1)
 
 # Configurações do Banco de Dados PostgreSQL
 DB_NAME = os.getenv("DB_NAME")
@@ -32,16 +106,249 @@ DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_PORT = os.getenv("DB_PORT", 5432)
 
+# Dimensionamento do pool de conexões (por processo/worker do gunicorn). Cada mensagem em processamento
+# usa até 2 conexões (o lock da conversa e as leituras/gravações); somam-se as threads de envio (gravam
+# as mensagens que falharam), a varredura de contextos e o reenvio das mensagens que falharam. O
+# listener do cache (LISTEN) usa uma conexão própria, fora do pool.
+DB_POOL_REQUIRED_SIZE = 2 * (WEBHOOK_WORKER_THREADS or int(os.getenv("GUNICORN_THREADS", 4))) + OUTBOUND_SENDER_THREADS + 2
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", DB_POOL_REQUIRED_SIZE))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", 5))
+DB_POOL_HEALTHCHECK_IDLE_SECONDS = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE_SECONDS", 30))
+# Prepared statements do servidor para as consultas quentes (desligar com "0" atrás de um pgbouncer em modo transaction)
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "1") != "0"
+
+# Serialização das mensagens de um mesmo número entre os workers (advisory lock do PostgreSQL)
+CONVERSATION_ADVISORY_LOCKS = os.getenv("CONVERSATION_ADVISORY_LOCKS", "1") != "0"
+CONVERSATION_LOCK_TIMEOUT_SECONDS = float(os.getenv("CONVERSATION_LOCK_TIMEOUT_SECONDS", 30))
+CONVERSATION_LOCK_NAMESPACE = 1001
+
+# Varredura de conversas expiradas e arquivamento das inativas (intervalo 0 desativa)
+CONTEXT_SWEEP_INTERVAL_SECONDS = float(os.getenv("CONTEXT_SWEEP_INTERVAL_SECONDS", 60))
+CONTEXT_SWEEP_BATCH_SIZE = int(os.getenv("CONTEXT_SWEEP_BATCH_SIZE", 500))
+CONTEXT_SWEEP_MAX_BATCHES = int(os.getenv("CONTEXT_SWEEP_MAX_BATCHES", 20))
+CONTEXT_ARCHIVE_AFTER_DAYS = int(os.getenv("CONTEXT_ARCHIVE_AFTER_DAYS", 90))
+CONTEXT_SWEEPER_LOCK_NAMESPACE = 1002
+# Migração do esquema na subida (gunicorn.conf.py): um processo por vez aplica os comandos
+SCHEMA_MIGRATION_LOCK_NAMESPACE = 1003
+
+# Configurações do cache de contextos em memória (0 desativa)
+CONTEXT_CACHE_MAX_ENTRIES = int(os.getenv("CONTEXT_CACHE_MAX_ENTRIES", 1000))
+CONTEXT_CACHE_TTL_SECONDS = float(os.getenv("CONTEXT_CACHE_TTL_SECONDS", 300))
+
+# Exportação/importação em massa dos contextos (COPY): tamanho dos blocos enviados ao servidor e
+# quantas linhas cada transação da importação grava
+COPY_CHUNK_BYTES = int(os.getenv("COPY_CHUNK_BYTES", 1 << 20))
+COPY_IMPORT_BATCH_ROWS = int(os.getenv("COPY_IMPORT_BATCH_ROWS", 10000))
+
 # Tempo de inatividade da conversa em segundos (ex: 3 minutos)
 CONVERSATION_TIMEOUT_SECONDS = 180 # Alterado de 60 para 180 segundos (3 minutos)
 
+# Codificação JSON usada nos payloads do webhook, nas respostas da API e nos contextos gravados no
+# banco: "auto" (padrão) usa o orjson quando instalado, "orjson" exige ele e "json" força a biblioteca padrão
+JSON_CODEC = os.getenv("JSON_CODEC", "auto").lower()
+if JSON_CODEC not in ("auto", "orjson", "json"):
+    raise ValueError(f"JSON_CODEC inválido: {JSON_CODEC} (use auto, orjson ou json)")
+if JSON_CODEC == "orjson" and orjson is None:
+    raise RuntimeError("JSON_CODEC=orjson, mas o pacote orjson não está instalado.")
+USE_ORJSON = orjson is not None and JSON_CODEC != "json"
+
+
+# Função para serializar em JSON (texto). Valores que o orjson não aceita (ex: inteiros acima de 64
+# bits) caem na biblioteca padrão, que dá o mesmo resultado ou o mesmo erro de antes. Datas passam
+# pelo `default` (como na biblioteca padrão) em vez do formato ISO do orjson: o jsonify do Flask
+# continua gerando "Fri, 31 May 2024 12:00:00 GMT".
+def json_dumps(obj, sort_keys=False, default=None):
+    if USE_ORJSON:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        try:
+            return orjson.dumps(obj, default=default, option=option).decode()
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(obj, sort_keys=sort_keys, default=default)
+
+# Sequências de 19 dígitos ou mais podem ser inteiros fora dos 64 bits, que o orjson leria como float.
+# Para achá-las, cada dígito vira "0" e o resto vira espaço (bytes.translate, bem mais rápido que uma
+# expressão regular) e basta procurar 19 zeros seguidos.
+_DIGIT_RUN_TABLE = bytes(0x30 if 0x30 <= i <= 0x39 else 0x20 for i in range(256))
+_LARGE_INT_DIGITS = b"0" * 19
+
+# Função para ler JSON (aceita str ou bytes). Documentos com números muito longos vão para a
+# biblioteca padrão, que lê de volta exatamente o que json_dumps gravou.
+def json_loads(data):
+    if USE_ORJSON:
+        if isinstance(data, str):
+            data = data.encode()
+        if _LARGE_INT_DIGITS not in data.translate(_DIGIT_RUN_TABLE):
+            return orjson.loads(data)
+    return json.loads(data)
+
+
+# Provedor JSON do Flask com o mesmo codificador: request.json/get_json() e jsonify() passam por ele
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if not USE_ORJSON or kwargs.get("indent"):
+            return super().dumps(obj, **kwargs)
+        return json_dumps(obj, sort_keys=kwargs.get("sort_keys", self.sort_keys), default=kwargs.get("default", self.default))
+
+    def loads(self, s, **kwargs):
+        if not USE_ORJSON:
+            return super().loads(s, **kwargs)
+        return json_loads(s)
+
+
+# Colunas JSON/JSONB lidas do banco também são decodificadas pelo codificador escolhido
+psycopg2.extras.register_default_json(globally=True, loads=json_loads)
+psycopg2.extras.register_default_jsonb(globally=True, loads=json_loads)
+
+# Logs do bot: nível por LOG_LEVEL (DEBUG mostra o passo a passo de cada conversa, com os contextos
+# completos; no nível INFO essas chamadas não formatam nada). Quem loga só coloca o registro numa
+# fila; uma thread (QueueListener) escreve no stdout. Os logs de DEBUG podem ser amostrados e os
+# dados pessoais (CPF, RG, telefones, e-mail, ...) são mascarados antes de sair do processo.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower() # text ou json (uma linha JSON por registro)
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 1))
+LOG_REDACT_PII = os.getenv("LOG_REDACT_PII", "1") == "1"
+LOG_QUEUE_MAX_SIZE = int(os.getenv("LOG_QUEUE_MAX_SIZE", 10000))
+
+logger = logging.getLogger("chatbot")
+
+# Campos do contexto com dados pessoais: o valor some dos logs ('cpf': '***')
+PII_LOG_FIELDS = (
+    "nome_completo", "cpf", "rg", "data_nascimento", "telefone_contato", "email", "cep", "dap_caf", "caf",
+    "nome_propriedade", "comunidade_bairro", "ponto_referencia",
+)
+_PII_FIELD_PATTERN = re.compile(r"""(['"](?:%s)['"]\s*:\s*)(?:'[^']*'|"[^"]*"|[^,}\s]+)""" % "|".join(PII_LOG_FIELDS))
+_CPF_PATTERN = re.compile(r"\b\d{3}\.\d{3}\.\d{3}-\d{2}\b")
+_RG_PATTERN = re.compile(r"\b\d{1,2}\.\d{3}\.\d{3}-[\dXx]\b")
+# Telefones digitados com pontuação: (11) 98765-4321, 11 3456-7890, +55 11 98765-4321, 98765-4321
+_PHONE_PATTERN = re.compile(
+    r"(?:\+\d{2}\s?)?\(?\b\d{2}\)?\s?9?\d{4}-\d{4}\b"
+    r"|(?:\+\d{2}\s?)?\(\d{2}\)\s?9?\d{4}\s?\d{4}\b"
+    r"|\b9\d{4}-\d{4}\b"
+)
+# Telefones só com dígitos (inclusive nos remoteJid): 55 + DDD + 8 ou 9 dígitos, ou DDD + celular
+# (9 + 8 dígitos); ficam só os 4 últimos dígitos. Outros números (timestamps, IDs, quantidades)
+# continuam legíveis; RGs sem pontuação não têm formato fixo e dependem do campo 'rg'.
+_PHONE_DIGITS_PATTERN = re.compile(r"\b(?:55[1-9]{2}9?[2-9]\d{3}|[1-9]{2}9\d{4})(\d{4})\b")
+# CPFs sem pontuação (11 dígitos)
+_CPF_DIGITS_PATTERN = re.compile(r"\b\d{11}\b")
+_EMAIL_PATTERN = re.compile(r"\b[\w.+-]+@(?!s\.whatsapp\.net\b|g\.us\b)[\w-]+\.[\w.-]+\b")
+
+
+# Função para mascarar os dados pessoais de uma mensagem de log
+def redact_pii(message):
+    message = _PII_FIELD_PATTERN.sub(r"\1'***'", message)
+    message = _CPF_PATTERN.sub("***.***.***-**", message)
+    message = _RG_PATTERN.sub("**.***.***-*", message)
+    message = _PHONE_PATTERN.sub(lambda match: "*******" + match.group()[-4:], message)
+    message = _EMAIL_PATTERN.sub("***@***", message)
+    message = _PHONE_DIGITS_PATTERN.sub(r"*******\1", message)
+    return _CPF_DIGITS_PATTERN.sub("***********", message)
+
+
+# Filtro que deixa passar só uma fração (rate) dos registros de DEBUG; INFO em diante passam sempre
+class DebugSamplingFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+# Filtro que formata a mensagem (na thread de quem loga, antes de ir para a fila) já mascarada
+class PiiRedactionFilter(logging.Filter):
+    def filter(self, record):
+        try:
+            message = record.getMessage()
+        except Exception:
+            return True # o erro de formatação é tratado (e reportado) pelo próprio handler
+        record.msg = redact_pii(message)
+        record.args = None
+        return True
+
+
+# Formato JSON (uma linha por registro) para coletores de log
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json_dumps(entry)
+
+
+# QueueHandler que nunca bloqueia quem loga: com a fila cheia o registro é descartado (e contado)
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    dropped_total = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped_total += 1
+
+
+_log_queue_handler = None
+_log_listener = None
+
+
+# Função para montar a saída dos logs do processo. Depois de um fork o filho monta a sua (a thread
+# do QueueListener não passa para o processo filho).
+def setup_logging():
+    global _log_queue_handler, _log_listener
+    log_queue = queue.Queue(LOG_QUEUE_MAX_SIZE)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonLogFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(threadName)s] %(message)s"))
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    if LOG_DEBUG_SAMPLE_RATE < 1:
+        queue_handler.addFilter(DebugSamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+    if LOG_REDACT_PII:
+        queue_handler.addFilter(PiiRedactionFilter())
+    if _log_queue_handler is not None:
+        logger.removeHandler(_log_queue_handler)
+    logger.addHandler(queue_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    _log_queue_handler, _log_listener = queue_handler, listener
+
+
+# Função para escrever os logs que ainda estão na fila (no atexit: registrada antes das filas de
+# webhooks e de envio, roda depois delas)
+def stop_logging():
+    if _log_listener is not None and _log_listener._thread is not None:
+        _log_listener.stop()
+
+
+def get_logging_stats():
+    return {
+        "level": logging.getLevelName(logger.level),
+        "queued": _log_listener.queue.qsize() if _log_listener is not None else 0,
+        "dropped_total": NonBlockingQueueHandler.dropped_total,
+        "debug_sample_rate": LOG_DEBUG_SAMPLE_RATE,
+        "redact_pii": LOG_REDACT_PII,
+    }
+
+
+setup_logging()
+os.register_at_fork(after_in_child=setup_logging)
+atexit.register(stop_logging)
+
 # Inicializando a API do OpenAI
 openai.api_key = OPENAI_API_KEY
 app = Flask(__name__)
-
-# Dicionário para armazenar o contexto da conversa por número de telefone (em memória, para demonstração)
-# Para persistência real, usaremos o banco de dados.
-conversa_contextos = {}
+app.json = FastJSONProvider(app)
 
 # Definição das perguntas de cadastro e as chaves correspondentes no contexto
 REGISTRATION_QUESTIONS = {
@@ -83,6 +390,70 @@ MANDATORY_REGISTRATION_FIELDS = [
     "dap_caf", "tipo_producao", "producao_organica", "utiliza_irrigacao", "area_total_propriedade", "area_cultivada", "culturas_produzidas"
 ]
 
+# Bitmask com todos os campos obrigatórios respondidos
+REGISTRATION_COMPLETE_MASK = (1 << len(MANDATORY_REGISTRATION_FIELDS)) - 1
+
+# Valores padrão das flags de fluxo e dos dados temporários de cada fluxo. Flags com o valor padrão
+# não são gravadas no banco; ao carregar o contexto elas são preenchidas a partir daqui.
+CONVERSATION_STATE_DEFAULTS = {
+    "initial_greeting_step": None,
+    "registration_step": None,
+    "editing_registration": False,
+    "awaiting_field_to_edit": False,
+    "current_editing_field": None,
+    "awaiting_email_choice": False,
+    "email_choice_made": False,
+    "awaiting_email_value_input": False,
+    "awaiting_ponto_referencia_choice": False,
+    "ponto_referencia_choice_made": False,
+    "awaiting_ponto_referencia_value_input": False,
+    "awaiting_continuation_choice": False,
+    "awaiting_post_completion_response": False,
+    "awaiting_weather_follow_up_choice": False,
+    "awaiting_menu_return_prompt": False,
+    "awaiting_weather_location": False,
+    "simulacao_safra_ativa": False,
+    "etapa_simulacao": None,
+    "dados_simulacao": {},
+    "awaiting_safra_finalizacao": False,
+    "simulacao_sub_fluxo": None,
+    "gerar_relatorio_simulacao_ativo": False,
+    "gestao_rebanho_ativo": False,
+    "gestao_rebanho_sub_fluxo": None,
+    "gerar_relatorio_rebanho_ativo": False,
+    "vacinacao_vermifugacao_ativo": False,
+    "vacinacao_vermifugacao_opcao": None,
+    "registro_vacinacao_etapa": None,
+    "dados_vacinacao_registro": {},
+    "consulta_vacinacao_ativa": False,
+    "awaiting_animal_id_consulta_vac": False,
+    "registro_vermifugacao_etapa": None,
+    "dados_vermifugacao_registro": {},
+    "consulta_vermifugacao_ativa": False,
+    "awaiting_animal_id_consulta_verm": False,
+    # O fluxo grava "lembretes_vacinacao_ativa" mas lê "lembretes_vacinacao_ativo"; as duas têm padrão
+    "lembretes_vacinacao_ativa": False,
+    "lembretes_vacinacao_ativo": False,
+    "awaiting_lembretes_contato": False,
+    "cadastro_animal_ativo": False,
+    "registro_animal_etapa": None,
+    "dados_animal_registro": {},
+    "controle_reprodutivo_ativo": False,
+    "historico_pesagens_ativo": False,
+    "controle_estoque_ativo": False,
+    "controle_estoque_sub_fluxo": None,
+    "gerar_relatorio_estoque_ativo": False,
+    "registro_entrada_estoque_ativo": False,
+    "registro_entrada_estoque_etapa": None,
+    "dados_entrada_estoque_registro": {},
+    "registro_saida_estoque_ativo": False,
+    "registro_saida_estoque_etapa": None,
+    "dados_saida_estoque_registro": {},
+    "consulta_estoque_ativa": False,
+    # Relatório paginado com páginas ainda não enviadas: {"tipo": ..., "pagina": ...}
+    "relatorio_continuacao": None,
+}
+
 # Mapeamento de termos do usuário para chaves de campo para edição
 EDITABLE_FIELDS_MAP = {
     "nome": "nome_completo",
@@ -118,97 +489,1382 @@ EDITABLE_FIELDS_MAP = {
 }
 
 
-# Função para obter conexão com o banco de dados PostgreSQL
+# Conexão que lembra quais prepared statements já foram preparados na sessão do servidor
+class PreparedStatementConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+
+# Pool de conexões PostgreSQL compartilhado pelo processo.
+# Cada worker do gunicorn cria o seu próprio pool na primeira utilização (o pool
+# herdado do processo pai após um fork é descartado sem fechar os sockets dele).
+class DatabaseConnectionPool:
+    def __init__(self, minconn, maxconn, timeout, healthcheck_idle_seconds, **connect_kwargs):
+        self._connect_kwargs = connect_kwargs
+        self._idle = deque() # (conexão, instante em que foi devolvida)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._timeout = timeout
+        self._healthcheck_idle_seconds = healthcheck_idle_seconds
+        self._recent_checkouts = deque()
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts_total = 0
+        self.connects_total = 0
+        self.timeouts_total = 0
+        self.discarded_total = 0
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(connection_factory=PreparedStatementConnection, **self._connect_kwargs)
+        with self._lock:
+            self.connects_total += 1
+        return conn
+
+    def getconn(self):
+        with self._lock:
+            self.waiting += 1
+        acquired = self._slots.acquire(timeout=self._timeout)
+        with self._lock:
+            self.waiting -= 1
+            if not acquired:
+                self.timeouts_total += 1
+        if not acquired:
+            raise psycopg2.pool.PoolError(f"Nenhuma conexão livre no pool após {self._timeout}s.")
+        try:
+            conn = self._checkout_healthy()
+        except Exception:
+            self._slots.release()
+            raise
+        now = time.monotonic()
+        with self._lock:
+            self.in_use += 1
+            self.checkouts_total += 1
+            self._recent_checkouts.append(now)
+            self._prune_recent_checkouts(now)
+        return conn
+
+    # Só o último minuto interessa para a taxa de checkouts (chamado com o lock seguro)
+    def _prune_recent_checkouts(self, now):
+        while self._recent_checkouts and now - self._recent_checkouts[0] > 60:
+            self._recent_checkouts.popleft()
+
+    # Entrega uma conexão válida: conexões fechadas são descartadas e as que ficaram
+    # ociosas por muito tempo recebem um "SELECT 1" antes de voltar ao uso.
+    def _checkout_healthy(self):
+        while True:
+            with self._lock:
+                item = self._idle.pop() if self._idle else None
+            if item is None:
+                return self._connect()
+            conn, idle_since = item
+            if conn.closed:
+                self._discard(conn)
+                continue
+            if time.monotonic() - idle_since > self._healthcheck_idle_seconds:
+                try:
+                    cur = conn.cursor()
+                    cur.execute("SELECT 1;")
+                    cur.close()
+                    conn.rollback()
+                except psycopg2.Error:
+                    self._discard(conn)
+                    continue
+            return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self.discarded_total += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def putconn(self, conn, close=False):
+        try:
+            if not close and not conn.closed and conn.status != psycopg2.extensions.STATUS_READY:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+            if close or conn.closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            self._prune_recent_checkouts(now)
+            return {
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "in_use": self.in_use,
+                "idle": len(self._idle),
+                "waiting": self.waiting,
+                "checkouts_total": self.checkouts_total,
+                "checkouts_per_second": round(len(self._recent_checkouts) / 60, 3),
+                "connects_total": self.connects_total,
+                "timeouts_total": self.timeouts_total,
+                "discarded_total": self.discarded_total,
+            }
+
+
+_db_pool = None
+_db_pool_pid = None
+_db_pool_lock = threading.Lock()
+
+
+def _reset_db_pool_after_fork():
+    global _db_pool, _db_pool_pid, _db_pool_lock
+    # As conexões pertencem ao processo pai; fechá-las aqui derrubaria as dele.
+    _db_pool = None
+    _db_pool_pid = None
+    _db_pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_db_pool_after_fork)
+
+
+# Função com os parâmetros de conexão ao PostgreSQL
+def db_connect_kwargs():
+    return {"database": DB_NAME, "user": DB_USER, "password": DB_PASSWORD, "host": DB_HOST, "port": DB_PORT}
+
+
+# Função para obter (ou criar) o pool de conexões deste processo
+def get_db_pool():
+    global _db_pool, _db_pool_pid
+    if _db_pool is not None and _db_pool_pid == os.getpid():
+        return _db_pool
+    with _db_pool_lock:
+        if _db_pool is None or _db_pool_pid != os.getpid():
+            logger.info("DB_POOL: Criando pool de conexões (min=%s, max=%s) com: Host=%s, Port=%s, Database=%s, User=%s", DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_HOST, DB_PORT, DB_NAME, DB_USER)
+            if DB_POOL_MAX_SIZE < DB_POOL_REQUIRED_SIZE:
+                logger.warning("DB_POOL: DB_POOL_MAX_SIZE=%s é menor que o necessário para as threads deste processo (%s); mensagens podem esperar por conexão.", DB_POOL_MAX_SIZE, DB_POOL_REQUIRED_SIZE)
+            _db_pool = DatabaseConnectionPool(
+                DB_POOL_MIN_SIZE,
+                DB_POOL_MAX_SIZE,
+                DB_POOL_TIMEOUT_SECONDS,
+                DB_POOL_HEALTHCHECK_IDLE_SECONDS,
+                **db_connect_kwargs()
+            )
+            _db_pool_pid = os.getpid()
+    return _db_pool
+
+
+# Banco indisponível durante o processamento de uma mensagem (sem conexão livre no pool ou erro na
+# consulta): o evento é tentado de novo em vez de seguir com um contexto vazio
+class DatabaseUnavailableError(Exception):
+    pass
+
+
+# Função para obter conexão com o banco de dados PostgreSQL (emprestada do pool)
 def get_db_connection():
-    conn = None
     try:
-        print(f"DEBUG_DB_CONNECT: Tentando conectar ao PostgreSQL com: Host={DB_HOST}, Port={DB_PORT}, Database={DB_NAME}, User={DB_USER}")
-        conn = psycopg2.connect(
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT
-        )
-        print("DEBUG_DB_CONNECT: Conexão ao PostgreSQL estabelecida com sucesso.")
-        return conn
-    except psycopg2.Error as e:
-        print(f"DEBUG_DB_CONNECT_ERROR: Erro ao conectar ao banco de dados PostgreSQL: {e}")
+        return get_db_pool().getconn()
+    except (psycopg2.Error, psycopg2.pool.PoolError) as e:
+        logger.error("DB_CONNECT_ERROR: Erro ao obter conexão do pool PostgreSQL: %s", e)
         return None
 
-# Função para inicializar a tabela de contexto de conversas no banco de dados
+
+# Função para devolver ao pool uma conexão obtida com get_db_connection()
+def release_db_connection(conn, close=False):
+    pool = _db_pool
+    if pool is None or _db_pool_pid != os.getpid():
+        conn.close()
+        return
+    pool.putconn(conn, close=close)
+
+
+# Função para obter as estatísticas do pool de conexões (para dimensionamento)
+def get_db_pool_stats():
+    if _db_pool is None or _db_pool_pid != os.getpid():
+        return {"min_size": DB_POOL_MIN_SIZE, "max_size": DB_POOL_MAX_SIZE, "inicializado": False}
+    return _db_pool.stats()
+
+
+# Função para trocar os placeholders do psycopg2 (%s) pelos numerados do servidor ($1, $2, ...)
+def numbered_placeholders(sql):
+    counter = iter(range(1, sql.count("%s") + 1))
+    return re.sub(r"%s", lambda match: f"${next(counter)}", sql)
+
+
+# Consulta preparada uma vez por conexão do pool (PREPARE junto da primeira execução, depois só
+# EXECUTE). O texto do PREPARE/EXECUTE é montado uma vez, na importação do módulo.
+class PreparedStatement:
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        self.prepare_sql = f"PREPARE {name} AS {numbered_placeholders(sql).rstrip().rstrip(';')};"
+        param_count = sql.count("%s")
+        self.execute_sql = f"EXECUTE {name}" + (f" ({', '.join(['%s'] * param_count)});" if param_count else ";")
+
+    def execute(self, cur, params):
+        execute_prepared(cur, (self, params))
+
+
+# Função para executar uma ou mais consultas preparadas num único round trip (o cursor fica com o
+# resultado da última). Conexões fora do pool ou DB_PREPARED_STATEMENTS=0 usam o SQL direto.
+def execute_prepared(cur, *calls):
+    params = [value for _, call_params in calls for value in call_params]
+    conn = cur.connection
+    prepared = getattr(conn, "prepared_statements", None)
+    if not DB_PREPARED_STATEMENTS or prepared is None:
+        cur.execute(" ".join(statement.sql for statement, _ in calls), params)
+        return
+    first_in_transaction = conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    try:
+        _prepare_and_execute(cur, prepared, calls, params)
+    except (psycopg2.errors.InvalidSqlStatementName, psycopg2.errors.DuplicatePreparedStatement) as e:
+        # O conjunto local não bate com a sessão (DISCARD ALL, pooler externo, PREPARE que falhou...).
+        # Só dá para repetir se nada mais foi feito na transação que acabou de abortar.
+        prepared.clear()
+        if not first_in_transaction:
+            raise
+        conn.rollback()
+        logger.info("DB_PREPARED: Prepared statements fora de sincronia com a sessão (%s); sincronizando.", e.pgcode)
+        cur.execute("SELECT name FROM pg_prepared_statements;")
+        prepared.update(row[0] for row in cur.fetchall())
+        conn.rollback()
+        _prepare_and_execute(cur, prepared, calls, params)
+
+
+def _prepare_and_execute(cur, prepared, calls, params):
+    missing = list(dict.fromkeys(statement for statement, _ in calls if statement.name not in prepared))
+    # O PREPARE não é desfeito por rollback: vale mesmo se um comando seguinte do lote falhar
+    prepared.update(statement.name for statement in missing)
+    cur.execute(" ".join([statement.prepare_sql for statement in missing] + [statement.execute_sql for statement, _ in calls]), params)
+
+
+# Tabelas dos registros de cada produtor (estoque, rebanho, simulações). Cada lista que antes
+# ficava dentro do JSONB do contexto tem sua tabela, com a coluna usada nas buscas (animal ou item)
+# e a data do registro convertida para DATE quando informada no formato dd/mm/aaaa.
+FARMER_RECORD_TABLES = {
+    "registros_estoque": {"table": "stock_records", "key_column": "item_name", "key_field": "nome_item", "date_field": "data_entrada"},
+    "registros_vacinacao": {"table": "vaccination_records", "key_column": "animal_id", "key_field": "animal_id", "date_field": "data_vacinacao"},
+    "registros_vermifugacao": {"table": "deworming_records", "key_column": "animal_id", "key_field": "animal_id", "date_field": "data_vermifugacao"},
+    "registros_animais": {"table": "animal_records", "key_column": "animal_id", "key_field": "animal_id", "date_field": None},
+    "registros_reprodutivos": {"table": "reproductive_records", "key_column": "animal_id", "key_field": "animal_id", "date_field": "data_registro"},
+    "historico_pesagens": {"table": "weighing_records", "key_column": "animal_id", "key_field": "animal_id", "date_field": "data_pesagem"},
+    "simulacoes_passadas": {"table": "crop_simulations", "key_column": "crop", "key_field": "cultura", "date_field": None},
+}
+
+# Expressão SQL da bitmask de cadastro (mesma regra de registration_fields_mask), montada uma vez
+REGISTRATION_MASK_SQL = " | ".join(
+    f"(CASE WHEN context->>'{field}' IS NOT NULL THEN {1 << bit} ELSE 0 END)"
+    for bit, field in enumerate(MANDATORY_REGISTRATION_FIELDS)
+)
+
+# Função para montar os comandos DDL/backfill do esquema como pares (sql, parâmetros).
+# Compartilhada entre init_db (psycopg2) e a variante assíncrona (chatbot_async_db.init_db).
+def schema_statements():
+    statements = [
+        ("""
+            CREATE TABLE IF NOT EXISTS conversation_contexts (
+                phone_number VARCHAR(255) PRIMARY KEY,
+                context JSONB,
+                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """, ()),
+        # Versão da linha, incrementada a cada gravação (compare-and-swap do cache de contextos)
+        ("ALTER TABLE conversation_contexts ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;", ()),
+        # Status de cadastro materializado: bitmask dos campos obrigatórios respondidos (bit i =
+        # MANDATORY_REGISTRATION_FIELDS[i]) e se todos foram respondidos. Mantidos a cada gravação.
+        ("""
+            ALTER TABLE conversation_contexts
+                ADD COLUMN IF NOT EXISTS registration_fields_mask INTEGER,
+                ADD COLUMN IF NOT EXISTS registration_complete BOOLEAN NOT NULL DEFAULT FALSE;
+        """, ()),
+    ]
+    statements += [
+        (f"""
+            UPDATE conversation_contexts
+            SET registration_fields_mask = {REGISTRATION_MASK_SQL},
+                registration_complete = ({REGISTRATION_MASK_SQL}) = %s
+            WHERE registration_fields_mask IS NULL;
+        """, (REGISTRATION_COMPLETE_MASK,)),
+        # Se o contexto tem algum estado de fluxo gravado (usado pela varredura de conversas expiradas)
+        ("ALTER TABLE conversation_contexts ADD COLUMN IF NOT EXISTS flow_state_active BOOLEAN;", ()),
+        (
+            "UPDATE conversation_contexts SET flow_state_active = COALESCE(context ?| %s::text[], FALSE) WHERE flow_state_active IS NULL;",
+            (list(CONVERSATION_STATE_DEFAULTS),)
+        ),
+        ("CREATE INDEX IF NOT EXISTS conversation_contexts_last_updated_idx ON conversation_contexts (last_updated);", ()),
+        ("""
+            CREATE INDEX IF NOT EXISTS conversation_contexts_active_flow_idx
+            ON conversation_contexts (last_updated)
+            WHERE flow_state_active;
+        """, ()),
+        ("""
+            CREATE TABLE IF NOT EXISTS conversation_contexts_archive (
+                phone_number VARCHAR(255) PRIMARY KEY,
+                context JSONB,
+                last_updated TIMESTAMP,
+                registration_fields_mask INTEGER,
+                registration_complete BOOLEAN NOT NULL DEFAULT FALSE,
+                version BIGINT NOT NULL DEFAULT 0,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """, ()),
+        ("""
+            CREATE INDEX IF NOT EXISTS conversation_contexts_registered_municipio_idx
+            ON conversation_contexts (lower(context->>'municipio'))
+            WHERE registration_complete;
+        """, ()),
+    ]
+    statements += [
+        # Ids das mensagens recebidas já processadas (ignora os reenvios do mesmo evento)
+        ("""
+            CREATE TABLE IF NOT EXISTS processed_webhook_events (
+                event_id VARCHAR(255) PRIMARY KEY,
+                phone_number VARCHAR(255),
+                processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """, ()),
+        ("CREATE INDEX IF NOT EXISTS processed_webhook_events_processed_at_idx ON processed_webhook_events (processed_at);", ()),
+        # Mensagens que não puderam ser enviadas mesmo após as novas tentativas (reenviadas em segundo plano)
+        ("""
+            CREATE TABLE IF NOT EXISTS outbound_dead_letters (
+                id BIGSERIAL PRIMARY KEY,
+                phone_number VARCHAR(255) NOT NULL,
+                instance VARCHAR(255) NOT NULL,
+                message TEXT NOT NULL,
+                last_status INTEGER,
+                last_error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                replays INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                replay_after TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """, ()),
+        ("CREATE INDEX IF NOT EXISTS outbound_dead_letters_replay_idx ON outbound_dead_letters (replay_after);", ()),
+    ]
+    for spec in FARMER_RECORD_TABLES.values():
+        table, key_column = spec["table"], spec["key_column"]
+        statements += [
+            (f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id BIGSERIAL PRIMARY KEY,
+                    phone_number VARCHAR(255) NOT NULL,
+                    {key_column} TEXT,
+                    record_date DATE,
+                    record JSONB NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """, ()),
+            (f"CREATE INDEX IF NOT EXISTS {table}_phone_idx ON {table} (phone_number, id);", ()),
+            (f"CREATE INDEX IF NOT EXISTS {table}_{key_column}_idx ON {table} (phone_number, lower({key_column}));", ()),
+            (f"CREATE INDEX IF NOT EXISTS {table}_date_idx ON {table} (phone_number, record_date);", ()),
+        ]
+    return statements
+
+# Função para inicializar a tabela de contexto de conversas no banco de dados (idempotente: também
+# atualiza um banco antigo com as colunas, tabelas e índices novos). Devolve True se deu certo.
 def init_db():
     conn = get_db_connection()
     if conn:
         try:
             cur = conn.cursor()
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS conversation_contexts (
-                    phone_number VARCHAR(255) PRIMARY KEY,
-                    context JSONB,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
+            # Vários contêineres subindo juntos: um aplica o esquema e os outros esperam na fila
+            cur.execute("SELECT pg_advisory_xact_lock(%s, 0);", (SCHEMA_MIGRATION_LOCK_NAMESPACE,))
+            for sql, params in schema_statements():
+                cur.execute(sql, params or None)
             conn.commit()
             cur.close()
-            print("DEBUG_DB_INIT: Tabela 'conversation_contexts' verificada/criada com sucesso.")
+            logger.info("DB_INIT: Tabela 'conversation_contexts' e tabelas de registros verificadas/criadas com sucesso.")
+            return True
         except psycopg2.Error as e:
-            print(f"DEBUG_DB_INIT_ERROR: Erro ao inicializar o banco de dados: {e}")
+            logger.error("DB_INIT_ERROR: Erro ao inicializar o banco de dados: %s", e)
         finally:
             if conn:
+                release_db_connection(conn)
+    return False
+
+# Colunas de conversation_contexts levadas pela exportação/importação (formato texto do COPY,
+# uma linha por contexto; arquivos terminados em .gz são comprimidos)
+CONTEXT_COPY_COLUMNS = [
+    "phone_number", "context", "last_updated", "registration_fields_mask",
+    "registration_complete", "flow_state_active", "version",
+]
+
+# Campos do contexto trocados por dígitos pseudoaleatórios na exportação anonimizada (campo -> dígitos)
+ANONYMIZED_CONTEXT_FIELDS = {"cpf": 11, "rg": 9, "telefone_contato": 11}
+
+
+# Função para montar a expressão SQL que troca um valor por N dígitos derivados do md5 dele
+# (determinística: o mesmo número vira sempre o mesmo pseudônimo, em qualquer tabela)
+def _anonymized_digits_sql(expression, digits):
+    return f"lpad(((('x' || substr(md5({expression}), 1, 15))::bit(60)::bigint) % {10 ** digits})::text, {digits}, '0')"
+
+
+# Função para montar o SELECT da exportação (com ou sem anonimização de CPF, RG e telefones)
+def _context_export_query(anonymize):
+    if not anonymize:
+        return f"SELECT {', '.join(CONTEXT_COPY_COLUMNS)} FROM conversation_contexts"
+    anonymized_fields = []
+    for field, digits in ANONYMIZED_CONTEXT_FIELDS.items():
+        value = f"context->>'{field}'"
+        anonymized_fields.append(f"'{field}', CASE WHEN {value} IS NOT NULL THEN {_anonymized_digits_sql(value, digits)} END")
+    columns = {
+        # phone_number é a chave da importação: o pseudônimo é a posição da linha na ordem do md5 do
+        # número (sem colisões, que fariam dois agricultores virarem um só) e mantém o sufixo do
+        # WhatsApp (@s.whatsapp.net) para o número continuar no mesmo formato
+        "phone_number": "'55' || lpad((row_number() OVER (ORDER BY md5(phone_number), phone_number))::text, 11, '0')"
+                        " || COALESCE(substring(phone_number from '@.*$'), '')",
+        "context": f"context || jsonb_strip_nulls(jsonb_build_object({', '.join(anonymized_fields)}))",
+    }
+    return f"SELECT {', '.join(columns.get(column, column) for column in CONTEXT_COPY_COLUMNS)} FROM conversation_contexts"
+
+
+# Função para abrir o arquivo da exportação/importação (gzip quando termina em .gz)
+def _open_copy_file(path, mode):
+    return gzip.open(path, mode, compresslevel=6) if path.endswith(".gz") else open(path, mode)
+
+
+# Função para exportar conversation_contexts com COPY, em streaming (memória constante)
+def export_conversation_contexts(path, anonymize=False):
+    conn = get_db_connection()
+    if not conn:
+        raise Exception("Falha na conexão com o banco de dados ao tentar exportar os contextos.")
+    started = time.monotonic()
+    try:
+        cur = conn.cursor()
+        with _open_copy_file(path, "wb") as output:
+            cur.copy_expert(f"COPY ({_context_export_query(anonymize)}) TO STDOUT;", output, size=COPY_CHUNK_BYTES)
+        rows = cur.rowcount
+        conn.commit()
+        cur.close()
+    finally:
+        release_db_connection(conn)
+    logger.info("DB_EXPORT: %s contextos exportados para %s em %.1fs (anonimizado: %s).", rows, path, time.monotonic() - started, anonymize)
+    return rows
+
+
+# Leitor que entrega ao COPY no máximo max_rows linhas do arquivo, em blocos do tamanho pedido
+# pelo psycopg2 (o formato texto do COPY tem exatamente uma linha por registro)
+class _CopyBatchReader:
+    def __init__(self, source, max_rows):
+        self.source = source
+        self.remaining = max_rows
+        self.rows = 0
+        self.exhausted = False
+
+    def read(self, size=-1):
+        lines = []
+        length = 0
+        while self.remaining > 0 and (size < 0 or length < size):
+            line = self.source.readline()
+            if not line:
+                self.exhausted = True
+                break
+            lines.append(line)
+            length += len(line)
+            self.remaining -= 1
+            self.rows += 1
+        return b"".join(lines)
+
+
+# Função para importar um arquivo gerado por export_conversation_contexts. Cada lote de linhas vai
+# por COPY para uma tabela temporária e é mesclado em conversation_contexts numa transação; linhas
+# que já existem são substituídas e ganham uma versão nova (invalida caches e gravações em curso)
+# e cada número gravado é anunciado no canal de invalidação dos caches.
+def import_conversation_contexts(path, batch_rows=COPY_IMPORT_BATCH_ROWS):
+    columns = ", ".join(CONTEXT_COPY_COLUMNS)
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in CONTEXT_COPY_COLUMNS if column not in ("phone_number", "version"))
+    conn = get_db_connection()
+    if not conn:
+        raise Exception("Falha na conexão com o banco de dados ao tentar importar os contextos.")
+    started = time.monotonic()
+    imported = 0
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS conversation_contexts_import
+            (LIKE conversation_contexts INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;
+        """)
+        conn.commit()
+        with _open_copy_file(path, "rb") as source:
+            while True:
+                reader = _CopyBatchReader(source, batch_rows)
+                cur.copy_expert(f"COPY conversation_contexts_import ({columns}) FROM STDIN;", reader, size=COPY_CHUNK_BYTES)
+                if reader.rows:
+                    # Avisa os outros workers de cada linha gravada, como nas gravações normais, para
+                    # que os caches descartem os contextos antigos dos números importados
+                    cur.execute(f"""
+                        WITH merged AS (
+                            INSERT INTO conversation_contexts ({columns})
+                            SELECT {columns} FROM conversation_contexts_import
+                            ON CONFLICT (phone_number) DO UPDATE
+                            SET {updates},
+                                version = GREATEST(conversation_contexts.version + 1, EXCLUDED.version)
+                            RETURNING phone_number, version
+                        )
+                        SELECT count(pg_notify('{CONTEXT_CHANGED_CHANNEL}', phone_number || ':' || version)) FROM merged;
+                    """)
+                    imported += reader.rows
+                conn.commit()
+                logger.info("DB_IMPORT: %s contextos importados de %s...", imported, path)
+                if reader.exhausted or not reader.rows:
+                    break
+        cur.execute("DROP TABLE IF EXISTS conversation_contexts_import;")
+        conn.commit()
+        cur.close()
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+    logger.info("DB_IMPORT: %s contextos importados de %s em %.1fs.", imported, path, time.monotonic() - started)
+    return imported
+
+# Cache em memória (por processo) dos contextos de conversa: LRU com limite de entradas e TTL.
+# Cada entrada guarda a versão da linha; as gravações são compare-and-swap pela versão, e um
+# LISTEN/NOTIFY invalida as entradas quando outro worker grava uma versão mais nova.
+CONTEXT_CHANGED_CHANNEL = "conversation_context_changed"
+
+
+class StaleContextError(Exception):
+    pass
+
+
+class ConversationContextCache:
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = max_entries > 0 and ttl_seconds > 0
+        self.listening = False
+        self.listener_pid = None
+        self._entries = OrderedDict() # telefone -> (contexto, versão, expira_em)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # Devolve (snapshot do contexto, versão) ou None; o snapshot não deve ser alterado por quem chamou.
+    # Sem o listener ativo o cache não é usado, pois não haveria como saber de gravações de outros workers.
+    def get(self, phone_number):
+        if not self.enabled or not self.listening:
+            return None
+        with self._lock:
+            entry = self._entries.get(phone_number)
+            if entry is None or entry[2] < time.monotonic():
+                if entry is not None:
+                    del self._entries[phone_number]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(phone_number)
+            self.hits += 1
+            context, version, _ = entry
+        return context, version
+
+    # O contexto passado passa a pertencer ao cache e não deve mais ser alterado por quem chamou
+    def put(self, phone_number, context, version):
+        if not self.enabled or not self.listening:
+            return
+        with self._lock:
+            current = self._entries.get(phone_number)
+            if current is not None and current[1] > version:
+                return
+            self._entries[phone_number] = (context, version, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(phone_number)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # Descarta a entrada se ela não estiver na versão atual da linha (None: a linha não existe)
+    def validate(self, phone_number, version):
+        with self._lock:
+            entry = self._entries.get(phone_number)
+            if entry is not None and entry[1] != version:
+                del self._entries[phone_number]
+                self.invalidations += 1
+
+    # Remove a entrada (ou só se ela for mais antiga que a versão informada)
+    def invalidate(self, phone_number, version=None):
+        with self._lock:
+            entry = self._entries.get(phone_number)
+            if entry is not None and (version is None or entry[1] < version):
+                del self._entries[phone_number]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def reset_after_fork(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.listening = False
+        self.listener_pid = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "listening": self.listening,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+conversa_contextos = ConversationContextCache(CONTEXT_CACHE_MAX_ENTRIES, CONTEXT_CACHE_TTL_SECONDS)
+os.register_at_fork(after_in_child=conversa_contextos.reset_after_fork)
+
+
+# Função executada em thread própria: escuta as gravações de contexto de todos os workers
+def _context_cache_listener_loop(cache):
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(**db_connect_kwargs())
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {CONTEXT_CHANGED_CHANNEL};")
+            cache.clear()
+            cache.listening = True
+            logger.debug("CONTEXT_CACHE: Escutando '%s' (pid %s).", CONTEXT_CHANGED_CHANNEL, os.getpid())
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    phone_number, _, version = notify.payload.rpartition(":")
+                    cache.invalidate(phone_number, int(version))
+        except Exception as e:
+            cache.listening = False
+            cache.clear()
+            logger.error("CONTEXT_CACHE_ERROR: Listener de invalidação caiu, cache desativado até reconectar: %s", e)
+            time.sleep(5)
+        finally:
+            if conn is not None:
                 conn.close()
 
-# Função para carregar o contexto da conversa do banco de dados
+# Função para garantir que o listener de invalidação do cache está rodando neste processo
+def _ensure_context_cache_listener():
+    cache = conversa_contextos
+    if not cache.enabled or cache.listener_pid == os.getpid():
+        return
+    with _db_pool_lock:
+        if cache.listener_pid != os.getpid():
+            cache.listener_pid = os.getpid()
+            threading.Thread(target=_context_cache_listener_loop, args=(cache,), name="context-cache-listener", daemon=True).start()
+
+# Consultas do caminho quente do contexto, montadas uma vez (também usadas por chatbot_async_db)
+LOAD_CONTEXT_SQL = "SELECT context, version FROM conversation_contexts WHERE phone_number = %s;"
+LOAD_CONTEXT_STATEMENT = PreparedStatement("load_context", LOAD_CONTEXT_SQL)
+
+# Função para carregar o contexto da conversa (do cache quando possível, senão do banco de dados)
 def load_conversation_context(phone_number):
+    uow = _context_unit_of_work.get()
+    _ensure_context_cache_listener()
+    _ensure_context_sweeper()
+    _ensure_dead_letter_replayer()
+    cached = conversa_contextos.get(phone_number)
+    if cached is not None:
+        snapshot, version = cached
+        logger.debug("DB_LOAD: Contexto de %s servido do cache (versão %s): %s", phone_number, version, snapshot)
+        if uow is not None:
+            uow.track_load(phone_number, snapshot, version)
+        return copy.deepcopy(snapshot)
     conn = get_db_connection()
     if conn:
         try:
             cur = conn.cursor()
-            cur.execute("SELECT context FROM conversation_contexts WHERE phone_number = %s;", (phone_number,))
+            LOAD_CONTEXT_STATEMENT.execute(cur, (phone_number,))
             result = cur.fetchone()
-            cur.close()
+            if result is None:
+                result = _restore_archived_context(cur, phone_number)
+                conn.commit()
             if result:
-                loaded_context = result[0]
-                print(f"DEBUG_DB_LOAD: Contexto carregado do DB para {phone_number}: {loaded_context}")
+                loaded_context, version = result
+                loaded_context = loaded_context or {}
+                if is_legacy_context(loaded_context):
+                    migrated_version = _migrate_legacy_context(cur, phone_number, loaded_context)
+                    if migrated_version is not None:
+                        version = migrated_version
+                    conn.commit()
+                cur.close()
+                expand_conversation_state(loaded_context)
+                logger.debug("DB_LOAD: Contexto carregado do DB para %s: %s", phone_number, loaded_context)
+                snapshot = copy.deepcopy(loaded_context)
+                conversa_contextos.put(phone_number, snapshot, version)
+                if uow is not None:
+                    uow.track_load(phone_number, snapshot, version)
                 return loaded_context
-            print(f"DEBUG_DB_LOAD: Nenhum contexto encontrado no DB para {phone_number}. Retornando vazio.")
-            return {}
+            cur.close()
+            logger.debug("DB_LOAD: Nenhum contexto encontrado no DB para %s. Retornando vazio.", phone_number)
+            return expand_conversation_state({})
         except psycopg2.Error as e:
-            print(f"DEBUG_DB_LOAD_ERROR: Erro ao carregar contexto da conversa do banco de dados para {phone_number}: {e}")
-            return {}
+            logger.error("DB_LOAD_ERROR: Erro ao carregar contexto da conversa do banco de dados para %s: %s", phone_number, e)
+            raise DatabaseUnavailableError(f"Erro ao carregar o contexto de {phone_number}: {e}") from e
         finally:
             if conn:
-                conn.close()
-    print(f"DEBUG_DB_LOAD_ERROR: Conexão ao DB falhou ao carregar contexto para {phone_number}.")
-    return {}
+                release_db_connection(conn)
+    logger.error("DB_LOAD_ERROR: Conexão ao DB falhou ao carregar contexto para %s.", phone_number)
+    raise DatabaseUnavailableError(f"Sem conexão com o banco de dados para carregar o contexto de {phone_number}.")
+
+# Varredura em segundo plano de conversation_contexts: limpa o estado dos fluxos das conversas
+# que passaram do timeout (o mesmo reset que o webhook faria na próxima mensagem) e move para
+# conversation_contexts_archive as conversas inativas há muito tempo, sempre em lotes limitados.
+# Só um processo do cluster varre por vez (advisory lock); os demais pulam a rodada.
+class ContextSweeperStats:
+    def __init__(self):
+        self.runs = 0
+        self.skipped_runs = 0
+        self.reset_total = 0
+        self.archived_total = 0
+        self.restored_total = 0
+        self.webhook_events_purged_total = 0
+        self.last_run_at = None
+        self.pid = None
+
+    def as_dict(self):
+        return {
+            "interval_seconds": CONTEXT_SWEEP_INTERVAL_SECONDS,
+            "running": self.pid == os.getpid(),
+            "runs": self.runs,
+            "skipped_runs": self.skipped_runs,
+            "reset_total": self.reset_total,
+            "archived_total": self.archived_total,
+            "restored_total": self.restored_total,
+            "webhook_events_purged_total": self.webhook_events_purged_total,
+            "last_run_at": self.last_run_at,
+        }
+
+
+_context_sweeper_stats = ContextSweeperStats()
+
+
+# Função para limpar, em um lote, o estado dos fluxos das conversas que passaram do timeout (o mesmo
+# reset de reset_conversation_flow_state: as chaves de CONVERSATION_STATE_DEFAULTS voltam ao padrão)
+def _reset_expired_flow_state_batch(cur):
+    cur.execute(f"""
+        WITH candidates AS (
+            SELECT phone_number FROM conversation_contexts
+            WHERE flow_state_active AND last_updated < LOCALTIMESTAMP - make_interval(secs => %s)
+            ORDER BY last_updated
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ), reset AS (
+            UPDATE conversation_contexts AS c
+            SET context = c.context - %s::text[], flow_state_active = FALSE, version = c.version + 1
+            FROM candidates
+            WHERE c.phone_number = candidates.phone_number
+              AND pg_try_advisory_xact_lock(%s, hashtext(c.phone_number))
+            RETURNING c.phone_number, c.version
+        )
+        SELECT count(pg_notify('{CONTEXT_CHANGED_CHANNEL}', phone_number || ':' || version)) FROM reset;
+    """, (CONVERSATION_TIMEOUT_SECONDS, CONTEXT_SWEEP_BATCH_SIZE, list(CONVERSATION_STATE_DEFAULTS), CONVERSATION_LOCK_NAMESPACE))
+    return cur.fetchone()[0]
+
+# Função para mover, em um lote, as conversas inativas há muito tempo para a tabela de arquivo
+def _archive_inactive_contexts_batch(cur):
+    cur.execute(f"""
+        WITH candidates AS (
+            SELECT phone_number FROM conversation_contexts
+            WHERE last_updated < LOCALTIMESTAMP - make_interval(days => %s)
+            ORDER BY last_updated
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ), moved AS (
+            DELETE FROM conversation_contexts AS c
+            USING candidates
+            WHERE c.phone_number = candidates.phone_number
+              AND pg_try_advisory_xact_lock(%s, hashtext(c.phone_number))
+            RETURNING c.phone_number, c.context, c.last_updated, c.registration_fields_mask, c.registration_complete, c.version
+        ), archived AS (
+            INSERT INTO conversation_contexts_archive (phone_number, context, last_updated, registration_fields_mask, registration_complete, version)
+            SELECT phone_number, context, last_updated, registration_fields_mask, registration_complete, version FROM moved
+            ON CONFLICT (phone_number) DO UPDATE
+            SET context = EXCLUDED.context,
+                last_updated = EXCLUDED.last_updated,
+                registration_fields_mask = EXCLUDED.registration_fields_mask,
+                registration_complete = EXCLUDED.registration_complete,
+                version = EXCLUDED.version,
+                archived_at = CURRENT_TIMESTAMP
+            RETURNING phone_number, version
+        )
+        SELECT count(pg_notify('{CONTEXT_CHANGED_CHANNEL}', phone_number || ':' || (version + 1))) FROM archived;
+    """, (CONTEXT_ARCHIVE_AFTER_DAYS, CONTEXT_SWEEP_BATCH_SIZE, CONVERSATION_LOCK_NAMESPACE))
+    return cur.fetchone()[0]
+
+# Função para apagar, em um lote, os ids de eventos processados que já passaram do prazo da deduplicação
+def _purge_processed_webhook_events_batch(cur):
+    cur.execute("""
+        DELETE FROM processed_webhook_events
+        WHERE event_id IN (
+            SELECT event_id FROM processed_webhook_events
+            WHERE processed_at < LOCALTIMESTAMP - make_interval(secs => %s)
+            LIMIT %s
+        );
+    """, (WEBHOOK_DEDUP_TTL_SECONDS, CONTEXT_SWEEP_BATCH_SIZE))
+    return cur.rowcount
+
+# A linha do arquivo só é apagada se a inserção aconteceu: se outra mensagem criou o contexto ao
+# mesmo tempo (ON CONFLICT DO NOTHING), o contexto arquivado continua guardado
+RESTORE_ARCHIVED_CONTEXT_SQL = """
+    WITH archived AS (
+        SELECT phone_number, context, last_updated, registration_fields_mask, registration_complete, version
+        FROM conversation_contexts_archive WHERE phone_number = %s
+        FOR UPDATE
+    ), restored AS (
+        INSERT INTO conversation_contexts (phone_number, context, last_updated, registration_fields_mask, registration_complete, version, flow_state_active)
+        SELECT phone_number, context, last_updated, registration_fields_mask, registration_complete, version + 1, context ?| %s::text[]
+        FROM archived
+        ON CONFLICT (phone_number) DO NOTHING
+        RETURNING phone_number, context, version
+    ), removed AS (
+        DELETE FROM conversation_contexts_archive WHERE phone_number IN (SELECT phone_number FROM restored)
+    )
+    SELECT context, version FROM restored;
+"""
+
+# Função para trazer de volta do arquivo o contexto de um número que voltou a conversar
+def _restore_archived_context(cur, phone_number):
+    cur.execute(RESTORE_ARCHIVED_CONTEXT_SQL, (phone_number, list(CONVERSATION_STATE_DEFAULTS)))
+    result = cur.fetchone()
+    if result is not None:
+        _context_sweeper_stats.restored_total += 1
+        logger.debug("DB_LOAD: Contexto de %s restaurado do arquivo.", phone_number)
+    return result
+
+# Função que executa uma rodada da varredura (devolve None se outro processo já está varrendo)
+def sweep_conversation_contexts():
+    stats = _context_sweeper_stats
+    conn = get_db_connection()
+    if not conn:
+        logger.error("SWEEPER_ERROR: Conexão ao DB falhou ao varrer os contextos.")
+        return None
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_lock(%s, 0);", (CONTEXT_SWEEPER_LOCK_NAMESPACE,))
+        is_leader = cur.fetchone()[0]
+        conn.commit()
+        if not is_leader:
+            stats.skipped_runs += 1
+            return None
+        try:
+            reset = archived = purged = 0
+            for _ in range(CONTEXT_SWEEP_MAX_BATCHES):
+                count = _reset_expired_flow_state_batch(cur)
+                conn.commit()
+                reset += count
+                if count < CONTEXT_SWEEP_BATCH_SIZE:
+                    break
+            for _ in range(CONTEXT_SWEEP_MAX_BATCHES):
+                count = _archive_inactive_contexts_batch(cur)
+                conn.commit()
+                archived += count
+                if count < CONTEXT_SWEEP_BATCH_SIZE:
+                    break
+            for _ in range(CONTEXT_SWEEP_MAX_BATCHES):
+                count = _purge_processed_webhook_events_batch(cur)
+                conn.commit()
+                purged += count
+                if count < CONTEXT_SWEEP_BATCH_SIZE:
+                    break
+        finally:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s, 0);", (CONTEXT_SWEEPER_LOCK_NAMESPACE,))
+            conn.commit()
+        stats.runs += 1
+        stats.reset_total += reset
+        stats.archived_total += archived
+        stats.webhook_events_purged_total += purged
+        stats.last_run_at = datetime.now().isoformat(timespec="seconds")
+        if reset or archived:
+            logger.info("SWEEPER: %s conversa(s) expirada(s) reiniciada(s), %s arquivada(s).", reset, archived)
+        if purged:
+            logger.info("SWEEPER: %s id(s) de eventos do webhook expirado(s) removido(s).", purged)
+        return {"reset": reset, "archived": archived, "webhook_events_purged": purged}
+    except psycopg2.Error as e:
+        logger.error("SWEEPER_ERROR: Erro ao varrer os contextos: %s", e)
+        release_db_connection(conn, close=True)
+        conn = None
+        return None
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+# Função executada em thread própria: roda a varredura periodicamente
+def _context_sweeper_loop():
+    while True:
+        time.sleep(CONTEXT_SWEEP_INTERVAL_SECONDS)
+        try:
+            sweep_conversation_contexts()
+        except Exception as e:
+            logger.error("SWEEPER_ERROR: Erro inesperado na varredura: %s", e)
+
+# Função para garantir que a thread de varredura está rodando neste processo
+def _ensure_context_sweeper():
+    stats = _context_sweeper_stats
+    if CONTEXT_SWEEP_INTERVAL_SECONDS <= 0 or stats.pid == os.getpid():
+        return
+    with _db_pool_lock:
+        if stats.pid != os.getpid():
+            stats.pid = os.getpid()
+            threading.Thread(target=_context_sweeper_loop, name="context-sweeper", daemon=True).start()
+
+LOCK_CONTEXT_SQL = "SELECT context FROM conversation_contexts WHERE phone_number = %s FOR UPDATE;"
+
+MIGRATE_CONTEXT_SQL = f"""
+    WITH saved AS (
+        UPDATE conversation_contexts
+        SET context = context - %s::text[],
+            flow_state_active = COALESCE((context - %s::text[]) ?| %s::text[], FALSE),
+            version = version + 1
+        WHERE phone_number = %s
+        RETURNING phone_number, version
+    )
+    SELECT version, pg_notify('{CONTEXT_CHANGED_CHANNEL}', phone_number || ':' || version) FROM saved;
+"""
 
-# Função para salvar o contexto da conversa no banco de dados
+# Função para saber se um contexto lido ainda está no formato antigo (listas de registros ou flags padrão gravadas)
+def is_legacy_context(context):
+    return any(key in FARMER_RECORD_TABLES or is_default_state_value(key, value) for key, value in context.items())
+
+# Função para separar, no contexto antigo relido com bloqueio, as listas de registros e as flags padrão a remover
+def legacy_context_keys(locked_context):
+    kinds = [kind for kind in FARMER_RECORD_TABLES if kind in locked_context]
+    default_keys = [key for key, value in locked_context.items() if is_default_state_value(key, value)]
+    return kinds, default_keys
+
+# Função para ajustar contextos gravados no formato antigo: move as listas de registros para as
+# tabelas próprias e remove as flags gravadas com o valor padrão. Devolve a nova versão da linha.
+def _migrate_legacy_context(cur, phone_number, context):
+    # Relê a linha com bloqueio para que duas mensagens simultâneas não migrem as listas duas vezes.
+    # Se ela foi arquivada ou apagada depois da leitura, não há o que migrar (devolve None).
+    cur.execute(LOCK_CONTEXT_SQL, (phone_number,))
+    row = cur.fetchone()
+    if row is None:
+        logger.debug("DB_MIGRATE: Contexto de %s não existe mais; nada a migrar.", phone_number)
+        return None
+    locked_context = row[0] or {}
+    kinds, default_keys = legacy_context_keys(locked_context)
+    for kind in kinds:
+        _insert_farmer_records(cur, phone_number, kind, locked_context[kind] or [])
+    for key in kinds + default_keys:
+        context.pop(key, None)
+    cur.execute(MIGRATE_CONTEXT_SQL, (kinds + default_keys, kinds + default_keys, list(CONVERSATION_STATE_DEFAULTS), phone_number))
+    logger.info("DB_MIGRATE: Contexto de %s migrado (listas movidas: %s, flags padrão removidas: %s).", phone_number, kinds, len(default_keys))
+    return cur.fetchone()[0]
+
+# Unidade de trabalho da mensagem em processamento: enquanto estiver ativa, as chamadas a
+# save_conversation_context() e add_farmer_record() só ficam pendentes, e flush() grava tudo
+# numa única transação ao final (nada é gravado quando o contexto não mudou desde a leitura).
+_context_unit_of_work = contextvars.ContextVar("context_unit_of_work", default=None)
+
+
+class ContextUnitOfWork:
+    def __init__(self):
+        self.loaded = {}
+        self.versions = {}
+        self.pending = {}
+        self.pending_records = {}
+
+    # O snapshot guardado aqui não é mais alterado (pode ser compartilhado com o cache)
+    def track_load(self, phone_number, snapshot, version):
+        self.loaded[phone_number] = snapshot
+        self.versions[phone_number] = version
+
+    def register_save(self, phone_number, context):
+        self.pending[phone_number] = context
+
+    def register_record(self, phone_number, kind, record):
+        self.pending_records.setdefault((phone_number, kind), []).append(record)
+
+    def pending_phone_numbers(self):
+        return set(self.pending) | {phone_number for phone_number, _ in self.pending_records}
+
+    def flush(self):
+        if not self.pending_records and all(
+            context == self.loaded.get(phone_number) for phone_number, context in self.pending.items()
+        ):
+            if self.pending:
+                logger.debug("DB_SAVE: Contexto de %s não mudou. Nenhuma gravação necessária.", ', '.join(self.pending))
+            self.pending.clear()
+            return
+        conn = get_db_connection()
+        if not conn:
+            logger.error("DB_SAVE_ERROR: Conexão ao DB falhou ao salvar contexto para %s.", ', '.join(self.pending_phone_numbers()))
+            raise DatabaseUnavailableError("Falha na conexão com o banco de dados ao tentar salvar o contexto.")
+        saved_versions = {}
+        try:
+            cur = conn.cursor()
+            for (phone_number, kind), records in self.pending_records.items():
+                _insert_farmer_records(cur, phone_number, kind, records)
+            for phone_number, context in self.pending.items():
+                previous = self.loaded.get(phone_number)
+                if context == previous:
+                    continue
+                # Sem leitura anterior a linha ainda não existia: insere o documento completo
+                if previous is None:
+                    saved_versions[phone_number] = _upsert_context(cur, phone_number, context, expect_new=True)
+                else:
+                    saved_versions[phone_number] = _patch_context(cur, phone_number, previous, context, self.versions[phone_number])
+            conn.commit()
+            cur.close()
+        except StaleContextError as e:
+            conn.rollback()
+            for phone_number in self.pending:
+                conversa_contextos.invalidate(phone_number)
+            logger.warning("DB_SAVE_CONFLICT: %s", e)
+            raise
+        except psycopg2.Error as e:
+            logger.error("DB_SAVE_ERROR: Erro ao salvar contexto da conversa no banco de dados para %s: %s", ', '.join(self.pending_phone_numbers()), e)
+            raise
+        finally:
+            release_db_connection(conn)
+        for phone_number, version in saved_versions.items():
+            snapshot = copy.deepcopy(self.pending[phone_number])
+            self.track_load(phone_number, snapshot, version)
+            conversa_contextos.put(phone_number, snapshot, version)
+        self.pending.clear()
+        self.pending_records.clear()
+
+
+# Função para abrir uma unidade de trabalho de contexto (uma por mensagem recebida)
+@contextmanager
+def context_unit_of_work():
+    uow = ContextUnitOfWork()
+    token = _context_unit_of_work.set(uow)
+    try:
+        yield uow
+    finally:
+        _context_unit_of_work.reset(token)
+
+
+# Serialização por conversa: mensagens do mesmo número são processadas uma de cada vez e na
+# ordem de chegada, enquanto números diferentes seguem em paralelo. Dentro do processo uma fila
+# de senhas (FIFO) por número; entre os workers do gunicorn um advisory lock do PostgreSQL.
+class ConversationLockError(Exception):
+    pass
+
+
+class ConversationLocks:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {} # telefone -> [condition, próxima senha, senha atendida, aguardando]
+
+    @contextmanager
+    def hold(self, phone_number):
+        with self._lock:
+            entry = self._entries.get(phone_number)
+            if entry is None:
+                entry = self._entries[phone_number] = [threading.Condition(self._lock), 0, 0, 0]
+            ticket = entry[1]
+            entry[1] += 1
+            entry[3] += 1
+            while entry[2] != ticket:
+                entry[0].wait()
+        try:
+            yield
+        finally:
+            with self._lock:
+                entry[2] += 1
+                entry[3] -= 1
+                if entry[3] == 0:
+                    del self._entries[phone_number]
+                else:
+                    entry[0].notify_all()
+
+    def reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "conversations": len(self._entries),
+                "waiting": sum(entry[3] - 1 for entry in self._entries.values()),
+            }
+
+
+_conversation_locks = ConversationLocks()
+os.register_at_fork(after_in_child=_conversation_locks.reset_after_fork)
+
+
+CONVERSATION_LOCK_STATEMENT = PreparedStatement(
+    "conversation_lock", "SELECT set_config('lock_timeout', %s, true), pg_advisory_lock(%s, hashtext(%s));"
+)
+CONTEXT_VERSION_STATEMENT = PreparedStatement(
+    "context_version", "SELECT version FROM conversation_contexts WHERE phone_number = %s;"
+)
+CONVERSATION_UNLOCK_STATEMENT = PreparedStatement("conversation_unlock", "SELECT pg_advisory_unlock(%s, hashtext(%s));")
+
+
+# Função para processar uma mensagem com exclusividade sobre a conversa do número
+@contextmanager
+def conversation_lock(phone_number):
+    with _conversation_locks.hold(phone_number):
+        if not CONVERSATION_ADVISORY_LOCKS:
+            yield
+            return
+        conn = get_db_connection()
+        if not conn:
+            raise ConversationLockError("Falha na conexão com o banco de dados ao tentar bloquear a conversa.")
+        locked = False
+        try:
+            cur = conn.cursor()
+            try:
+                # Um único round trip: limita a espera (lock_timeout local à transação), bloqueia e
+                # devolve a versão atual do contexto, que valida a entrada do cache. A versão precisa
+                # ser lida num comando separado, depois do lock: um único SELECT usaria o snapshot de
+                # antes da espera e não veria a gravação de quem acabou de soltar o lock.
+                execute_prepared(
+                    cur,
+                    (CONVERSATION_LOCK_STATEMENT, (f"{int(CONVERSATION_LOCK_TIMEOUT_SECONDS * 1000)}ms", CONVERSATION_LOCK_NAMESPACE, phone_number)),
+                    (CONTEXT_VERSION_STATEMENT, (phone_number,)),
+                )
+                result = cur.fetchone()
+                version = result[0] if result else None
+                conn.commit()
+            except psycopg2.Error as e:
+                raise ConversationLockError(f"Não foi possível bloquear a conversa {phone_number}: {e}")
+            locked = True
+            conversa_contextos.validate(phone_number, version)
+            yield
+        finally:
+            try:
+                if locked:
+                    CONVERSATION_UNLOCK_STATEMENT.execute(cur, (CONVERSATION_LOCK_NAMESPACE, phone_number))
+                    conn.commit()
+                release_db_connection(conn)
+            except psycopg2.Error as e:
+                # Sem conseguir liberar, a conexão é descartada e o PostgreSQL solta o lock junto
+                logger.error("CONVERSATION_LOCK_ERROR: Erro ao liberar o lock da conversa %s: %s", phone_number, e)
+                release_db_connection(conn, close=True)
+
+
+# Função para salvar o contexto da conversa (adiada até o flush quando há unidade de trabalho ativa).
+# Fora de uma unidade de trabalho a gravação é incondicional (sobrescreve a versão atual).
 def save_conversation_context(phone_number, context):
+    uow = _context_unit_of_work.get()
+    if uow is not None:
+        uow.register_save(phone_number, context)
+        return
     conn = get_db_connection()
     if conn:
         try:
             cur = conn.cursor()
-            context_json = json.dumps(context)
-            cur.execute("""
-                INSERT INTO conversation_contexts (phone_number, context)
-                VALUES (%s, %s)
-                ON CONFLICT (phone_number) DO UPDATE
-                SET context = EXCLUDED.context, last_updated = CURRENT_TIMESTAMP;
-            """, (phone_number, context_json))
+            version = _upsert_context(cur, phone_number, context)
             conn.commit()
             cur.close()
-            print(f"DEBUG_DB_SAVE: Contexto para {phone_number} salvo/atualizado no DB: {context}")
-            time.sleep(0.1) # Pequena pausa após o commit
+            conversa_contextos.put(phone_number, copy.deepcopy(context), version)
         except psycopg2.Error as e:
-            print(f"DEBUG_DB_SAVE_ERROR: Erro ao salvar contexto da conversa no banco de dados para {phone_number}: {e}")
+            logger.error("DB_SAVE_ERROR: Erro ao salvar contexto da conversa no banco de dados para %s: %s", phone_number, e)
             raise # Re-raise the exception to be caught by the caller if needed
         finally:
             if conn:
-                conn.close()
+                release_db_connection(conn)
     else:
-        print(f"DEBUG_DB_SAVE_ERROR: Conexão ao DB falhou ao salvar contexto para {phone_number}.")
+        logger.error("DB_SAVE_ERROR: Conexão ao DB falhou ao salvar contexto para %s.", phone_number)
         raise Exception("Falha na conexão com o banco de dados ao tentar salvar o contexto.")
 
+# Gravação do documento completo; a variante "insert" não sobrescreve uma linha já existente
+_UPSERT_CONTEXT_TEMPLATE = """
+    WITH saved AS (
+        INSERT INTO conversation_contexts (phone_number, context, registration_fields_mask, registration_complete, flow_state_active, version)
+        VALUES (%s, %s, %s, %s, %s, 1)
+        ON CONFLICT (phone_number) {on_conflict}
+        RETURNING phone_number, version
+    )
+    SELECT version, pg_notify('{channel}', phone_number || ':' || version) FROM saved;
+"""
+UPSERT_CONTEXT_SQL = _UPSERT_CONTEXT_TEMPLATE.format(channel=CONTEXT_CHANGED_CHANNEL, on_conflict="""DO UPDATE
+        SET context = EXCLUDED.context,
+            registration_fields_mask = EXCLUDED.registration_fields_mask,
+            registration_complete = EXCLUDED.registration_complete,
+            flow_state_active = EXCLUDED.flow_state_active,
+            version = conversation_contexts.version + 1,
+            last_updated = CURRENT_TIMESTAMP""")
+INSERT_CONTEXT_SQL = _UPSERT_CONTEXT_TEMPLATE.format(channel=CONTEXT_CHANGED_CHANNEL, on_conflict="DO NOTHING")
+UPSERT_CONTEXT_STATEMENT = PreparedStatement("upsert_context", UPSERT_CONTEXT_SQL)
+INSERT_CONTEXT_STATEMENT = PreparedStatement("insert_context", INSERT_CONTEXT_SQL)
+
+# Função para calcular os parâmetros de gravação do documento completo (mesma ordem de UPSERT_CONTEXT_SQL)
+def context_upsert_params(phone_number, context):
+    compact_context = compact_conversation_state(context)
+    mask = registration_fields_mask(context)
+    return phone_number, compact_context, mask, mask == REGISTRATION_COMPLETE_MASK, has_flow_state(compact_context)
+
+# Função para gravar o documento completo do contexto e devolver a nova versão da linha.
+# Com expect_new=True a linha não pode existir (outro worker a criou antes: StaleContextError).
+def _upsert_context(cur, phone_number, context, expect_new=False):
+    params = list(context_upsert_params(phone_number, context))
+    params[1] = json_dumps(params[1])
+    (INSERT_CONTEXT_STATEMENT if expect_new else UPSERT_CONTEXT_STATEMENT).execute(cur, params)
+    result = cur.fetchone()
+    if result is None:
+        raise StaleContextError(f"Contexto de {phone_number} foi criado por outra requisição antes desta gravação.")
+    logger.debug("DB_SAVE: Contexto para %s salvo/atualizado no DB (versão %s): %s", phone_number, result[0], context)
+    return result[0]
+
+# Função para saber se o valor de uma chave do contexto é o padrão do esquema (e pode ser omitido)
+def is_default_state_value(key, value):
+    if key not in CONVERSATION_STATE_DEFAULTS:
+        return False
+    default = CONVERSATION_STATE_DEFAULTS[key]
+    return type(value) is type(default) and value == default
+
+# Função para obter a forma gravada do contexto: sem as flags que estão no valor padrão
+def compact_conversation_state(context):
+    return {key: value for key, value in context.items() if not is_default_state_value(key, value)}
+
+# Função para saber se a forma compacta do contexto ainda tem algum estado de fluxo gravado
+def has_flow_state(compact_context):
+    return any(key in CONVERSATION_STATE_DEFAULTS for key in compact_context)
+
+# Função para preencher no contexto lido as flags omitidas na gravação
+def expand_conversation_state(context):
+    for key, default in CONVERSATION_STATE_DEFAULTS.items():
+        if key not in context:
+            context[key] = copy.deepcopy(default)
+    return context
+
+# Função para reiniciar o estado dos fluxos depois do timeout de inatividade. A varredura em segundo
+# plano faz o mesmo reset no banco (remove as mesmas chaves): a conversa fica igual pelos dois caminhos.
+def reset_conversation_flow_state(context):
+    for key, default in CONVERSATION_STATE_DEFAULTS.items():
+        context[key] = copy.deepcopy(default)
+    return context
+
+# Função para calcular o delta entre dois contextos: chaves de primeiro nível alteradas/novas e chaves removidas
+def diff_conversation_context(previous, context):
+    changed = {key: value for key, value in context.items() if key not in previous or previous[key] != value}
+    removed = [key for key in previous if key not in context]
+    return changed, removed
+
+PATCH_CONTEXT_SQL = f"""
+    WITH saved AS (
+        UPDATE conversation_contexts
+        SET context = (COALESCE(context, '{{}}'::jsonb) - %s::text[]) || %s::jsonb,
+            registration_fields_mask = %s,
+            registration_complete = %s,
+            flow_state_active = %s,
+            version = version + 1,
+            last_updated = CURRENT_TIMESTAMP
+        WHERE phone_number = %s AND version = %s
+        RETURNING phone_number, version
+    )
+    SELECT version, pg_notify('{CONTEXT_CHANGED_CHANNEL}', phone_number || ':' || version) FROM saved;
+"""
+PATCH_CONTEXT_STATEMENT = PreparedStatement("patch_context", PATCH_CONTEXT_SQL)
+
+# Função para calcular o delta gravado por PATCH_CONTEXT_SQL (None quando nada mudou na forma compacta)
+def context_patch_params(phone_number, previous, context, expected_version):
+    # O banco guarda a forma compacta (sem flags no valor padrão); o delta é calculado sobre ela
+    compact_context = compact_conversation_state(context)
+    changed, removed = diff_conversation_context(compact_conversation_state(previous), compact_context)
+    if not changed and not removed:
+        return None
+    mask = registration_fields_mask(context)
+    return removed, changed, mask, mask == REGISTRATION_COMPLETE_MASK, has_flow_state(compact_context), phone_number, expected_version
+
+# Função para gravar apenas as chaves do contexto que mudaram desde a leitura, desde que a linha
+# ainda esteja na versão lida (compare-and-swap). Devolve a nova versão.
+def _patch_context(cur, phone_number, previous, context, expected_version):
+    params = context_patch_params(phone_number, previous, context, expected_version)
+    if params is None:
+        return expected_version
+    removed, changed = params[0], params[1]
+    PATCH_CONTEXT_STATEMENT.execute(cur, (removed, json_dumps(changed)) + params[2:])
+    result = cur.fetchone()
+    if result is None:
+        raise StaleContextError(f"Contexto de {phone_number} mudou desde a leitura (versão {expected_version}); gravação descartada.")
+    logger.debug("DB_SAVE: Contexto para %s atualizado no DB (versão %s, alteradas: %s, removidas: %s)", phone_number, result[0], list(changed), removed)
+    return result[0]
+
+# Função para converter a data digitada pelo usuário (dd/mm/aaaa) para a coluna record_date
+def _parse_record_date(value):
+    try:
+        return datetime.strptime(str(value).strip(), "%d/%m/%Y").date()
+    except ValueError:
+        return None
+
+# Função para montar o INSERT de um registro do produtor e os valores das colunas indexadas
+def farmer_record_insert(kind, record):
+    spec = FARMER_RECORD_TABLES[kind]
+    key_value = record.get(spec["key_field"])
+    record_date = _parse_record_date(record.get(spec["date_field"])) if spec["date_field"] else None
+    sql = f"INSERT INTO {spec['table']} (phone_number, {spec['key_column']}, record_date, record) VALUES (%s, %s, %s, %s);"
+    return sql, key_value, record_date
+
+# Função para inserir registros de um produtor na tabela correspondente ao tipo
+def _insert_farmer_records(cur, phone_number, kind, records):
+    for record in records:
+        sql, key_value, record_date = farmer_record_insert(kind, record)
+        cur.execute(sql, (phone_number, key_value, record_date, json_dumps(record)))
+
+# Função para adicionar um registro do produtor (gravado junto com o contexto quando há unidade de trabalho ativa)
+def add_farmer_record(phone_number, kind, record):
+    uow = _context_unit_of_work.get()
+    if uow is not None:
+        uow.register_record(phone_number, kind, record)
+        return
+    conn = get_db_connection()
+    if not conn:
+        raise Exception("Falha na conexão com o banco de dados ao tentar salvar o registro.")
+    try:
+        cur = conn.cursor()
+        _insert_farmer_records(cur, phone_number, kind, [record])
+        conn.commit()
+        cur.close()
+    finally:
+        release_db_connection(conn)
+
+# Função para listar os registros do produtor em ordem de inclusão (opcionalmente só de um animal/item)
+def list_farmer_records(phone_number, kind, key=None):
+    spec = FARMER_RECORD_TABLES[kind]
+    query = f"SELECT record FROM {spec['table']} WHERE phone_number = %s"
+    params = [phone_number]
+    if key is not None:
+        query += f" AND lower({spec['key_column']}) = lower(%s)"
+        params.append(key)
+    # Sem banco o erro sobe: responder "nenhum registro" a quem tem registros seria pior
+    conn = get_db_connection()
+    if not conn:
+        raise DatabaseUnavailableError(f"Sem conexão com o banco de dados para listar {kind} de {phone_number}.")
+    try:
+        cur = conn.cursor()
+        cur.execute(query + " ORDER BY id;", params)
+        records = [row[0] for row in cur.fetchall()]
+        cur.close()
+    except psycopg2.Error as e:
+        logger.error("DB_LOAD_ERROR: Erro ao listar %s de %s: %s", kind, phone_number, e)
+        raise DatabaseUnavailableError(f"Erro ao listar {kind} de {phone_number}: {e}") from e
+    finally:
+        release_db_connection(conn)
+    # Registros desta mesma mensagem que ainda não foram gravados
+    uow = _context_unit_of_work.get()
+    if uow is not None:
+        for record in uow.pending_records.get((phone_number, kind), []):
+            if key is None or str(record.get(spec["key_field"], "")).lower() == key.lower():
+                records.append(record)
+    return records
+
 
 # Função para obter localização via IP
 def obter_localizacao_via_ip():
@@ -308,34 +1964,542 @@ def obter_localizacao_por_coordenadas(lat, lon):
         return {"erro": f"Erro geral: {e}"}
 
 
-# Função auxiliar para enviar mensagem via Evolution API
-def send_whatsapp_message(numero, mensagem):
+# Sessão HTTP compartilhada da Evolution API (uma por processo: após um fork o worker cria a sua)
+_evolution_session = None
+_evolution_session_pid = None
+_evolution_session_lock = threading.Lock()
+
+
+def _reset_evolution_session_after_fork():
+    global _evolution_session, _evolution_session_pid, _evolution_session_lock
+    # Os sockets keep-alive são do processo pai; o filho abre as próprias conexões
+    _evolution_session = None
+    _evolution_session_pid = None
+    _evolution_session_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_evolution_session_after_fork)
+
+
+# Função para obter a sessão HTTP da Evolution API (keep-alive, até EVOLUTION_HTTP_POOL_SIZE conexões)
+def get_evolution_session():
+    global _evolution_session, _evolution_session_pid
+    if _evolution_session is not None and _evolution_session_pid == os.getpid():
+        return _evolution_session
+    with _evolution_session_lock:
+        if _evolution_session is None or _evolution_session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=EVOLUTION_HTTP_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({
+                "Content-Type": "application/json",
+                "apikey": AUTH_KEY
+            })
+            _evolution_session = session
+            _evolution_session_pid = os.getpid()
+    return _evolution_session
+
+
+# Fila de trabalho com chave: os itens de uma mesma chave são processados um de cada vez e na ordem
+# de chegada, enquanto chaves diferentes seguem em paralelo nas threads do pool. As threads são
+# criadas no primeiro put() de cada processo; num filho do fork a fila recomeça vazia.
+class KeyedWorkQueue:
+    def __init__(self, name, handler, workers, max_pending=0):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._drained = threading.Condition(self._lock)
+        self._space = threading.Condition(self._lock)
+        self._items = {} # chave -> deque de (item, instante em que entrou na fila)
+        self._ready_keys = deque() # chaves com itens esperando e nenhuma thread processando
+        self._workers_pid = None
+        self.pending = 0
+        self.active = 0
+        self.enqueued_total = 0
+        self.processed_total = 0
+        self.failed_total = 0
+        self.rejected_total = 0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+    def _ensure_workers(self):
+        if self._workers_pid == os.getpid():
+            return
+        self._workers_pid = os.getpid()
+        for index in range(self.workers):
+            threading.Thread(target=self._worker_loop, name=f"{self.name}-{index}", daemon=True).start()
+
+    # Enfileira o item; com a fila cheia espera até `timeout` segundos por espaço e devolve False
+    # (sem enfileirar) se ele não abrir
+    def put(self, key, item, timeout=0):
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self.max_pending and self.pending >= self.max_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected_total += 1
+                    return False
+                self._space.wait(remaining)
+            self._ensure_workers()
+            items = self._items.get(key)
+            if items is None:
+                items = self._items[key] = deque()
+                self._ready_keys.append(key)
+                self._ready.notify()
+            items.append((item, time.monotonic()))
+            self.pending += 1
+            self.enqueued_total += 1
+            return True
+
+    def _worker_loop(self):
+        while True:
+            with self._lock:
+                while not self._ready_keys:
+                    self._ready.wait()
+                key = self._ready_keys.popleft()
+                item, enqueued_at = self._items[key].popleft()
+                self.active += 1
+                self.last_lag_seconds = time.monotonic() - enqueued_at
+                self.max_lag_seconds = max(self.max_lag_seconds, self.last_lag_seconds)
+            failed = False
+            try:
+                self.handler(key, item)
+            except Exception as e:
+                failed = True
+                logger.error("QUEUE_ERROR: Erro ao processar item de '%s' na fila %s: %s", key, self.name, e)
+            with self._lock:
+                self.active -= 1
+                self.pending -= 1
+                if failed:
+                    self.failed_total += 1
+                else:
+                    self.processed_total += 1
+                # A chave volta para o fim da fila de prontas: uma conversa longa não monopoliza a thread
+                if self._items[key]:
+                    self._ready_keys.append(key)
+                    self._ready.notify()
+                else:
+                    del self._items[key]
+                self._space.notify()
+                if self.pending == 0:
+                    self._drained.notify_all()
+
+    # Espera a fila esvaziar (devolve False se o tempo acabar antes)
+    def drain(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self.pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._drained.wait(remaining)
+        return True
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            oldest = min((items[0][1] for items in self._items.values() if items), default=None)
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "active": self.active,
+                "keys": len(self._items),
+                "max_pending": self.max_pending,
+                "oldest_pending_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+                "last_lag_seconds": round(self.last_lag_seconds, 3),
+                "max_lag_seconds": round(self.max_lag_seconds, 3),
+                "enqueued_total": self.enqueued_total,
+                "processed_total": self.processed_total,
+                "failed_total": self.failed_total,
+                "rejected_total": self.rejected_total,
+            }
+
+
+# Balde de fichas: `rate` fichas por segundo, acumulando até `capacity` (a rajada permitida)
+class TokenBucket:
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    # Reserva uma ficha e devolve quantos segundos esperar até poder usá-la (o saldo pode ficar negativo)
+    def reserve(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def is_full(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+# Limite de taxa dos envios: um balde por número de destino e um por instância da Evolution API
+class OutboundRateLimiter:
+    MAX_IDLE_BUCKETS = 10000
+
+    def __init__(self, number_rate, number_burst, instance_rate, instance_burst):
+        self.number_rate = number_rate
+        self.number_burst = number_burst
+        self.instance_rate = instance_rate
+        self.instance_burst = instance_burst
+        self._lock = threading.Lock()
+        self._numbers = {}
+        self._instances = {}
+        self.delayed_total = 0
+        os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def _bucket(self, buckets, key, rate, burst, now):
+        bucket = buckets.get(key)
+        if bucket is None:
+            # Baldes cheios não guardam estado nenhum: podem ser descartados sem mudar o limite
+            if len(buckets) >= self.MAX_IDLE_BUCKETS:
+                for idle_key in [k for k, b in buckets.items() if b.is_full(now)]:
+                    del buckets[idle_key]
+            bucket = buckets[key] = TokenBucket(rate, burst, now)
+        return bucket
+
+    # Reserva o envio de uma mensagem e devolve quantos segundos esperar antes de enviá-la
+    def reserve(self, instance, numero):
+        with self._lock:
+            now = time.monotonic()
+            delay = 0.0
+            if self.number_rate > 0:
+                delay = self._bucket(self._numbers, numero, self.number_rate, self.number_burst, now).reserve(now)
+            if self.instance_rate > 0:
+                delay = max(delay, self._bucket(self._instances, instance, self.instance_rate, self.instance_burst, now).reserve(now))
+            if delay > 0:
+                self.delayed_total += 1
+            return delay
+
+    def stats(self):
+        with self._lock:
+            return {
+                "number_rate_per_second": self.number_rate,
+                "instance_rate_per_second": self.instance_rate,
+                "tracked_numbers": len(self._numbers),
+                "delayed_total": self.delayed_total,
+            }
+
+
+_outbound_rate_limiter = OutboundRateLimiter(
+    OUTBOUND_NUMBER_RATE_PER_SECOND, OUTBOUND_NUMBER_BURST, OUTBOUND_INSTANCE_RATE_PER_SECOND, OUTBOUND_INSTANCE_BURST
+)
+
+
+# Contadores das entregas (tentativas, novas tentativas e mensagens mandadas para a dead letter)
+class OutboundDeliveryStats:
+    def __init__(self):
+        self.sent_total = 0
+        self.retries_total = 0
+        self.dead_lettered_total = 0
+        self.dropped_total = 0
+        self.replayed_total = 0
+        self.replay_failures_total = 0
+        self.replayer_pid = None
+
+    def as_dict(self):
+        return {
+            "sent_total": self.sent_total,
+            "retries_total": self.retries_total,
+            "dead_lettered_total": self.dead_lettered_total,
+            "dropped_total": self.dropped_total,
+            "replayed_total": self.replayed_total,
+            "replay_failures_total": self.replay_failures_total,
+        }
+
+
+_outbound_delivery_stats = OutboundDeliveryStats()
+
+
+# Função para saber se vale tentar de novo: falha de rede/timeout, 429 ou erro 5xx da Evolution API.
+# Os demais 4xx (número inválido, instância inexistente, chave errada) falhariam de novo.
+def is_retryable_send_status(status):
+    return status is None or status == 429 or status >= 500
+
+
+# Função para calcular a espera antes da tentativa `attempt` (backoff exponencial com jitter total)
+def outbound_retry_delay(attempt):
+    return random.uniform(0, min(OUTBOUND_RETRY_MAX_DELAY_SECONDS, OUTBOUND_RETRY_BASE_DELAY_SECONDS * (2 ** attempt)))
+
+
+# Função executada pelas threads de envio: respeita os limites de taxa, envia (na ordem de cada
+# número) e tenta de novo as falhas temporárias até o orçamento de tempo acabar. Com retry=False
+# (envio síncrono no webhook) faz uma única tentativa. Falhas temporárias que não saírem vão para a
+# dead letter; as permanentes (outros 4xx) são descartadas.
+def _deliver_whatsapp_message(numero, mensagem, retry=True):
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        delay = _outbound_rate_limiter.reserve(EVOLUTION_INSTANCE, numero)
+        if delay > 0:
+            time.sleep(delay)
+        status, resposta = _post_whatsapp_message(numero, mensagem)
+        attempt += 1
+        if status is not None and 200 <= status < 300:
+            _outbound_delivery_stats.sent_total += 1
+            return status, resposta
+        if not is_retryable_send_status(status):
+            _outbound_delivery_stats.dropped_total += 1
+            logger.error("WHATSAPP_ERROR: Mensagem para %s descartada: a Evolution API recusou o envio (status %s).", numero, status)
+            return status, resposta
+        backoff = outbound_retry_delay(attempt - 1)
+        if not retry or time.monotonic() - started + backoff > OUTBOUND_RETRY_BUDGET_SECONDS:
+            _dead_letter_whatsapp_message(numero, mensagem, status, resposta.get("erro"), attempt)
+            return status, resposta
+        _outbound_delivery_stats.retries_total += 1
+        logger.warning("WHATSAPP: Nova tentativa de envio para %s em %.2fs (tentativa %s, status %s).", numero, backoff, attempt + 1, status)
+        time.sleep(backoff)
+
+
+_outbound_queue = KeyedWorkQueue("outbound-sender", _deliver_whatsapp_message, OUTBOUND_SENDER_THREADS, OUTBOUND_QUEUE_MAX_PENDING)
+
+
+# Função para esperar as mensagens pendentes serem enviadas (ex: ao encerrar o worker)
+def drain_outbound_messages(timeout=OUTBOUND_DRAIN_TIMEOUT_SECONDS):
+    if _outbound_queue.pending and not _outbound_queue.drain(timeout):
+        logger.error("WHATSAPP_ERROR: %s mensagens ainda na fila ao encerrar o processo.", _outbound_queue.pending)
+
+
+atexit.register(drain_outbound_messages)
+
+
+# Respostas da mensagem em processamento: ficam num buffer até o contexto ser gravado. Textos
+# seguidos para o mesmo número viram um único envio (até WHATSAPP_MAX_MESSAGE_LENGTH), a menos que
+# a mensagem peça um balão separado. Se a gravação do contexto falhar, as respostas são descartadas.
+_reply_buffer = contextvars.ContextVar("reply_buffer", default=None)
+
+
+class ReplyBufferStats:
+    def __init__(self):
+        self.buffered_total = 0
+        self.merged_total = 0
+        self.released_total = 0
+        self.discarded_total = 0
+
+    def as_dict(self):
+        return {
+            "buffered_total": self.buffered_total,
+            "merged_total": self.merged_total,
+            "released_total": self.released_total,
+            "discarded_total": self.discarded_total,
+        }
+
+
+_reply_buffer_stats = ReplyBufferStats()
+
+
+class ReplyBuffer:
+    SEPARATOR = "\n\n"
+
+    def __init__(self):
+        self.replies = [] # [número, texto, balão separado]
+
+    def add(self, numero, mensagem, separate_bubble=False):
+        _reply_buffer_stats.buffered_total += 1
+        last = self.replies[-1] if self.replies else None
+        if (not separate_bubble and last is not None and last[0] == numero and not last[2]
+                and len(last[1]) + len(self.SEPARATOR) + len(mensagem) <= WHATSAPP_MAX_MESSAGE_LENGTH):
+            last[1] += self.SEPARATOR + mensagem
+            _reply_buffer_stats.merged_total += 1
+            return
+        self.replies.append([numero, mensagem, separate_bubble])
+
+    # Envia as respostas acumuladas (na ordem em que foram geradas)
+    def release(self):
+        replies, self.replies = self.replies, []
+        for numero, mensagem, _ in replies:
+            _enqueue_whatsapp_message(numero, mensagem)
+        _reply_buffer_stats.released_total += len(replies)
+
+    def discard(self):
+        if self.replies:
+            logger.debug("WHATSAPP: %s respostas descartadas (o contexto não foi gravado).", len(self.replies))
+        _reply_buffer_stats.discarded_total += len(self.replies)
+        self.replies = []
+
+
+# Função para abrir o buffer de respostas de uma mensagem recebida (quem abre chama release()/discard())
+@contextmanager
+def reply_buffer():
+    buffer = ReplyBuffer()
+    token = _reply_buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _reply_buffer.reset(token)
+
+
+# Função auxiliar para enviar mensagem via Evolution API. Durante o processamento de uma mensagem
+# recebida a resposta vai para o buffer da requisição (separate_bubble=True impede o agrupamento
+# com as respostas vizinhas); fora dele vai direto para a fila de envio.
+def send_whatsapp_message(numero, mensagem, separate_bubble=False):
+    buffer = _reply_buffer.get()
+    if buffer is not None:
+        buffer.add(numero, mensagem, separate_bubble)
+        return 202, {"status": "aguardando gravação do contexto"}
+    return _enqueue_whatsapp_message(numero, mensagem)
+
+
+# Função para colocar a mensagem na fila de envio e voltar imediatamente (o envio acontece em
+# segundo plano, na ordem de chegada para cada número). Sem threads de envio, envia na hora
+# respeitando os mesmos limites de taxa. Com a fila cheia espera por espaço: enviar por fora dela
+# passaria na frente das respostas anteriores do mesmo número.
+def _enqueue_whatsapp_message(numero, mensagem):
+    if OUTBOUND_SENDER_THREADS <= 0:
+        return _deliver_whatsapp_message(numero, mensagem, retry=False)
+    if _outbound_queue.put(numero, mensagem, timeout=OUTBOUND_QUEUE_PUT_TIMEOUT_SECONDS):
+        logger.debug("WHATSAPP: Mensagem para %s colocada na fila de envio.", numero)
+        return 202, {"status": "enfileirada"}
+    logger.error("WHATSAPP_ERROR: Fila de envio cheia por %ss; mensagem para %s vai para a dead letter.", OUTBOUND_QUEUE_PUT_TIMEOUT_SECONDS, numero)
+    _dead_letter_whatsapp_message(numero, mensagem, None, "Fila de envio cheia", 0)
+    return 202, {"status": "dead letter"}
+
+
+# Função para enviar de fato a mensagem pela Evolution API (chamada pelas threads de envio)
+def _post_whatsapp_message(numero, mensagem):
     payload = {
         "number": numero,
         "textMessage": {"text": mensagem}
     }
-    headers = {
-        "Content-Type": "application/json",
-        "apikey": AUTH_KEY
-    }
-    url = f"http://127.0.0.1:8080/message/sendText/campointeligente"
+    url = f"{EVOLUTION_API_URL}/message/sendText/{EVOLUTION_INSTANCE}"
     try:
-        resposta = requests.post(url, json=payload, headers=headers)
+        resposta = get_evolution_session().post(
+            url,
+            json=payload,
+            timeout=(EVOLUTION_HTTP_CONNECT_TIMEOUT_SECONDS, EVOLUTION_HTTP_READ_TIMEOUT_SECONDS)
+        )
         resposta.raise_for_status()
-        if resposta.status_code == 200:
-            print(f"DEBUG_WHATSAPP: Mensagem enviada com sucesso para {numero}: {mensagem}")
-            time.sleep(0.5) # Pequena pausa após o envio da mensagem
-            return resposta.status_code, resposta.json()
+        if 200 <= resposta.status_code < 300:
+            logger.debug("WHATSAPP: Mensagem enviada com sucesso para %s: %s", numero, mensagem)
+            # A mensagem já foi aceita: um corpo vazio (204) ou que não é JSON não pode virar nova tentativa
+            try:
+                corpo = resposta.json()
+            except ValueError:
+                corpo = None
+            return resposta.status_code, corpo
         else:
-            print(f"DEBUG_WHATSAPP_ERROR: Falha ao enviar mensagem para {numero}. Status: {resposta.status_code}, Erro: {resposta.text}")
+            logger.error("WHATSAPP_ERROR: Falha ao enviar mensagem para %s. Status: %s, Erro: %s", numero, resposta.status_code, resposta.text)
             return resposta.status_code, {"erro": resposta.text}
     except requests.RequestException as e:
-        print(f"DEBUG_WHATSAPP_ERROR: Erro de requisição ao enviar mensagem para {numero}: {e}" )
-        return None, {"erro": f"Erro de requisição ao enviar mensagem: {e}"}
+        logger.error("WHATSAPP_ERROR: Erro de requisição ao enviar mensagem para %s: %s", numero, e)
+        # Erros HTTP (4xx/5xx) mantêm o status, usado para decidir se vale tentar de novo
+        status = e.response.status_code if e.response is not None else None
+        return status, {"erro": f"Erro de requisição ao enviar mensagem: {e}"}
     except Exception as e:
-        print(f"DEBUG_WHATSAPP_ERROR: Erro geral ao enviar mensagem para {numero}: {e}")
+        logger.error("WHATSAPP_ERROR: Erro geral ao enviar mensagem para %s: %s", numero, e)
         return None, {"erro": f"Erro geral ao enviar mensagem: {e}"}
 
+# Função para guardar no banco uma mensagem que não pôde ser enviada (reenviada depois em segundo plano)
+def _dead_letter_whatsapp_message(numero, mensagem, status, erro, attempts):
+    _outbound_delivery_stats.dead_lettered_total += 1
+    conn = get_db_connection()
+    if not conn:
+        logger.error("WHATSAPP_ERROR: Mensagem para %s perdida: sem conexão ao DB para a dead letter: %s", numero, mensagem)
+        return
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO outbound_dead_letters (phone_number, instance, message, last_status, last_error, attempts)
+            VALUES (%s, %s, %s, %s, %s, %s);
+        """, (numero, EVOLUTION_INSTANCE, mensagem, status, erro, attempts))
+        conn.commit()
+        cur.close()
+        logger.warning("WHATSAPP_ERROR: Mensagem para %s guardada na dead letter após %s tentativas (status %s).", numero, attempts, status)
+    except psycopg2.Error as e:
+        logger.error("WHATSAPP_ERROR: Mensagem para %s perdida: erro ao gravar a dead letter: %s: %s", numero, e, mensagem)
+    finally:
+        release_db_connection(conn)
+    _ensure_dead_letter_replayer()
+
+# Função que reenvia um lote de mensagens da dead letter que já podem ser tentadas de novo.
+# As linhas são reservadas (replay_after empurrado para frente, SKIP LOCKED) antes do envio, para
+# que dois workers não reenviem a mesma mensagem. Devolve quantas foram entregues.
+def replay_dead_letters():
+    conn = get_db_connection()
+    if not conn:
+        logger.error("WHATSAPP_ERROR: Conexão ao DB falhou ao reenviar a dead letter.")
+        return 0
+    delivered = 0
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE outbound_dead_letters
+            SET replay_after = CURRENT_TIMESTAMP + make_interval(secs => %s)
+            WHERE id IN (
+                SELECT id FROM outbound_dead_letters
+                WHERE replay_after <= CURRENT_TIMESTAMP AND replays < %s
+                ORDER BY replay_after
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, phone_number, message, replays;
+        """, (OUTBOUND_RETRY_BUDGET_SECONDS + OUTBOUND_DEAD_LETTER_REPLAY_INTERVAL_SECONDS, OUTBOUND_DEAD_LETTER_MAX_REPLAYS, OUTBOUND_DEAD_LETTER_REPLAY_BATCH_SIZE))
+        claimed = sorted(cur.fetchall())
+        conn.commit()
+        for dead_letter_id, numero, mensagem, replays in claimed:
+            delay = _outbound_rate_limiter.reserve(EVOLUTION_INSTANCE, numero)
+            if delay > 0:
+                time.sleep(delay)
+            status, resposta = _post_whatsapp_message(numero, mensagem)
+            if status is not None and 200 <= status < 300:
+                cur.execute("DELETE FROM outbound_dead_letters WHERE id = %s;", (dead_letter_id,))
+                _outbound_delivery_stats.replayed_total += 1
+                delivered += 1
+            elif not is_retryable_send_status(status):
+                # Recusa permanente: não adianta reenviar de novo
+                cur.execute("DELETE FROM outbound_dead_letters WHERE id = %s;", (dead_letter_id,))
+                _outbound_delivery_stats.dropped_total += 1
+                logger.error("WHATSAPP_ERROR: Mensagem da dead letter para %s descartada (status %s).", numero, status)
+            else:
+                # Próxima tentativa cada vez mais espaçada (em múltiplos do intervalo do reenvio)
+                cur.execute("""
+                    UPDATE outbound_dead_letters
+                    SET replays = replays + 1, last_status = %s, last_error = %s,
+                        replay_after = CURRENT_TIMESTAMP + make_interval(secs => %s)
+                    WHERE id = %s;
+                """, (status, resposta.get("erro"), OUTBOUND_DEAD_LETTER_REPLAY_INTERVAL_SECONDS * (2 ** min(replays, 6)), dead_letter_id))
+                _outbound_delivery_stats.replay_failures_total += 1
+            conn.commit()
+        cur.close()
+        if claimed:
+            logger.debug("WHATSAPP: Dead letter: %s de %s mensagens reenviadas.", delivered, len(claimed))
+    except psycopg2.Error as e:
+        logger.error("WHATSAPP_ERROR: Erro ao reenviar a dead letter: %s", e)
+    finally:
+        release_db_connection(conn)
+    return delivered
+
+# Função executada em thread própria: reenvia a dead letter periodicamente
+def _dead_letter_replay_loop():
+    while True:
+        time.sleep(OUTBOUND_DEAD_LETTER_REPLAY_INTERVAL_SECONDS)
+        try:
+            replay_dead_letters()
+        except Exception as e:
+            logger.error("WHATSAPP_ERROR: Erro inesperado ao reenviar a dead letter: %s", e)
+
+# Função para garantir que a thread de reenvio da dead letter está rodando neste processo
+def _ensure_dead_letter_replayer():
+    stats = _outbound_delivery_stats
+    if OUTBOUND_DEAD_LETTER_REPLAY_INTERVAL_SECONDS <= 0 or stats.replayer_pid == os.getpid():
+        return
+    with _db_pool_lock:
+        if stats.replayer_pid != os.getpid():
+            stats.replayer_pid = os.getpid()
+            threading.Thread(target=_dead_letter_replay_loop, name="dead-letter-replayer", daemon=True).start()
+
 # Nova função para formatar a resposta da previsão do tempo
 def format_weather_response(cidade, pais):
     clima_atual = obter_previsao_tempo(cidade, pais)
@@ -486,6 +2650,166 @@ def formatar_resultado_simulacao(dados, resultado):
     return mensagem
 
 
+REPORT_TEXT_ONLY_NOTICE = (
+    "Este é um resumo textual. Se você esperava um relatório em formato de imagem (gráfico), PDF, Word ou Excel, "
+    "informo que, no momento, nosso sistema via WhatsApp só consegue enviar relatórios em texto. "
+    "Para outros formatos, seria necessário acessar nossa plataforma web.\n\n"
+)
+
+
+# Função para montar o relatório de estoque como lista de blocos (cabeçalho, um bloco por item, aviso)
+def build_stock_report(numero):
+    registros_estoque = list_farmer_records(numero, "registros_estoque")
+    if not registros_estoque:
+        return []
+    blocos = ["📊 **Relatório Detalhado de Estoque:** 📊\n\n"]
+    for i, item in enumerate(registros_estoque):
+        blocos.append(
+            f"--- Item {i+1} ---\n"
+            f"Nome: {item.get('nome_item', 'N/A').capitalize()}\n"
+            f"Quantidade: {item.get('quantidade', 'N/A')}\n"
+            f"Data de Entrada: {item.get('data_entrada', 'N/A')}\n"
+            f"Data de Fabricação: {item.get('data_fabricacao', 'N/A')}\n"
+            f"Data de Vencimento: {item.get('data_vencimento', 'N/A')}\n"
+            f"Número de Lote: {item.get('numero_lote', 'N/A')}\n\n"
+        )
+    blocos.append(REPORT_TEXT_ONLY_NOTICE)
+    return blocos
+
+
+# Função para montar o relatório do rebanho (vacinas e vermífugos agrupados por animal numa só passada)
+def build_herd_report(numero):
+    registros_animais = list_farmer_records(numero, "registros_animais")
+    if not registros_animais:
+        return []
+    vacinas_por_animal = {}
+    for vac in list_farmer_records(numero, "registros_vacinacao"):
+        vacinas_por_animal.setdefault(vac.get("animal_id", "").lower(), []).append(vac)
+    vermifugos_por_animal = {}
+    for verm in list_farmer_records(numero, "registros_vermifugacao"):
+        vermifugos_por_animal.setdefault(verm.get("animal_id", "").lower(), []).append(verm)
+
+    blocos = ["📊 **Relatório Detalhado do Rebanho:** 📊\n\n"]
+    for i, animal in enumerate(registros_animais):
+        animal_id = animal.get("animal_id", "N/A")
+        vacinas_animal = vacinas_por_animal.get(animal_id.lower(), [])
+        vermifugos_animal = vermifugos_por_animal.get(animal_id.lower(), [])
+
+        linhas = [f"--- Animal {i+1} ---\n", f"Identificação: {animal_id.capitalize()}\n"]
+        if vacinas_animal:
+            linhas.append("Vacinações:\n")
+            linhas += [f"  - {vac.get('vacina', 'N/A')} em {vac.get('data_vacinacao', 'N/A')}\n" for vac in vacinas_animal]
+        else:
+            linhas.append("Vacinações: Nenhuma registrada.\n")
+        if vermifugos_animal:
+            linhas.append("Vermifugações:\n")
+            linhas += [f"  - {verm.get('vermifugo', 'N/A')} em {verm.get('data_vermifugacao', 'N/A')}\n" for verm in vermifugos_animal]
+        else:
+            linhas.append("Vermifugações: Nenhuma registrada.\n")
+        linhas.append("\n")
+        blocos.append("".join(linhas))
+    blocos.append(REPORT_TEXT_ONLY_NOTICE)
+    return blocos
+
+
+# Função para montar o relatório das simulações de safra
+def build_simulation_report(numero):
+    simulacoes_passadas = list_farmer_records(numero, "simulacoes_passadas")
+    if not simulacoes_passadas:
+        return []
+    blocos = ["📈 **Relatório de Simulações de Safra:** 📈\n\n"]
+    for i, sim in enumerate(simulacoes_passadas):
+        blocos.append(
+            f"--- Simulação {i+1} ---\n"
+            f"Cultura: {sim.get('cultura', 'N/A').capitalize()}\n"
+            f"Área: {sim.get('area', 'N/A')} ha\n"
+            f"Tipo de Solo: {sim.get('tipo_solo', 'N/A').capitalize()}\n"
+            f"Condições Climáticas: {sim.get('condicoes_climaticas', 'N/A').capitalize()}\n"
+            f"Ciclo da Cultura: {sim.get('ciclo_cultura', 'N/A').capitalize()}\n"
+            f"Produtividade Estimada: {sim.get('produtividade_media', 'N/A')} kg/ha\n\n"
+        )
+    blocos.append(REPORT_TEXT_ONLY_NOTICE)
+    return blocos
+
+
+# Relatórios paginados: tipo -> (montagem dos blocos, flag do fluxo, nome do menu de retorno)
+REPORTS = {
+    "estoque": (build_stock_report, "gerar_relatorio_estoque_ativo", "Controle de Estoque"),
+    "rebanho": (build_herd_report, "gerar_relatorio_rebanho_ativo", "Gestão de Rebanho"),
+    "simulacao": (build_simulation_report, "gerar_relatorio_simulacao_ativo", "Simulação de Safra"),
+}
+
+
+# Função para quebrar um bloco maior que uma página (por linhas; só uma linha gigante é cortada)
+def _split_report_block(bloco, max_chars):
+    pedacos, atual = [], ""
+    for linha in bloco.splitlines(keepends=True):
+        while len(linha) > max_chars:
+            if atual:
+                pedacos.append(atual)
+                atual = ""
+            pedacos.append(linha[:max_chars])
+            linha = linha[max_chars:]
+        if len(atual) + len(linha) > max_chars:
+            pedacos.append(atual)
+            atual = ""
+        atual += linha
+    if atual:
+        pedacos.append(atual)
+    return pedacos
+
+
+# Função para dividir os blocos de um relatório em páginas de até max_chars caracteres, sempre
+# entre blocos (um registro nunca fica dividido entre duas páginas se couber numa só)
+def paginate_report(blocos, max_chars=None):
+    max_chars = max_chars or REPORT_PAGE_MAX_CHARS
+    paginas, atual, tamanho = [], [], 0
+    for bloco in blocos:
+        for pedaco in ([bloco] if len(bloco) <= max_chars else _split_report_block(bloco, max_chars)):
+            if atual and tamanho + len(pedaco) > max_chars:
+                paginas.append("".join(atual).rstrip())
+                atual, tamanho = [], 0
+            if not atual:
+                pedaco = pedaco.lstrip("\n")
+            atual.append(pedaco)
+            tamanho += len(pedaco)
+    if atual:
+        paginas.append("".join(atual))
+    return paginas
+
+
+# Função para responder com as páginas de um relatório a partir de `pagina`. Todas as páginas
+# menos a última vão em balões separados; a última é devolvida para o fluxo enviar junto com o
+# restante da resposta. Se sobrarem páginas, guarda no contexto de onde continuar quando o usuário
+# enviar "mais". Devolve None quando não há registros para o relatório.
+def report_reply(numero, contexto, tipo, pagina=0):
+    build, _, menu = REPORTS[tipo]
+    blocos = build(numero)
+    if not blocos:
+        contexto["relatorio_continuacao"] = None
+        return None
+    blocos.append(
+        f"\n\nDeseja voltar ao menu de {menu}? (Responda 'sim' ou 'não')\n"
+        "(Ou 'voltar' para o menu anterior, ou 'menu' para o principal)"
+    )
+    paginas = paginate_report(blocos)
+    inicio = min(pagina, len(paginas) - 1)
+    fim = inicio + REPORT_PAGES_PER_REPLY
+    if fim >= len(paginas):
+        contexto["relatorio_continuacao"] = None
+        for texto in paginas[inicio:-1]:
+            send_whatsapp_message(numero, texto, separate_bubble=True)
+        return paginas[-1]
+    contexto["relatorio_continuacao"] = {"tipo": tipo, "pagina": fim}
+    for texto in paginas[inicio:fim]:
+        send_whatsapp_message(numero, texto, separate_bubble=True)
+    logger.debug("FLOW: Relatório '%s' de %s: páginas %s a %s de %s enviadas.", tipo, numero, inicio + 1, fim, len(paginas))
+    return (
+        f"📄 Páginas {inicio + 1} a {fim} de {len(paginas)}. Envie 'mais' para ver a continuação do relatório.\n"
+        f"(Ou responda 'sim' para voltar ao menu de {menu}, 'não' para encerrar, ou 'menu' para o principal)"
+    )
+
+
 # Rota para chat com reconhecimento de perguntas sobre localização e clima
 @app.route("/chat", methods=["POST"])
 def chat():
@@ -534,16 +2858,16 @@ def chat():
             )
             resposta = response.choices[0].message.content.strip()
         except openai.APIError as e:
-            print(f"DEBUG_OPENAI_ERROR: Erro na API do OpenAI: {e}")
+            logger.error("OPENAI_ERROR: Erro na API do OpenAI: %s", e)
             resposta = "Desculpe, a API do OpenAI está temporariamente indisponível."
         except Exception as e:
-            print(f"DEBUG_OPENAI_ERROR: Erro ao chamar OpenAI: {e}")
+            logger.error("OPENAI_ERROR: Erro ao chamar OpenAI: %s", e)
             resposta = "Desculpe, tive um problema ao processar sua mensagem."
 
         return jsonify({"resposta": resposta})
 
     except Exception as e:
-        print(f"DEBUG_CHAT_ERROR: Erro inesperado na rota /chat: {e}")
+        logger.error("CHAT_ERROR: Erro inesperado na rota /chat: %s", e)
         return jsonify({"erro": str(e)}), 500
 
 
@@ -584,7 +2908,7 @@ def salvar_planilha():
         wb.save(arquivo)
         return jsonify({"arquivo_criado": arquivo})
     except Exception as e:
-        print(f"DEBUG_PLANILHA_ERROR: Erro ao salvar planilha: {e}")
+        logger.error("PLANILHA_ERROR: Erro ao salvar planilha: %s", e)
         return jsonify({"erro": str(e)}), 500
 
 
@@ -594,27 +2918,91 @@ def home():
     return "API Campo Inteligente está online!"
 
 
+# Rota com métricas internas do processo (ex: uso do pool de conexões)
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify({
+        "pid": os.getpid(),
+        "db_pool": get_db_pool_stats(),
+        "context_cache": conversa_contextos.stats(),
+        "conversation_locks": _conversation_locks.stats(),
+        "context_sweeper": _context_sweeper_stats.as_dict(),
+        "logging": get_logging_stats(),
+        "webhook_filter": _webhook_filter_stats.as_dict(),
+        "webhook_bursts": _webhook_bursts.stats(),
+        "webhook_queue": _webhook_queue.stats(),
+        "webhook_dedup": _webhook_dedup_stats.as_dict(),
+        "outbound_queue": _outbound_queue.stats(),
+        "reply_buffer": _reply_buffer_stats.as_dict(),
+        "outbound_delivery": _outbound_delivery_stats.as_dict(),
+        "outbound_rate_limiter": _outbound_rate_limiter.stats()
+    })
+
+
+# Função para verificar, no próprio contexto já carregado, se todos os campos obrigatórios estão preenchidos
+# (mesma regra do "context->>'campo' IS NOT NULL" usado no banco)
+def is_registration_complete(context):
+    return registration_fields_mask(context) == REGISTRATION_COMPLETE_MASK
+
+# Função para calcular a bitmask dos campos obrigatórios já respondidos (bit i = MANDATORY_REGISTRATION_FIELDS[i])
+def registration_fields_mask(context):
+    mask = 0
+    for bit, field in enumerate(MANDATORY_REGISTRATION_FIELDS):
+        if context.get(field) is not None:
+            mask |= 1 << bit
+    return mask
+
+# Função para carregar o contexto e o status de cadastro do usuário com uma única leitura
+def load_conversation_state(phone_number):
+    context = load_conversation_context(phone_number)
+    return context, is_registration_complete(context)
+
+# Status materializado a cada gravação do contexto (busca pela chave primária)
+REGISTRATION_STATUS_SQL = "SELECT registration_complete FROM conversation_contexts WHERE phone_number = %s;"
+REGISTRATION_STATUS_STATEMENT = PreparedStatement("registration_status", REGISTRATION_STATUS_SQL)
+
 # Função para verificar se o usuário está cadastrado no banco de dados
 def is_user_registered(phone_number):
     conn = get_db_connection()
     if conn:
         try:
             cur = conn.cursor()
-            # Verifica se o contexto do usuário possui TODAS as chaves de cadastro obrigatórias preenchidas
-            where_clauses = [f"context->>'{field}' IS NOT NULL" for field in MANDATORY_REGISTRATION_FIELDS]
-            query = f"SELECT 1 FROM conversation_contexts WHERE phone_number = %s AND {' AND '.join(where_clauses)};"
-            cur.execute(query, (phone_number,))
+            REGISTRATION_STATUS_STATEMENT.execute(cur, (phone_number,))
             result = cur.fetchone()
             cur.close()
-            return result is not None
+            return bool(result and result[0])
         except psycopg2.Error as e:
-            print(f"DEBUG_REGISTRATION_ERROR: Erro ao verificar cadastro do usuário: {e}")
+            logger.error("REGISTRATION_ERROR: Erro ao verificar cadastro do usuário: %s", e)
             return False
         finally:
             if conn:
-                conn.close()
+                release_db_connection(conn)
     return False
 
+# Função para listar os produtores cadastrados de um município (usa o índice parcial de cadastrados);
+# usada pelo relatório "python chatbot.py list-farmers <municipio>"
+def list_registered_farmers(municipio):
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT phone_number, context->>'nome_completo'
+                FROM conversation_contexts
+                WHERE registration_complete AND lower(context->>'municipio') = lower(%s)
+                ORDER BY phone_number;
+            """, (municipio,))
+            result = cur.fetchall()
+            cur.close()
+            return [{"phone_number": phone_number, "nome_completo": nome} for phone_number, nome in result]
+        except psycopg2.Error as e:
+            logger.error("REGISTRATION_ERROR: Erro ao listar produtores cadastrados de %s: %s", municipio, e)
+            return []
+        finally:
+            if conn:
+                release_db_connection(conn)
+    return []
+
 # Funções de validação de CPF e RG (básicas)
 def is_valid_cpf(cpf_number):
     # Remove non-digits
@@ -692,28 +3080,414 @@ def get_next_registration_question_key(contexto):
     return None # All questions answered
 
 
-# Rota do webhook para receber e responder mensagens
+# Contadores do pré-filtro do webhook (eventos que o bot não trata, respondidos antes de qualquer I/O)
+class WebhookFilterStats:
+    def __init__(self):
+        self.received_total = 0
+        self.filtered_total = 0
+        self.filtered_by_reason = {}
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def record(self, reason):
+        with self._lock:
+            self.received_total += 1
+            if reason is not None:
+                self.filtered_total += 1
+                self.filtered_by_reason[reason] = self.filtered_by_reason.get(reason, 0) + 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "received_total": self.received_total,
+                "filtered_total": self.filtered_total,
+                "filtered_share": round(self.filtered_total / self.received_total, 4) if self.received_total else 0.0,
+                "filtered_by_reason": dict(self.filtered_by_reason),
+            }
+
+
+_webhook_filter_stats = WebhookFilterStats()
+
+
+# Função para classificar o evento só pelo payload: devolve o motivo para ignorá-lo, ou None se o bot
+# deve processá-lo (mensagem de texto recebida de uma conversa individual)
+def webhook_filter_reason(data):
+    if data.get('event') != 'messages.upsert':
+        return "evento_nao_tratado"
+    payload = data.get('data')
+    if not isinstance(payload, dict):
+        return "sem_dados"
+    key = payload.get('key') or {}
+    if key.get('fromMe'):
+        return "enviada_pelo_bot"
+    numero = key.get('remoteJid') or ''
+    if not numero:
+        return "sem_remetente"
+    if numero.endswith('@g.us'):
+        return "grupo"
+    if numero.endswith('@broadcast'):
+        return "status_ou_transmissao"
+    if not ((payload.get('message') or {}).get('conversation') or '').strip():
+        return "sem_texto"
+    return None
+
+# Ids de eventos vistos recentemente por este processo (ordem de chegada = ordem de expiração)
+class RecentEventIds:
+    def __init__(self, max_size, ttl_seconds):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._ids = OrderedDict() # id -> instante em que expira
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    # Registra o id; devolve False se ele já foi visto e ainda não expirou
+    def add(self, event_id):
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._ids.get(event_id)
+            if expires_at is not None and expires_at > now:
+                return False
+            self._ids[event_id] = now + self.ttl_seconds
+            self._ids.move_to_end(event_id)
+            while self._ids and (len(self._ids) > self.max_size or next(iter(self._ids.values())) <= now):
+                self._ids.popitem(last=False)
+            return True
+
+    def discard(self, event_id):
+        with self._lock:
+            self._ids.pop(event_id, None)
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class WebhookDedupStats:
+    def __init__(self):
+        self.memory_duplicates_total = 0
+        self.db_duplicates_total = 0
+        self.claimed_total = 0
+        self.released_total = 0
+
+    def as_dict(self):
+        return {
+            "memory_ids": len(_recent_webhook_events),
+            "memory_duplicates_total": self.memory_duplicates_total,
+            "db_duplicates_total": self.db_duplicates_total,
+            "claimed_total": self.claimed_total,
+            "released_total": self.released_total,
+        }
+
+
+_recent_webhook_events = RecentEventIds(WEBHOOK_DEDUP_MEMORY_SIZE, WEBHOOK_DEDUP_TTL_SECONDS)
+_webhook_dedup_stats = WebhookDedupStats()
+
+CLAIM_WEBHOOK_EVENTS_STATEMENT = PreparedStatement(
+    "claim_webhook_events",
+    "INSERT INTO processed_webhook_events (event_id, phone_number) SELECT unnest(%s::text[]), %s ON CONFLICT (event_id) DO NOTHING RETURNING event_id;"
+)
+
+# Função para o id da mensagem do WhatsApp (data.key.id) de um evento messages.upsert
+def webhook_event_id(data):
+    if data.get('event') != 'messages.upsert':
+        return None
+    return ((data.get('data') or {}).get('key') or {}).get('id') or None
+
+# Função para todos os ids de um evento (um evento agrupado de uma rajada leva os ids das outras mensagens)
+def webhook_event_ids(data):
+    event_id = webhook_event_id(data)
+    if event_id is None:
+        return []
+    return [event_id] + data['data']['key'].get('coalescedIds', [])
+
+# Função para registrar no banco que os eventos vão ser processados. Devolve False se outro worker (ou
+# uma entrega anterior) já registrou todos os ids. Sem banco, o evento é tentado de novo mais tarde.
+def claim_webhook_events(event_ids, numero):
+    conn = get_db_connection()
+    if not conn:
+        raise DatabaseUnavailableError(f"Sem conexão com o banco de dados para registrar os eventos {event_ids}.")
+    try:
+        cur = conn.cursor()
+        CLAIM_WEBHOOK_EVENTS_STATEMENT.execute(cur, (event_ids, numero))
+        claimed = bool(cur.fetchall())
+        conn.commit()
+        cur.close()
+    except psycopg2.Error as e:
+        logger.error("WEBHOOK_ERROR: Erro ao registrar os eventos %s: %s", event_ids, e)
+        raise DatabaseUnavailableError(f"Erro ao registrar os eventos {event_ids}: {e}") from e
+    finally:
+        release_db_connection(conn)
+    if claimed:
+        _webhook_dedup_stats.claimed_total += 1
+    else:
+        _webhook_dedup_stats.db_duplicates_total += 1
+    return claimed
+
+# Função para desfazer o registro de eventos cujo processamento falhou (o reenvio volta a ser aceito)
+def release_webhook_events(event_ids):
+    for event_id in event_ids:
+        _recent_webhook_events.discard(event_id)
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM processed_webhook_events WHERE event_id = ANY(%s);", (event_ids,))
+        conn.commit()
+        cur.close()
+        _webhook_dedup_stats.released_total += len(event_ids)
+    except psycopg2.Error as e:
+        logger.error("WEBHOOK_ERROR: Erro ao liberar os eventos %s: %s", event_ids, e)
+    finally:
+        release_db_connection(conn)
+
+# Rota do webhook para receber e responder mensagens. O evento é só validado e colocado na fila do
+# número (processamento em segundo plano, na ordem de chegada); a Evolution API recebe 200 na hora,
+# ou 503 se a fila estiver cheia (para reenviar depois)
 @app.route("/webhook", methods=["POST"])
 def webhook_route():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        logger.debug("WEBHOOK_END: Corpo da requisição não é um JSON válido.")
+        return jsonify({"status": "erro", "mensagem": "JSON inválido."}), 400
+    # Eventos que o bot não trata (ecos das nossas mensagens, grupos, status, mídia sem texto, outros
+    # eventos) recebem 200 na hora, sem tocar no banco: um erro faria a Evolution API reenviá-los
+    reason = webhook_filter_reason(data)
+    _webhook_filter_stats.record(reason)
+    if reason is not None:
+        return jsonify({"status": "ignorado", "motivo": reason}), 200
+    numero = data['data']['key']['remoteJid']
+    # Reenvio de um evento que este processo já aceitou: confirma sem processar de novo
+    event_id = webhook_event_id(data)
+    if event_id and not _recent_webhook_events.add(event_id):
+        _webhook_dedup_stats.memory_duplicates_total += 1
+        logger.debug("WEBHOOK_END: Evento %s de %s repetido; ignorado.", event_id, numero)
+        return jsonify({"status": "duplicado"}), 200
+    if WEBHOOK_WORKER_THREADS <= 0:
+        return process_conversation_event(numero, data)
+    if WEBHOOK_BURST_WINDOW_MS > 0 and _webhook_bursts.add(numero, data):
+        return jsonify({"status": "recebido"}), 200
+    if not _webhook_queue.put(numero, data):
+        if event_id:
+            _recent_webhook_events.discard(event_id)
+        logger.error("WEBHOOK_ERROR: Fila de webhooks cheia; evento de %s recusado.", numero)
+        response = jsonify({"status": "erro", "mensagem": "Fila de processamento cheia, tente novamente."})
+        response.headers["Retry-After"] = "1"
+        return response, 503
+    return jsonify({"status": "recebido"}), 200
+
+# Função que processa o evento de um número segurando o lock da conversa (uma mensagem por vez
+# para cada número, também entre workers diferentes do gunicorn). O id do evento é registrado no
+# banco antes de tocar no contexto; se o processamento falhar, o registro é desfeito.
+def process_conversation_event(numero, data):
+    event_ids = webhook_event_ids(data)
     try:
-        data = request.json
-        print(f"--- Webhook recebido ---")
-        print(f"Dados recebidos: {data}")
+        with conversation_lock(numero):
+            if event_ids and not claim_webhook_events(event_ids, numero):
+                logger.debug("WEBHOOK_END: Evento %s de %s já processado; ignorado.", event_ids[0], numero)
+                return jsonify({"status": "duplicado"}), 200
+            response = process_webhook_message(data)
+            status = response[1] if isinstance(response, tuple) else response.status_code
+            if event_ids and status >= 500:
+                release_webhook_events(event_ids)
+            return response
+    except (ConversationLockError, DatabaseUnavailableError) as e:
+        logger.error("WEBHOOK_ERROR: %s", e)
+        # O evento não foi processado (nada foi gravado nem enviado): um reenvio precisa ser aceito
+        if isinstance(e, DatabaseUnavailableError) and event_ids:
+            release_webhook_events(event_ids)
+        for event_id in event_ids:
+            _recent_webhook_events.discard(event_id)
+        return jsonify({"status": "erro", "mensagem": str(e)}), 503
+
+WEBHOOK_UNAVAILABLE_REPLY = "Desculpe, estou com uma instabilidade no momento e não consegui processar sua mensagem. 😔 Por favor, envie novamente em alguns instantes."
+
+# Função executada pelas threads da fila de webhooks. Se o lock da conversa ou uma conexão do banco não
+# vier a tempo (outro worker ainda processando o mesmo número, pool esgotado), tenta de novo antes de
+# desistir do evento, esperando um pouco mais a cada tentativa.
+def _process_queued_webhook_event(numero, data):
+    with app.app_context():
+        attempts = max(WEBHOOK_LOCK_ATTEMPTS, 1)
+        for attempt in range(1, attempts + 1):
+            response = process_conversation_event(numero, data)
+            status = response[1] if isinstance(response, tuple) else response.status_code
+            if status != 503:
+                break
+            logger.warning("WEBHOOK_ERROR: Evento de %s não processado, lock ou banco indisponível (tentativa %s).", numero, attempt)
+            if attempt < attempts:
+                time.sleep(attempt)
+    if status >= 500:
+        logger.error("WEBHOOK_ERROR: Evento de %s terminou com status %s.", numero, status)
+    if status == 503:
+        # A Evolution API já recebeu 200 e não vai reenviar: o usuário precisa saber que a mensagem se perdeu
+        send_whatsapp_message(numero, WEBHOOK_UNAVAILABLE_REPLY)
+
+
+_webhook_queue = KeyedWorkQueue("webhook", _process_queued_webhook_event, WEBHOOK_WORKER_THREADS, WEBHOOK_QUEUE_MAX_PENDING)
+
+
+# Rajadas de mensagens de um mesmo número: a primeira mensagem espera a janela; cada nova mensagem
+# dentro dela entra na rajada e adia o envio para a fila (até o tempo máximo de espera). Ao fechar,
+# a rajada vira um único evento com os textos unidos por espaço e os ids de todas as mensagens.
+class WebhookBurstCoalescer:
+    def __init__(self, window_seconds, max_hold_seconds, dispatch):
+        self.window_seconds = window_seconds
+        self.max_hold_seconds = max(max_hold_seconds, window_seconds)
+        self.dispatch = dispatch
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._bursts = {} # número -> {"events": [...], "first_at": ..., "deadline": ...}
+        self._thread_pid = None
+        self.bursts_total = 0
+        self.coalesced_total = 0
+        self.requeued_total = 0
+
+    def _ensure_thread(self):
+        if self._thread_pid != os.getpid():
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._loop, name="webhook-bursts", daemon=True).start()
+
+    # Coloca o evento na rajada do número. Devolve False (sem guardar) se a rajada seria nova e a
+    # fila de processamento já está cheia, para a rota responder 503
+    def add(self, numero, data):
+        now = time.monotonic()
+        with self._lock:
+            burst = self._bursts.get(numero)
+            if burst is None:
+                queue = _webhook_queue
+                if queue.max_pending and queue.pending + len(self._bursts) >= queue.max_pending:
+                    return False
+                self._ensure_thread()
+                self._bursts[numero] = {"events": [data], "first_at": now, "deadline": now + self.window_seconds}
+                self.bursts_total += 1
+            else:
+                burst["events"].append(data)
+                burst["deadline"] = min(now + self.window_seconds, burst["first_at"] + self.max_hold_seconds)
+                self.coalesced_total += 1
+            self._wakeup.notify()
+        return True
+
+    # Função para montar o evento único da rajada (o último evento, com o texto de todos)
+    @staticmethod
+    def merge(events):
+        if len(events) == 1:
+            return events[0]
+        merged = dict(events[-1])
+        merged['data'] = dict(merged['data'])
+        merged['data']['message'] = {"conversation": " ".join(e['data']['message']['conversation'].strip() for e in events)}
+        event_ids = [event_id for e in events for event_id in webhook_event_ids(e)]
+        merged['data']['key'] = dict(merged['data']['key'], id=event_ids[0], coalescedIds=event_ids[1:])
+        return merged
+
+    def _take_due(self, flush_all=False):
+        now = time.monotonic()
+        due = [numero for numero, burst in self._bursts.items() if flush_all or burst["deadline"] <= now]
+        return [(numero, self._bursts.pop(numero)) for numero in due]
+
+    def _dispatch(self, ready):
+        for numero, burst in ready:
+            if self.dispatch(numero, self.merge(burst["events"])):
+                continue
+            # Fila cheia: a rajada volta a esperar (na frente das mensagens que chegaram depois)
+            with self._lock:
+                self.requeued_total += 1
+                newer = self._bursts.get(numero)
+                if newer is not None:
+                    burst["events"] += newer["events"]
+                burst["deadline"] = time.monotonic() + self.window_seconds
+                self._bursts[numero] = burst
+            logger.warning("WEBHOOK_ERROR: Fila de webhooks cheia; rajada de %s aguardando.", numero)
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                ready = self._take_due()
+                while not ready:
+                    next_deadline = min((burst["deadline"] for burst in self._bursts.values()), default=None)
+                    self._wakeup.wait(None if next_deadline is None else max(next_deadline - time.monotonic(), 0))
+                    ready = self._take_due()
+            self._dispatch(ready)
+
+    # Envia para a fila todas as rajadas abertas (ex: ao encerrar o worker)
+    def flush(self):
+        with self._lock:
+            ready = self._take_due(flush_all=True)
+        self._dispatch(ready)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "window_ms": self.window_seconds * 1000,
+                "open_bursts": len(self._bursts),
+                "bursts_total": self.bursts_total,
+                "coalesced_total": self.coalesced_total,
+                "requeued_total": self.requeued_total,
+            }
+
+
+_webhook_bursts = WebhookBurstCoalescer(WEBHOOK_BURST_WINDOW_MS / 1000, WEBHOOK_BURST_MAX_HOLD_MS / 1000, _webhook_queue.put)
+
+
+# Função para esperar os eventos já aceitos serem processados (ex: ao encerrar o worker). Registrada
+# depois da fila de envio, roda antes dela no atexit: as respostas geradas ainda são enviadas.
+def drain_webhook_events(timeout=WEBHOOK_DRAIN_TIMEOUT_SECONDS):
+    _webhook_bursts.flush()
+    if _webhook_queue.pending and not _webhook_queue.drain(timeout):
+        logger.error("WEBHOOK_ERROR: %s eventos ainda na fila ao encerrar o processo.", _webhook_queue.pending)
+
+
+atexit.register(drain_webhook_events)
+
+# Função que processa a mensagem dentro de uma unidade de trabalho de contexto
+def process_webhook_message(data):
+    # Todas as alterações de contexto feitas durante a mensagem são gravadas de uma vez ao final,
+    # e só então as respostas acumuladas são enviadas
+    with context_unit_of_work() as uow, reply_buffer() as replies:
+        response = handle_webhook_event(data)
+        try:
+            uow.flush()
+        except DatabaseUnavailableError:
+            # Nada foi gravado e as respostas ficam no buffer descartado: o evento é processado de novo
+            raise
+        except Exception as e:
+            logger.error("WEBHOOK_FLUSH_ERROR: Erro ao gravar o contexto da conversa: %s", e)
+            replies.discard()
+            resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
+            for numero in uow.pending_phone_numbers():
+                send_whatsapp_message(numero, resposta)
+            replies.release()
+            return jsonify({"status": "erro", "resposta": resposta}), 500
+        replies.release()
+    return response
+
+# Função que processa um evento recebido pelo webhook
+def handle_webhook_event(data):
+    try:
+        logger.debug("--- Webhook recebido ---")
+        logger.debug("Dados recebidos: %s", data)
         event = data.get('event')
 
         if event == 'messages.upsert':
             mensagem_recebida = data.get('data', {}).get('message', {}).get('conversation', '').lower()
             numero = data.get('data', {}).get('key', {}).get('remoteJid', '')
 
-            print(f"DEBUG_WEBHOOK_START: Mensagem recebida de {numero}: '{mensagem_recebida}'")
+            logger.debug("WEBHOOK_START: Mensagem recebida de %s: '%s'", numero, mensagem_recebida)
 
             if mensagem_recebida and numero:
-                # Carrega o contexto da conversa do banco de dados
-                contexto = load_conversation_context(numero)
-                print(f"DEBUG_WEBHOOK_START: Contexto carregado para {numero} no início do webhook: {contexto}")
+                # Carrega o contexto da conversa e o status de cadastro com uma única leitura do banco
+                contexto, usuario_cadastrado = load_conversation_state(numero)
+                logger.debug("WEBHOOK_START: Contexto carregado para %s no início do webhook: %s", numero, contexto)
                 
                 # --- Definições iniciais para evitar erros de variável não definida ---
-                usuario_cadastrado = is_user_registered(numero)
                 cadastro_opcao_texto = "Editar dados de cadastro" if usuario_cadastrado else "Cadastra-se"
                 nome = contexto.get("nome_completo", "Usuário") # Get user's name, default to "Usuário"
                 # --- Fim das definições iniciais ---
@@ -783,25 +3557,12 @@ def webhook_route():
                 consulta_estoque_ativa = contexto.get("consulta_estoque_ativa", False)
 
 
-                # Para armazenar os registros (simulado)
-                registros_vacinacao = contexto.get("registros_vacinacao", [])
-                contexto["registros_vacinacao"] = registros_vacinacao
-                registros_vermifugacao = contexto.get("registros_vermifugacao", [])
-                contexto["registros_vermifugacao"] = registros_vermifugacao
-                registros_animais = contexto.get("registros_animais", [])
-                contexto["registros_animais"] = registros_animais
-                registros_reprodutivos = contexto.get("registros_reprodutivos", [])
-                contexto["registros_reprodutivos"] = registros_reprodutivos
-                historico_pesagens = contexto.get("historico_pesagens", [])
-                contexto["historico_pesagens"] = historico_pesagens
-                registros_estoque = contexto.get("registros_estoque", [])
-                contexto["registros_estoque"] = registros_estoque
-                simulacoes_passadas = contexto.get("simulacoes_passadas", [])
-                contexto["simulacoes_passadas"] = simulacoes_passadas
+                # Os registros (estoque, rebanho, simulações) ficam em tabelas próprias e são lidos
+                # com list_farmer_records() apenas nos fluxos que precisam deles
 
                 # Novo flag para o fluxo de boas-vindas inicial
                 initial_greeting_step = contexto.get("initial_greeting_step", None)
-                print(f"DEBUG_INITIAL_GREETING_CHECK: initial_greeting_step antes da lógica de saudação: {initial_greeting_step}")
+                logger.debug("INITIAL_GREETING_CHECK: initial_greeting_step antes da lógica de saudação: %s", initial_greeting_step)
 
                 # Flags para edição de cadastro
                 editing_registration = contexto.get("editing_registration", False)
@@ -823,61 +3584,9 @@ def webhook_route():
                 # --- Lógica de Timeout da Conversa (mantém no topo) ---
                 # Se a última interação foi há mais de CONVERSATION_TIMEOUT_SECONDS, reinicia o fluxo
                 if (current_time - last_interaction_time) > CONVERSATION_TIMEOUT_SECONDS:
-                    print(f"DEBUG_TIMEOUT: Timeout detectado para {numero}. Reiniciando o fluxo da conversa.")
-                    # Reset all relevant flags to ensure a clean return to the main menu
-                    contexto["awaiting_continuation_choice"] = False
-                    contexto["awaiting_weather_follow_up_choice"] = False
-                    contexto["awaiting_menu_return_prompt"] = False
-                    contexto["awaiting_weather_location"] = False
-                    contexto["registration_step"] = None
-                    contexto["editing_registration"] = False
-                    contexto["awaiting_field_to_edit"] = False
-                    contexto["current_editing_field"] = None
-                    contexto["awaiting_post_completion_response"] = False
-                    contexto["simulacao_safra_ativa"] = False
-                    contexto["etapa_simulacao"] = None
-                    contexto["dados_simulacao"] = {}
-                    contexto["awaiting_safra_finalizacao"] = False
-                    contexto["simulacao_sub_fluxo"] = None
-                    contexto["gerar_relatorio_simulacao_ativo"] = False
-                    contexto["gestao_rebanho_ativo"] = False
-                    contexto["gestao_rebanho_sub_fluxo"] = None
-                    contexto["gerar_relatorio_rebanho_ativo"] = False
-                    contexto["vacinacao_vermifugacao_ativo"] = False
-                    contexto["vacinacao_vermifugacao_opcao"] = None
-                    contexto["registro_vacinacao_etapa"] = None
-                    contexto["dados_vacinacao_registro"] = {}
-                    contexto["consulta_vacinacao_ativa"] = False
-                    contexto["awaiting_animal_id_consulta_vac"] = False
-                    contexto["registro_vermifugacao_etapa"] = None
-                    contexto["dados_vermifugacao_registro"] = {}
-                    contexto["consulta_vermifugacao_ativa"] = False
-                    contexto["awaiting_animal_id_consulta_verm"] = False
-                    contexto["lembretes_vacinacao_ativa"] = False
-                    contexto["awaiting_lembretes_contato"] = False
-                    contexto["cadastro_animal_ativo"] = False
-                    contexto["registro_animal_etapa"] = None
-                    contexto["dados_animal_registro"] = {}
-                    contexto["controle_reprodutivo_ativo"] = False
-                    contexto["historico_pesagens_ativo"] = False
-                    contexto["controle_estoque_ativo"] = False
-                    contexto["controle_estoque_sub_fluxo"] = None
-                    contexto["gerar_relatorio_estoque_ativo"] = False
-                    contexto["registro_entrada_estoque_ativo"] = False
-                    contexto["registro_entrada_estoque_etapa"] = None
-                    contexto["dados_entrada_estoque_registro"] = {}
-                    contexto["registro_saida_estoque_ativo"] = False
-                    contexto["registro_saida_estoque_etapa"] = None
-                    contexto["dados_saida_estoque_registro"] = {}
-                    contexto["consulta_estoque_ativa"] = False
-                    contexto["initial_greeting_step"] = None # Reset initial greeting step on timeout
-                    # Reset optional question flags
-                    contexto["awaiting_email_choice"] = False
-                    contexto["email_choice_made"] = False
-                    contexto["awaiting_email_value_input"] = False
-                    contexto["awaiting_ponto_referencia_choice"] = False
-                    contexto["ponto_referencia_choice_made"] = False
-                    contexto["awaiting_ponto_referencia_value_input"] = False
+                    logger.debug("TIMEOUT: Timeout detectado para %s. Reiniciando o fluxo da conversa.", numero)
+                    # Limpa todas as flags dos fluxos (inclusive a etapa da saudação): volta ao menu principal
+                    reset_conversation_flow_state(contexto)
 
 
                     resposta = (
@@ -886,25 +3595,25 @@ def webhook_route():
                     contexto["last_interaction_time"] = current_time # Update timestamp
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_TIMEOUT: Contexto salvo após timeout: {contexto}")
+                        logger.debug("TIMEOUT: Contexto salvo após timeout: %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_TIMEOUT_SAVE_ERROR: Erro ao salvar contexto após timeout: {e}")
-                    print(f"DEBUG_TIMEOUT: Resposta gerada (timeout reset): {resposta}")
+                        logger.error("TIMEOUT_SAVE_ERROR: Erro ao salvar contexto após timeout: %s", e)
+                    logger.debug("TIMEOUT: Resposta gerada (timeout reset): %s", resposta)
                     send_status, send_resp = send_whatsapp_message(numero, resposta)
-                    print(f"DEBUG_TIMEOUT: Resultado do envio (timeout reset): Status={send_status}, Resposta={send_resp}")
+                    logger.debug("TIMEOUT: Resultado do envio (timeout reset): Status=%s, Resposta=%s", send_status, send_resp)
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 # Atualiza o timestamp da última interação para qualquer mensagem recebida
                 contexto["last_interaction_time"] = current_time
                 try:
                     save_conversation_context(numero, contexto)
-                    print(f"DEBUG_WEBHOOK_START: Contexto salvo após atualização de timestamp: {contexto}")
+                    logger.debug("WEBHOOK_START: Contexto salvo após atualização de timestamp: %s", contexto)
                 except Exception as e:
-                    print(f"DEBUG_WEBHOOK_START_SAVE_ERROR: Erro ao salvar contexto após atualização de timestamp: {e}")
+                    logger.error("WEBHOOK_START_SAVE_ERROR: Erro ao salvar contexto após atualização de timestamp: %s", e)
 
                 # --- Adicionado: Verificação de usuário cadastrado para pular o fluxo de boas-vindas ---
                 if usuario_cadastrado and initial_greeting_step != "completed":
-                    print(f"DEBUG_REGISTERED_USER: Usuário {numero} já cadastrado. Pulando fluxo de saudação inicial.")
+                    logger.debug("REGISTERED_USER: Usuário %s já cadastrado. Pulando fluxo de saudação inicial.", numero)
                     contexto["initial_greeting_step"] = "completed"
                     nome = contexto.get("nome_completo", "Usuário")
                     cadastro_opcao_texto = "Editar dados de cadastro"
@@ -923,9 +3632,9 @@ def webhook_route():
                     )
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_REGISTERED_USER: Contexto salvo após pular saudação: {contexto}")
+                        logger.debug("REGISTERED_USER: Contexto salvo após pular saudação: %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_REGISTERED_USER_SAVE_ERROR: Erro ao salvar contexto para usuário cadastrado: {e}")
+                        logger.error("REGISTERED_USER_SAVE_ERROR: Erro ao salvar contexto para usuário cadastrado: %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -934,7 +3643,7 @@ def webhook_route():
 
                 # --- Handle explicit "voltar" or "menu" command (resets all flows and goes to main menu) ---
                 if ("voltar" in mensagem_recebida or "menu" in mensagem_recebida or "opções" in mensagem_recebida):
-                    print(f"DEBUG_COMMAND: Comando 'voltar'/'menu' detectado. Resetando fluxos.")
+                    logger.debug("COMMAND: Comando 'voltar'/'menu' detectado. Resetando fluxos.")
                     # Reset all relevant flags to ensure a clean return to the main menu
                     contexto["awaiting_continuation_choice"] = False
                     contexto["awaiting_weather_follow_up_choice"] = False
@@ -1006,18 +3715,18 @@ def webhook_route():
                     )
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_COMMAND: Contexto salvo após comando 'voltar'/'menu': {contexto}")
+                        logger.debug("COMMAND: Contexto salvo após comando 'voltar'/'menu': %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_COMMAND_SAVE_ERROR: Erro ao salvar contexto após comando 'voltar'/'menu': {e}")
-                    print(f"DEBUG_COMMAND: Resposta gerada (retorno forçado ao menu principal): {resposta}")
+                        logger.error("COMMAND_SAVE_ERROR: Erro ao salvar contexto após comando 'voltar'/'menu': %s", e)
+                    logger.debug("COMMAND: Resposta gerada (retorno forçado ao menu principal): %s", resposta)
                     send_status, send_resp = send_whatsapp_message(numero, resposta)
-                    print(f"DEBUG_COMMAND: Resultado do envio (retorno forçado ao menu principal): Status={send_status}, Resposta={send_resp}")
+                    logger.debug("COMMAND: Resultado do envio (retorno forçado ao menu principal): Status=%s, Resposta=%s", send_status, send_resp)
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 # --- Handle Location Message (highest priority, as it's a specific message type) ---
                 location_message = data.get('data', {}).get('message', {}).get('locationMessage', {})
                 if location_message:
-                    print(f"DEBUG_LOCATION: Mensagem de localização recebida: {location_message}")
+                    logger.debug("LOCATION: Mensagem de localização recebida: %s", location_message)
                     lat = location_message.get('degreesLatitude')
                     lon = location_message.get('degreesLongitude')
                     if lat is not None and lon is not None:
@@ -1091,31 +3800,31 @@ def webhook_route():
 
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_LOCATION: Contexto salvo após localização: {contexto}")
+                                logger.debug("LOCATION: Contexto salvo após localização: %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_LOCATION_SAVE_ERROR: Erro ao salvar contexto após localização: {e}")
+                                logger.error("LOCATION_SAVE_ERROR: Erro ao salvar contexto após localização: %s", e)
 
                             # AUTOMATICALLY PROVIDE WEATHER FORECAST
                             resposta = format_weather_response(cidade, pais)
                         
-                        print(f"DEBUG_LOCATION: Resposta gerada (localização via mensagem - com clima): {resposta}")
+                        logger.debug("LOCATION: Resposta gerada (localização via mensagem - com clima): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_LOCATION: Resultado do envio (localização via mensagem - com clima): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("LOCATION: Resultado do envio (localização via mensagem - com clima): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 # --- Initial Greeting Flow (standalone IF block) ---
                 # This block handles the initial conversation setup.
                 # It should only proceed to other flows once initial_greeting_step is "completed".
                 if initial_greeting_step is None:
-                    print(f"DEBUG_GREETING: Entrando no fluxo de saudação inicial (step None) - Mensagem: '{mensagem_recebida}'")
+                    logger.debug("GREETING: Entrando no fluxo de saudação inicial (step None) - Mensagem: '%s'", mensagem_recebida)
                     resposta = "Olá! 👋 Sou a Iagro, sua assistente de IA da Campo Inteligente. Pronta para otimizar sua gestão agrícola! 🚜🌱 Vamos começar?\n1. Sim\n2. Não"
                     contexto["initial_greeting_step"] = 1
-                    print(f"DEBUG_GREETING: initial_greeting_step definido para 1. Contexto antes de salvar: {contexto}")
+                    logger.debug("GREETING: initial_greeting_step definido para 1. Contexto antes de salvar: %s", contexto)
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_GREETING: initial_greeting_step definido para 1. Contexto salvo: {contexto}")
+                        logger.debug("GREETING: initial_greeting_step definido para 1. Contexto salvo: %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_GREETING_SAVE_ERROR: Erro ao salvar contexto após step None: {e}")
+                        logger.error("GREETING_SAVE_ERROR: Erro ao salvar contexto após step None: %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -1123,39 +3832,39 @@ def webhook_route():
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
                 
                 elif initial_greeting_step == 1:
-                    print(f"DEBUG_GREETING: Entrando no fluxo de saudação inicial (step 1) - Mensagem: '{mensagem_recebida}'")
+                    logger.debug("GREETING: Entrando no fluxo de saudação inicial (step 1) - Mensagem: '%s'", mensagem_recebida)
                     if mensagem_recebida.strip() == "1" or "sim" in mensagem_recebida:
                         resposta = "Ótimo! Para começarmos, posso saber seu nome? 😊"
                         contexto["initial_greeting_step"] = 2
-                        print(f"DEBUG_GREETING: initial_greeting_step definido para 2. Contexto antes de salvar: {contexto}")
+                        logger.debug("GREETING: initial_greeting_step definido para 2. Contexto antes de salvar: %s", contexto)
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_GREETING: Contexto salvo após etapa 1 (SIM): {contexto}")
+                            logger.debug("GREETING: Contexto salvo após etapa 1 (SIM): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_GREETING_SAVE_ERROR: Erro ao salvar contexto após SIM na etapa 1: {e}")
+                            logger.error("GREETING_SAVE_ERROR: Erro ao salvar contexto após SIM na etapa 1: %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
                     elif mensagem_recebida == "2" or "não" in mensagem_recebida or "nao" in mensagem_recebida:
                         resposta = "Entendido. Deseja encerrar a conversa?\n1. Sim\n2. Não"
                         contexto["initial_greeting_step"] = "awaiting_end_conversation"
-                        print(f"DEBUG_GREETING: initial_greeting_step definido para awaiting_end_conversation. Contexto antes de salvar: {contexto}")
+                        logger.debug("GREETING: initial_greeting_step definido para awaiting_end_conversation. Contexto antes de salvar: %s", contexto)
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_GREETING: Contexto salvo após etapa 1 (NÃO): {contexto}")
+                            logger.debug("GREETING: Contexto salvo após etapa 1 (NÃO): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_GREETING_SAVE_ERROR: Erro ao salvar contexto após NÃO na etapa 1: {e}")
+                            logger.error("GREETING_SAVE_ERROR: Erro ao salvar contexto após NÃO na etapa 1: %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
                     else:
                         resposta = "Não entendi. Por favor, diga '1' para começar ou '2' para encerrar. 🤔"
-                        print(f"DEBUG_GREETING: Opção inválida, mantendo initial_greeting_step em 1. Contexto antes de salvar: {contexto}")
+                        logger.debug("GREETING: Opção inválida, mantendo initial_greeting_step em 1. Contexto antes de salvar: %s", contexto)
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_GREETING: Contexto salvo após etapa 1 (INVÁLIDA): {contexto}")
+                            logger.debug("GREETING: Contexto salvo após etapa 1 (INVÁLIDA): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_GREETING_SAVE_ERROR: Erro ao salvar contexto após opção inválida na etapa 1: {e}")
+                            logger.error("GREETING_SAVE_ERROR: Erro ao salvar contexto após opção inválida na etapa 1: %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -1163,17 +3872,17 @@ def webhook_route():
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif initial_greeting_step == 2:
-                    print(f"DEBUG_GREETING: Entrando no fluxo de saudação inicial (step 2) - Mensagem: '{mensagem_recebida}'")
+                    logger.debug("GREETING: Entrando no fluxo de saudação inicial (step 2) - Mensagem: '%s'", mensagem_recebida)
                     contexto["nome_completo"] = mensagem_recebida.strip().title()
                     nome = contexto["nome_completo"]
                     resposta = f"Prazer em te conhecer, {nome}! 👋 Poderia me falar de qual cidade você está falando? 📍"
                     contexto["initial_greeting_step"] = 3
-                    print(f"DEBUG_GREETING: initial_greeting_step definido para 3. Contexto antes de salvar: {contexto}")
+                    logger.debug("GREETING: initial_greeting_step definido para 3. Contexto antes de salvar: %s", contexto)
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_GREETING: Contexto salvo após etapa 2: {contexto}")
+                        logger.debug("GREETING: Contexto salvo após etapa 2: %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_GREETING_SAVE_ERROR: Erro ao salvar contexto após etapa 2: {e}")
+                        logger.error("GREETING_SAVE_ERROR: Erro ao salvar contexto após etapa 2: %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -1181,7 +3890,7 @@ def webhook_route():
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif initial_greeting_step == 3:
-                    print(f"DEBUG_GREETING: Entrando no fluxo de saudação inicial (step 3) - Mensagem: '{mensagem_recebida}'")
+                    logger.debug("GREETING: Entrando no fluxo de saudação inicial (step 3) - Mensagem: '%s'", mensagem_recebida)
                     cidade_input = mensagem_recebida.strip().title()
                     local_info = obter_previsao_tempo(cidade_input, "BR") # Assume Brasil por enquanto
                     if "erro" not in local_info:
@@ -1196,15 +3905,15 @@ def webhook_route():
 
                         resposta = f"Certo, {cidade_input}! Entendi sua localização. Vamos em frente com o restante do seu cadastro, {nome}?\n1. Sim\n2. Não"
                         contexto["initial_greeting_step"] = 4
-                        print(f"DEBUG_GREETING: initial_greeting_step definido para 4. Contexto antes de salvar: {contexto}")
+                        logger.debug("GREETING: initial_greeting_step definido para 4. Contexto antes de salvar: %s", contexto)
                     else:
                         resposta = f"Não consegui confirmar a cidade '{cidade_input}', {nome}. Por favor, digite o nome da sua cidade novamente ou compartilhe sua localização. 🤔"
-                        print(f"DEBUG_GREETING: Erro ao confirmar cidade, mantendo initial_greeting_step em 3. Contexto antes de salvar: {contexto}")
+                        logger.debug("GREETING: Erro ao confirmar cidade, mantendo initial_greeting_step em 3. Contexto antes de salvar: %s", contexto)
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_GREETING: Contexto salvo após etapa 3: {contexto}")
+                        logger.debug("GREETING: Contexto salvo após etapa 3: %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_GREETING_SAVE_ERROR: Erro ao salvar contexto após etapa 3: {e}")
+                        logger.error("GREETING_SAVE_ERROR: Erro ao salvar contexto após etapa 3: %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -1212,10 +3921,10 @@ def webhook_route():
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif initial_greeting_step == 4:
-                    print(f"DEBUG_GREETING: Entrando no fluxo de saudação inicial (step 4) - Mensagem: '{mensagem_recebida}'")
+                    logger.debug("GREETING: Entrando no fluxo de saudação inicial (step 4) - Mensagem: '%s'", mensagem_recebida)
                     if mensagem_recebida.strip() == "1" or "sim" in mensagem_recebida:
                         contexto["initial_greeting_step"] = "completed"
-                        print(f"DEBUG_GREETING: initial_greeting_step definido para 'completed'. Contexto antes de salvar: {contexto}")
+                        logger.debug("GREETING: initial_greeting_step definido para 'completed'. Contexto antes de salvar: %s", contexto)
                         
                         # Find the first unanswered question for registration
                         next_question_key = get_next_registration_question_key(contexto)
@@ -1235,15 +3944,15 @@ def webhook_route():
                     elif mensagem_recebida.strip() == "2" or "não" in mensagem_recebida or "nao" in mensagem_recebida:
                         resposta = f"Entendido, {nome}. Deseja encerrar a conversa?\n1. Sim\n2. Não"
                         contexto["initial_greeting_step"] = "awaiting_end_conversation"
-                        print(f"DEBUG_GREETING: initial_greeting_step definido para awaiting_end_conversation. Contexto antes de salvar: {contexto}")
+                        logger.debug("GREETING: initial_greeting_step definido para awaiting_end_conversation. Contexto antes de salvar: %s", contexto)
                     else:
                         resposta = f"Não entendi, {nome}. Por favor, diga '1' para continuar o cadastro ou '2' para encerrar. 🤔"
-                        print(f"DEBUG_GREETING: Opção inválida, mantendo initial_greeting_step em 4. Contexto antes de salvar: {contexto}")
+                        logger.debug("GREETING: Opção inválida, mantendo initial_greeting_step em 4. Contexto antes de salvar: %s", contexto)
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_GREETING: Contexto salvo após etapa 4: {contexto}")
+                        logger.debug("GREETING: Contexto salvo após etapa 4: %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_GREETING_SAVE_ERROR: Erro ao salvar contexto após etapa 4: {e}")
+                        logger.error("GREETING_SAVE_ERROR: Erro ao salvar contexto após etapa 4: %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -1251,12 +3960,12 @@ def webhook_route():
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif initial_greeting_step == "awaiting_end_conversation":
-                    print(f"DEBUG_GREETING: Entrando no fluxo de saudação inicial (step awaiting_end_conversation) - Mensagem: '{mensagem_recebida}'")
+                    logger.debug("GREETING: Entrando no fluxo de saudação inicial (step awaiting_end_conversation) - Mensagem: '%s'", mensagem_recebida)
                     if mensagem_recebida.strip() == "1" or "sim" in mensagem_recebida:
                         resposta = f"Ok, {nome}, estarei aqui se precisar de algo mais! Até logo! 👋"
                         contexto.clear() # Limpa todo o contexto para um novo início
                         contexto["last_interaction_time"] = current_time # Mantém o timestamp
-                        print(f"DEBUG_GREETING: Contexto limpo após encerramento. Contexto antes de salvar: {contexto}")
+                        logger.debug("GREETING: Contexto limpo após encerramento. Contexto antes de salvar: %s", contexto)
                     elif mensagem_recebida.strip() == "2" or "não" in mensagem_recebida or "nao" in mensagem_recebida:
                         resposta = (
                             f"Ok, {nome}! Estou aqui para ajudar você com sua produção agrícola! 👋\n\n"
@@ -1274,12 +3983,12 @@ def webhook_route():
                         contexto["initial_greeting_step"] = "completed"
                     else:
                         resposta = f"Não entendi, {nome}. Por favor, diga '1' para encerrar ou '2' para ver as opções. 🤔"
-                        print(f"DEBUG_GREETING: Opção inválida, mantendo initial_greeting_step em awaiting_end_conversation. Contexto antes de salvar: {contexto}")
+                        logger.debug("GREETING: Opção inválida, mantendo initial_greeting_step em awaiting_end_conversation. Contexto antes de salvar: %s", contexto)
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_GREETING: Contexto salvo após awaiting_end_conversation: {contexto}")
+                        logger.debug("GREETING: Contexto salvo após awaiting_end_conversation: %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_GREETING_SAVE_ERROR: Erro ao salvar contexto após awaiting_end_conversation: {e}")
+                        logger.error("GREETING_SAVE_ERROR: Erro ao salvar contexto após awaiting_end_conversation: %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -1288,7 +3997,7 @@ def webhook_route():
 
                 # --- Main conversational flow logic (strict if/elif chain) ---
                 elif awaiting_continuation_choice:
-                    print(f"DEBUG_FLOW: Fluxo: awaiting_continuation_choice")
+                    logger.debug("FLOW: Fluxo: awaiting_continuation_choice")
                     if "continuar" in mensagem_recebida:
                         contexto["awaiting_continuation_choice"] = False
                         resposta = f"Ótimo, {nome}! Vamos continuar de onde paramos. {REGISTRATION_QUESTIONS[registration_step]}"
@@ -1344,19 +4053,19 @@ def webhook_route():
                         resposta = f"Por favor, {nome}, diga 'continuar' para retomar o cadastro ou 'sair' para cancelá-lo."
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_FLOW: Contexto salvo (continuar cadastro): {contexto}")
+                        logger.debug("FLOW: Contexto salvo (continuar cadastro): %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (continuar cadastro): {e}")
+                        logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (continuar cadastro): %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
-                    print(f"DEBUG_FLOW: Resposta gerada (continuar cadastro): {resposta}")
+                    logger.debug("FLOW: Resposta gerada (continuar cadastro): %s", resposta)
                     send_status, send_resp = send_whatsapp_message(numero, resposta)
-                    print(f"DEBUG_FLOW: Resultado do envio (continuar cadastro): Status={send_status}, Resposta={send_resp}")
+                    logger.debug("FLOW: Resultado do envio (continuar cadastro): Status=%s, Resposta=%s", send_status, send_resp)
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif awaiting_weather_follow_up_choice:
-                    print(f"DEBUG_FLOW: Fluxo: awaiting_weather_follow_up_choice")
+                    logger.debug("FLOW: Fluxo: awaiting_weather_follow_up_choice")
                     if "outra" in mensagem_recebida or "nova" in mensagem_recebida or "sim" in mensagem_recebida or "clima" in mensagem_recebida:
                         contexto["awaiting_weather_location"] = True
                         contexto["awaiting_weather_follow_up_choice"] = False
@@ -1472,19 +4181,19 @@ def webhook_route():
                         )
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_FLOW: Contexto salvo (seguimento clima): {contexto}")
+                        logger.debug("FLOW: Contexto salvo (seguimento clima): %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (seguimento clima): {e}")
+                        logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (seguimento clima): %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
-                    print(f"DEBUG_FLOW: Resposta gerada (seguimento clima): {resposta}")
+                    logger.debug("FLOW: Resposta gerada (seguimento clima): %s", resposta)
                     send_status, send_resp = send_whatsapp_message(numero, resposta)
-                    print(f"DEBUG_FLOW: Resultado do envio (seguimento clima): Status={send_status}, Resposta={send_resp}")
+                    logger.debug("FLOW: Resultado do envio (seguimento clima): Status=%s, Resposta=%s", send_status, send_resp)
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif awaiting_menu_return_prompt:
-                    print(f"DEBUG_FLOW: Fluxo: awaiting_menu_return_prompt")
+                    logger.debug("FLOW: Fluxo: awaiting_menu_return_prompt")
                     if "sim" in mensagem_recebida or "voltar" in mensagem_recebida or "menu" in mensagem_recebida or "opções" in mensagem_recebida:
                         contexto["awaiting_menu_return_prompt"] = False
                         contexto["awaiting_weather_location"] = False
@@ -1557,19 +4266,39 @@ def webhook_route():
                         resposta = f"Não entendi, {nome}. Por favor, responda 'sim' ou 'não'"
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_FLOW: Contexto salvo (retorno ao menu principal após opção informativa): {contexto}")
+                        logger.debug("FLOW: Contexto salvo (retorno ao menu principal após opção informativa): %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (retorno ao menu principal após opção informativa): {e}")
+                        logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (retorno ao menu principal após opção informativa): %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
-                    print(f"DEBUG_FLOW: Resposta gerada (retorno ao menu principal após opção informativa): {resposta}")
+                    logger.debug("FLOW: Resposta gerada (retorno ao menu principal após opção informativa): %s", resposta)
                     send_status, send_resp = send_whatsapp_message(numero, resposta)
-                    print(f"DEBUG_FLOW: Resultado do envio (retorno ao menu principal após opção informativa): Status={send_status}, Resposta={send_resp}")
+                    logger.debug("FLOW: Resultado do envio (retorno ao menu principal após opção informativa): Status=%s, Resposta=%s", send_status, send_resp)
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif awaiting_post_completion_response:
-                    print(f"DEBUG_FLOW: Fluxo: awaiting_post_completion_response")
+                    logger.debug("FLOW: Fluxo: awaiting_post_completion_response")
+                    # Continuação de um relatório paginado (só enquanto o usuário segue no relatório)
+                    relatorio_continuacao = contexto.get("relatorio_continuacao")
+                    if relatorio_continuacao and not contexto.get(REPORTS[relatorio_continuacao["tipo"]][1]):
+                        relatorio_continuacao = None
+                    if relatorio_continuacao and mensagem_recebida.strip() == "mais":
+                        resposta = report_reply(numero, contexto, relatorio_continuacao["tipo"], relatorio_continuacao["pagina"])
+                        if resposta is None:
+                            resposta = f"Não há mais registros neste relatório, {nome}.\n\nDeseja voltar ao menu anterior? (Responda 'sim' ou 'não')"
+                        try:
+                            save_conversation_context(numero, contexto)
+                            logger.debug("FLOW: Contexto salvo (continuação do relatório): %s", contexto)
+                        except Exception as e:
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (continuação do relatório): %s", e)
+                            resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
+                            send_whatsapp_message(numero, resposta)
+                            return jsonify({"status": "erro", "resposta": resposta}), 500
+                        send_status, send_resp = send_whatsapp_message(numero, resposta)
+                        logger.debug("FLOW: Resultado do envio (continuação do relatório): Status=%s, Resposta=%s", send_status, send_resp)
+                        return jsonify({"status": "sucesso", "resposta": resposta}), 200
+                    contexto["relatorio_continuacao"] = None
                     if "sim" in mensagem_recebida:
                         contexto["awaiting_post_completion_response"] = False
                         if contexto.get("gestao_rebanho_ativo"):
@@ -1645,15 +4374,15 @@ def webhook_route():
                             )
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (pós-conclusão - sim): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (pós-conclusão - sim): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (pós-conclusão - sim): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (pós-conclusão - sim): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (pós-conclusão - sim): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (pós-conclusão - sim): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (pós-conclusão - sim): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (pós-conclusão - sim): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
                     elif "não" in mensagem_recebida or "nao" in mensagem_recebida:
                         contexto["awaiting_post_completion_response"] = False
@@ -1723,33 +4452,33 @@ def webhook_route():
                         )
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (retorno ao menu principal após 'não'): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (retorno ao menu principal após 'não'): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (retorno ao menu principal após 'não'): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (retorno ao menu principal após 'não'): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (retorno ao menu principal após 'não'): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (retorno ao menu principal após 'não'): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (retorno ao menu principal após 'não'): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (retorno ao menu principal após 'não'): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
                     else:
                         resposta = f"Não entendi, {nome}. Por favor, responda 'sim' ou 'não'."
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (pós-conclusão - opção inválida): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (pós-conclusão - opção inválida): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (pós-conclusão - opção inválida): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (pós-conclusão - opção inválida): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (pós-conclusão - opção inválida): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (pós-conclusão - opção inválida): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (pós-conclusão - opção inválida): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (pós-conclusão - opção inválida): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif simulacao_safra_ativa:
-                    print(f"DEBUG_FLOW: Fluxo: simulacao_safra_ativa")
+                    logger.debug("FLOW: Fluxo: simulacao_safra_ativa")
                     etapa = contexto.get("etapa_simulacao")
                     dados = contexto.get("dados_simulacao", {})
 
@@ -1810,15 +4539,15 @@ def webhook_route():
                                 resposta = f"Ok, {nome}, voltando. Por favor, responda novamente a pergunta anterior sobre a simulação.\n(Ou 'voltar' para o menu anterior, ou 'menu' para o principal)"
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (simulação voltar): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (simulação voltar): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação voltar): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação voltar): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (simulação voltar): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (simulação voltar): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (simulação voltar): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (simulação voltar): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                     if simulacao_sub_fluxo is None:
@@ -1829,9 +4558,10 @@ def webhook_route():
                             resposta = f"Olá, {nome}! 👋 Vamos começar a sua simulação de safra. 🌾\n\nPor favor, me informe os seguintes dados para gerar a previsão mais precisa possível. 🌱\n\n👉 Qual é a cultura que deseja simular?\nEx.: soja, milho, trigo, café, etc.\n(Ou 'voltar' para o menu anterior, ou 'menu' para o principal)"
                         elif mensagem_recebida.strip() == "2":
                             contexto["simulacao_sub_fluxo"] = 2
-                            if contexto["simulacoes_passadas"]:
+                            simulacoes_passadas = list_farmer_records(numero, "simulacoes_passadas")
+                            if simulacoes_passadas:
                                 resposta = "📊 **Suas Simulações Anteriores:** 📊\n"
-                                for i, sim in enumerate(contexto["simulacoes_passadas"]):
+                                for i, sim in enumerate(simulacoes_passadas):
                                     cultura = sim.get("cultura", "N/A")
                                     area = sim.get("area", "N/A")
                                     produtividade = sim.get("produtividade_media", "N/A")
@@ -1843,33 +4573,11 @@ def webhook_route():
                         elif mensagem_recebida.strip() == "3":
                             contexto["simulacao_sub_fluxo"] = 3
                             contexto["gerar_relatorio_simulacao_ativo"] = True
-                            if contexto["simulacoes_passadas"]:
-                                resposta = "📈 **Relatório de Simulações de Safra:** 📈\n\n"
-                                for i, sim in enumerate(contexto["simulacoes_passadas"]):
-                                    cultura = sim.get("cultura", "N/A")
-                                    area = sim.get("area", "N/A")
-                                    tipo_solo = sim.get("tipo_solo", "N/A")
-                                    condicoes_climaticas = sim.get("condicoes_climaticas", "N/A")
-                                    ciclo_cultura = sim.get("ciclo_cultura", "N/A")
-                                    produtividade = sim.get("produtividade_media", "N/A")
-                                    
-                                    resposta += f"--- Simulação {i+1} ---\n"
-                                    resposta += f"Cultura: {cultura.capitalize()}\n"
-                                    resposta += f"Área: {area} ha\n"
-                                    resposta += f"Tipo de Solo: {tipo_solo.capitalize()}\n"
-                                    resposta += f"Condições Climáticas: {condicoes_climaticas.capitalize()}\n"
-                                    resposta += f"Ciclo da Cultura: {ciclo_cultura.capitalize()}\n"
-                                    resposta += f"Produtividade Estimada: {produtividade} kg/ha\n\n"
-                                
-                                resposta += (
-                                    "Este é um resumo textual. Se você esperava um relatório em formato de imagem (gráfico), PDF, Word ou Excel, "
-                                    "informo que, no momento, nosso sistema via WhatsApp só consegue enviar relatórios em texto. "
-                                    "Para outros formatos, seria necessário acessar nossa plataforma web.\n\n"
-                                )
-                            else:
+                            # Relatório paginado (as páginas extras já vão para o buffer de respostas)
+                            resposta = report_reply(numero, contexto, "simulacao")
+                            if resposta is None:
                                 resposta = f"Não há simulações registradas para gerar um relatório, {nome}. Que tal iniciar uma? 🌱"
-                            
-                            resposta += "\n\nDeseja voltar ao menu de Simulação de Safra? (Responda 'sim' ou 'não')\n(Ou 'voltar' para o menu anterior, ou 'menu' para o principal)"
+                                resposta += "\n\nDeseja voltar ao menu de Simulação de Safra? (Responda 'sim' ou 'não')\n(Ou 'voltar' para o menu anterior, ou 'menu' para o principal)"
                             contexto["awaiting_post_completion_response"] = True
                         else:
                             resposta = (
@@ -1881,15 +4589,15 @@ def webhook_route():
                             )
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (simulação safra sub-menu): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (simulação safra sub-menu): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação safra sub-menu): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação safra sub-menu): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (simulação safra sub-menu): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (simulação safra sub-menu): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (simulação safra sub-menu): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (simulação safra sub-menu): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                     elif simulacao_sub_fluxo == 1:
@@ -1899,9 +4607,9 @@ def webhook_route():
                             contexto["dados_simulacao"] = dados
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (simulação etapa 1): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (simulação etapa 1): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação etapa 1): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação etapa 1): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -1920,18 +4628,18 @@ def webhook_route():
                                 contexto["dados_simulacao"] = dados
                                 try:
                                     save_conversation_context(numero, contexto)
-                                    print(f"DEBUG_FLOW: Contexto salvo (simulação etapa 2): {contexto}")
+                                    logger.debug("FLOW: Contexto salvo (simulação etapa 2): %s", contexto)
                                 except Exception as e:
-                                    print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação etapa 2): {e}")
+                                    logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação etapa 2): %s", e)
                                     resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                     send_whatsapp_message(numero, resposta)
                                     return jsonify({"status": "erro", "resposta": resposta}), 500
                                 resposta = f"✅ Perfeito, {nome}! Qual o tipo de solo predominante? ⛰️\nEx.: arenoso, argiloso, misto, etc.\n(Ou 'voltar' para o menu anterior, ou 'menu' para o principal)"
                             except ValueError:
                                 resposta = f"Por favor, {nome}, informe a área em hectares usando um número válido (ex: 50, 100.5).\n(Ou 'voltar' para o menu anterior, ou 'menu' para o principal)"
-                                print(f"DEBUG_FLOW: Resposta gerada (erro simulação etapa 2): {resposta}")
+                                logger.debug("FLOW: Resposta gerada (erro simulação etapa 2): %s", resposta)
                                 send_status, send_resp = send_whatsapp_message(numero, resposta)
-                                print(f"DEBUG_FLOW: Resultado do envio (erro simulação etapa 2): Status={send_status}, Resposta={send_resp}")
+                                logger.debug("FLOW: Resultado do envio (erro simulação etapa 2): Status=%s, Resposta=%s", send_status, send_resp)
                                 return jsonify({"status": "erro", "resposta": resposta}), 200
                         elif etapa == 3:
                             dados["tipo_solo"] = mensagem_recebida
@@ -1939,9 +4647,9 @@ def webhook_route():
                             contexto["dados_simulacao"] = dados
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (simulação etapa 3): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (simulação etapa 3): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação etapa 3): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação etapa 3): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -1952,9 +4660,9 @@ def webhook_route():
                             contexto["dados_simulacao"] = dados
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (simulação etapa 4): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (simulação etapa 4): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação etapa 4): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação etapa 4): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -1963,7 +4671,7 @@ def webhook_route():
                             dados["ciclo_cultura"] = mensagem_recebida
                             
                             # Save the completed simulation to history
-                            contexto["simulacoes_passadas"].append(dados)
+                            add_farmer_record(numero, "simulacoes_passadas", dados)
 
                             contexto["etapa_simulacao"] = None
                             contexto["simulacao_safra_ativa"] = False
@@ -1972,33 +4680,33 @@ def webhook_route():
                             contexto["gerar_relatorio_simulacao_ativo"] = False
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (simulação etapa 5): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (simulação etapa 5): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação etapa 5): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação etapa 5): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
                             
-                            print(f"DEBUG_FLOW: Enviando mensagem de processamento da simulação...")
+                            logger.debug("FLOW: Enviando mensagem de processamento da simulação...")
                             send_status, send_resp = send_whatsapp_message(numero, "🚜 Processando a simulação da sua safra... \n\n🔄 Isso pode levar alguns segundos...")
-                            print(f"DEBUG_FLOW: Resultado do envio (simulação processando): Status={send_status}, Resposta={send_resp}")
+                            logger.debug("FLOW: Resultado do envio (simulação processando): Status=%s, Resposta=%s", send_status, send_resp)
                             
                             # Chama a função para simular a safra
                             resultado_simulacao = simular_safra(dados)
                             
                             # Após a simulação, envie o resultado formatado
                             resposta_resultado = formatar_resultado_simulacao(dados, resultado_simulacao)
-                            print(f"DEBUG_FLOW: Resposta gerada (simulação resultado): {resposta_resultado}")
+                            logger.debug("FLOW: Resposta gerada (simulação resultado): %s", resposta_resultado)
                             send_status_resultado, send_resp_resultado = send_whatsapp_message(numero, resposta_resultado)
-                            print(f"DEBUG_FLOW: Resultado do envio (simulação resultado): Status={send_status_resultado}, Resposta={send_resp_resultado}")
+                            logger.debug("FLOW: Resultado do envio (simulação resultado): Status=%s, Resposta=%s", send_status_resultado, send_resp_resultado)
 
                             # Pergunta de finalização
                             contexto["awaiting_safra_finalizacao"] = True
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (simulação finalização): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (simulação finalização): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação finalização): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação finalização): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -2013,16 +4721,16 @@ def webhook_route():
                             contexto["gerar_relatorio_simulacao_ativo"] = False
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (erro simulação etapa): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (erro simulação etapa): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (erro simulação etapa): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (erro simulação etapa): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
 
-                        print(f"DEBUG_FLOW: Resposta gerada (simulação etapa {etapa}): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (simulação etapa %s): %s", etapa, resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (simulação etapa {etapa}): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (simulação etapa %s): Status=%s, Resposta=%s", etapa, send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                     else:
@@ -2032,19 +4740,19 @@ def webhook_route():
                         contexto["gerar_relatorio_simulacao_ativo"] = False
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (erro simulação safra sub-fluxo): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (erro simulação safra sub-fluxo): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (erro simulação safra sub-fluxo): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (erro simulação safra sub-fluxo): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (erro simulação safra sub-fluxo): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (erro simulação safra sub-fluxo): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (erro simulação safra sub-fluxo): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (erro simulação safra sub-fluxo): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif awaiting_safra_finalizacao:
-                    print(f"DEBUG_FLOW: Fluxo: awaiting_safra_finalizacao")
+                    logger.debug("FLOW: Fluxo: awaiting_safra_finalizacao")
                     if mensagem_recebida.strip() == "1":
                         contexto["simulacao_safra_ativa"] = True
                         contexto["etapa_simulacao"] = 1
@@ -2054,16 +4762,16 @@ def webhook_route():
                         contexto["gerar_relatorio_simulacao_ativo"] = False
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (simulação nova): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (simulação nova): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação nova): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação nova): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
                         resposta_nova_simulacao = f"Ok, {nome}, vamos iniciar uma nova simulação. 🌱\n\n👉 Qual é a cultura que deseja simular?\nEx.: soja, milho, trigo, café, etc.\n(Ou 'voltar' para o menu principal)"
-                        print(f"DEBUG_FLOW: Resposta gerada (simulação nova): {resposta_nova_simulacao}")
+                        logger.debug("FLOW: Resposta gerada (simulação nova): %s", resposta_nova_simulacao)
                         send_status, send_resp = send_whatsapp_message(numero, resposta_nova_simulacao)
-                        print(f"DEBUG_FLOW: Resultado do envio (simulação nova): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (simulação nova): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta_nova_simulacao}), 200
                     elif mensagem_recebida.strip() == "2":
                         contexto["awaiting_safra_finalizacao"] = False
@@ -2074,9 +4782,9 @@ def webhook_route():
                         contexto["gerar_relatorio_simulacao_ativo"] = False
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (simulação sair): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (simulação sair): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação sair): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (simulação sair): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -2093,19 +4801,19 @@ def webhook_route():
                             f"8. Localização 📍\n"
                             f"9. Outras Informações 💡"
                         )
-                        print(f"DEBUG_FLOW: Resposta gerada (simulação sair): {resposta_sair}")
+                        logger.debug("FLOW: Resposta gerada (simulação sair): %s", resposta_sair)
                         send_status, send_resp = send_whatsapp_message(numero, resposta_sair)
-                        print(f"DEBUG_FLOW: Resultado do envio (simulação sair): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (simulação sair): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta_sair}), 200
                     else:
                         resposta_opcao_invalida = f"Opção inválida, {nome}. Digite 1 para nova simulação ou 2 para sair.\n(Ou 'voltar' para o menu principal)"
-                        print(f"DEBUG_FLOW: Resposta gerada (simulação opção inválida): {resposta_opcao_invalida}")
+                        logger.debug("FLOW: Resposta gerada (simulação opção inválida): %s", resposta_opcao_invalida)
                         send_status, send_resp = send_whatsapp_message(numero, resposta_opcao_invalida)
-                        print(f"DEBUG_FLOW: Resultado do envio (simulação opção inválida): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (simulação opção inválida): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "erro", "resposta": resposta_opcao_invalida}), 200
 
                 elif controle_estoque_ativo:
-                    print(f"DEBUG_FLOW: Fluxo: controle_estoque_ativo")
+                    logger.debug("FLOW: Fluxo: controle_estoque_ativo")
                     if "voltar" in mensagem_recebida:
                         if registro_entrada_estoque_ativo or registro_saida_estoque_ativo or consulta_estoque_ativa or gerar_relatorio_estoque_ativo:
                             contexto["registro_entrada_estoque_ativo"] = False
@@ -2146,15 +4854,15 @@ def webhook_route():
                             )
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (controle estoque voltar): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (controle estoque voltar): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (controle estoque voltar): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (controle estoque voltar): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (controle estoque voltar): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (controle estoque voltar): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (controle estoque voltar): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (controle estoque voltar): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                     if controle_estoque_sub_fluxo is None:
@@ -2173,9 +4881,10 @@ def webhook_route():
                         elif mensagem_recebida.strip() == "3":
                             contexto["controle_estoque_sub_fluxo"] = 3
                             contexto["consulta_estoque_ativa"] = True
-                            if contexto["registros_estoque"]:
+                            registros_estoque = list_farmer_records(numero, "registros_estoque")
+                            if registros_estoque:
                                 resposta = "📦 **Itens em Estoque:** 📦\n"
-                                for i, item in enumerate(contexto["registros_estoque"]):
+                                for i, item in enumerate(registros_estoque):
                                     nome_item = item.get("nome_item", "N/A")
                                     quantidade = item.get("quantidade", "N/A")
                                     data_entrada = item.get("data_entrada", "N/A")
@@ -2194,33 +4903,11 @@ def webhook_route():
                         elif mensagem_recebida.strip() == "5":
                             contexto["controle_estoque_sub_fluxo"] = 5
                             contexto["gerar_relatorio_estoque_ativo"] = True
-                            if contexto["registros_estoque"]:
-                                resposta = "📊 **Relatório Detalhado de Estoque:** 📊\n\n"
-                                for i, item in enumerate(contexto["registros_estoque"]):
-                                    nome_item = item.get("nome_item", "N/A")
-                                    quantidade = item.get("quantidade", "N/A")
-                                    data_entrada = item.get("data_entrada", "N/A")
-                                    data_fabricacao = item.get("data_fabricacao", "N/A")
-                                    data_vencimento = item.get("data_vencimento", "N/A")
-                                    numero_lote = item.get("numero_lote", "N/A")
-                                    
-                                    resposta += f"--- Item {i+1} ---\n"
-                                    resposta += f"Nome: {nome_item.capitalize()}\n"
-                                    resposta += f"Quantidade: {quantidade}\n"
-                                    resposta += f"Data de Entrada: {data_entrada}\n"
-                                    resposta += f"Data de Fabricação: {data_fabricacao}\n"
-                                    resposta += f"Data de Vencimento: {data_vencimento}\n"
-                                    resposta += f"Número de Lote: {numero_lote}\n\n"
-                                
-                                resposta += (
-                                    "Este é um resumo textual. Se você esperava um relatório em formato de imagem (gráfico), PDF, Word ou Excel, "
-                                    "informo que, no momento, nosso sistema via WhatsApp só consegue enviar relatórios em texto. "
-                                    "Para outros formatos, seria necessário acessar nossa plataforma web.\n\n"
-                                )
-                            else:
+                            # Relatório paginado (as páginas extras já vão para o buffer de respostas)
+                            resposta = report_reply(numero, contexto, "estoque")
+                            if resposta is None:
                                 resposta = f"Não há itens registrados no estoque para gerar um relatório, {nome}. Que tal registrar uma entrada? 📦"
-                            
-                            resposta += "\n\nDeseja voltar ao menu de Controle de Estoque? (Responda 'sim' ou 'não')\n(Ou 'voltar' para o menu anterior, ou 'menu' para o principal)"
+                                resposta += "\n\nDeseja voltar ao menu de Controle de Estoque? (Responda 'sim' ou 'não')\n(Ou 'voltar' para o menu anterior, ou 'menu' para o principal)"
                             contexto["awaiting_post_completion_response"] = True
                         else:
                             resposta = (
@@ -2234,19 +4921,19 @@ def webhook_route():
                             )
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (controle estoque sub-menu): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (controle estoque sub-menu): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (controle estoque sub-menu): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (controle estoque sub-menu): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (controle estoque sub-menu): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (controle estoque sub-menu): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (controle estoque sub-menu): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (controle estoque sub-menu): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
                     
                     elif registro_entrada_estoque_ativo:
-                        print(f"DEBUG_FLOW: Fluxo: registro_entrada_estoque_etapa {registro_entrada_estoque_etapa}")
+                        logger.debug("FLOW: Fluxo: registro_entrada_estoque_etapa %s", registro_entrada_estoque_etapa)
                         if registro_entrada_estoque_etapa == 1:
                             dados_entrada_estoque_registro["nome_item"] = mensagem_recebida.strip()
                             contexto["registro_entrada_estoque_etapa"] = 2
@@ -2273,7 +4960,7 @@ def webhook_route():
                             numero_lote = mensagem_recebida.strip()
                             dados_entrada_estoque_registro["numero_lote"] = numero_lote if numero_lote != "não" else "Não informado"
                             
-                            contexto["registros_estoque"].append(dados_entrada_estoque_registro)
+                            add_farmer_record(numero, "registros_estoque", dados_entrada_estoque_registro)
 
                             contexto["registro_entrada_estoque_ativo"] = False
                             contexto["registro_entrada_estoque_etapa"] = None
@@ -2292,19 +4979,19 @@ Número de Lote: {dados_entrada_estoque_registro.get("numero_lote", "N/A")}
                             contexto["awaiting_post_completion_response"] = True
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (registro entrada estoque etapa {registro_entrada_estoque_etapa}): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (registro entrada estoque etapa %s): %s", registro_entrada_estoque_etapa, contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (registro entrada estoque etapa {registro_entrada_estoque_etapa}): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (registro entrada estoque etapa %s): %s", registro_entrada_estoque_etapa, e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (registro entrada estoque etapa {registro_entrada_estoque_etapa}): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (registro entrada estoque etapa %s): %s", registro_entrada_estoque_etapa, resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (registro entrada estoque etapa {registro_entrada_estoque_etapa}): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (registro entrada estoque etapa %s): Status=%s, Resposta=%s", registro_entrada_estoque_etapa, send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                     elif registro_saida_estoque_ativo:
-                        print(f"DEBUG_FLOW: Fluxo: registro_saida_estoque_etapa {registro_saida_estoque_etapa}")
+                        logger.debug("FLOW: Fluxo: registro_saida_estoque_etapa %s", registro_saida_estoque_etapa)
                         if registro_saida_estoque_etapa == 1:
                             dados_saida_estoque_registro["nome_item"] = mensagem_recebida.strip()
                             contexto["registro_saida_estoque_etapa"] = 2
@@ -2330,15 +5017,15 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             contexto["awaiting_post_completion_response"] = True
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (registro saída estoque etapa {registro_saida_estoque_etapa}): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (registro saída estoque etapa %s): %s", registro_saida_estoque_etapa, contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (registro saída estoque etapa {registro_saida_estoque_etapa}): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (registro saída estoque etapa %s): %s", registro_saida_estoque_etapa, e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (registro saída estoque etapa {registro_saida_estoque_etapa}): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (registro saída estoque etapa %s): %s", registro_saida_estoque_etapa, resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (registro saída estoque etapa {registro_saida_estoque_etapa}): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (registro saída estoque etapa %s): Status=%s, Resposta=%s", registro_saida_estoque_etapa, send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                     else:
@@ -2355,20 +5042,20 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                         contexto["gerar_relatorio_estoque_ativo"] = False
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (erro controle estoque sub-fluxo): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (erro controle estoque sub-fluxo): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (erro controle estoque sub-fluxo): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (erro controle estoque sub-fluxo): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (erro controle estoque sub-fluxo): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (erro controle estoque sub-fluxo): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (erro controle estoque sub-fluxo): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (erro controle estoque sub-fluxo): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
 
                 elif gestao_rebanho_ativo:
-                    print(f"DEBUG_FLOW: Fluxo: gestao_rebanho_ativo")
+                    logger.debug("FLOW: Fluxo: gestao_rebanho_ativo")
                     if "voltar" in mensagem_recebida:
                         if vacinacao_vermifugacao_ativo:
                             contexto["vacinacao_vermifugacao_ativo"] = False
@@ -2423,15 +5110,15 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             )
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (gestão rebanho voltar para principal): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (gestão rebanho voltar para principal): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (gestão rebanho voltar para principal): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (gestão rebanho voltar para principal): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (gestão rebanho voltar para principal): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (gestão rebanho voltar para principal): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (gestão rebanho voltar para principal): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (gestão rebanho voltar para principal): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                     if gestao_rebanho_sub_fluxo is None:
@@ -2468,9 +5155,10 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             contexto["awaiting_post_completion_response"] = True
                         elif mensagem_recebida.strip() == "5":
                             contexto["gestao_rebanho_sub_fluxo"] = 5
-                            if contexto["registros_animais"]:
+                            registros_animais = list_farmer_records(numero, "registros_animais")
+                            if registros_animais:
                                 resposta = "🐄 **Seus Animais Cadastrados:** 🐄\n"
-                                for i, animal in enumerate(contexto["registros_animais"]):
+                                for i, animal in enumerate(registros_animais):
                                     animal_id = animal.get("animal_id", "N/A")
                                     resposta += f"{i+1}️⃣ {animal_id.capitalize()}\n"
                             else:
@@ -2480,40 +5168,11 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                         elif mensagem_recebida.strip() == "6":
                             contexto["gestao_rebanho_sub_fluxo"] = 6
                             contexto["gerar_relatorio_rebanho_ativo"] = True
-                            if contexto["registros_animais"]:
-                                resposta = "📊 **Relatório Detalhado do Rebanho:** 📊\n\n"
-                                for i, animal in enumerate(contexto["registros_animais"]):
-                                    animal_id = animal.get("animal_id", "N/A")
-                                    vacinas_animal = [v for v in contexto["registros_vacinacao"] if v.get("animal_id", "").lower() == animal_id.lower()]
-                                    vermifugos_animal = [v for v in contexto["registros_vermifugacao"] if v.get("animal_id", "").lower() == animal_id.lower()]
-
-                                    resposta += f"--- Animal {i+1} ---\n"
-                                    resposta += f"Identificação: {animal_id.capitalize()}\n"
-                                    
-                                    if vacinas_animal:
-                                        resposta += "Vacinações:\n"
-                                        for vac in vacinas_animal:
-                                            resposta += f"  - {vac.get('vacina', 'N/A')} em {vac.get('data_vacinacao', 'N/A')}\n"
-                                    else:
-                                        resposta += "Vacinações: Nenhuma registrada.\n"
-                                    
-                                    if vermifugos_animal:
-                                        resposta += "Vermifugações:\n"
-                                        for verm in vermifugos_animal:
-                                            resposta += f"  - {verm.get('vermifugo', 'N/A')} em {verm.get('data_vermifugacao', 'N/A')}\n"
-                                    else:
-                                        resposta += "Vermifugações: Nenhuma registrada.\n"
-                                    resposta += "\n"
-                                
-                                resposta += (
-                                    "Este é um resumo textual. Se você esperava um relatório em formato de imagem (gráfico), PDF, Word ou Excel, "
-                                    "informo que, no momento, nosso sistema via WhatsApp só consegue enviar relatórios em texto. "
-                                    "Para outros formatos, seria necessário acessar nossa plataforma web.\n\n"
-                                )
-                            else:
+                            # Relatório paginado (as páginas extras já vão para o buffer de respostas)
+                            resposta = report_reply(numero, contexto, "rebanho")
+                            if resposta is None:
                                 resposta = f"Não há animais registrados para gerar um relatório, {nome}. Que tal cadastrar um novo animal? 🐮"
-                            
-                            resposta += "\n\nDeseja voltar ao menu de Gestão de Rebanho? (Responda 'sim' ou 'não')\n(Ou 'voltar' para o menu anterior, ou 'menu' para o principal)"
+                                resposta += "\n\nDeseja voltar ao menu de Gestão de Rebanho? (Responda 'sim' ou 'não')\n(Ou 'voltar' para o menu anterior, ou 'menu' para o principal)"
                             contexto["awaiting_post_completion_response"] = True
                         else:
                             resposta = (
@@ -2528,19 +5187,19 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             )
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (gestão rebanho sub-menu): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (gestão rebanho sub-menu): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (gestão rebanho sub-menu): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (gestão rebanho sub-menu): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (gestão rebanho sub-menu): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (gestão rebanho sub-menu): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (gestão rebanho sub-menu): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (gestão rebanho sub-menu): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                     elif cadastro_animal_ativo:
-                        print(f"DEBUG_FLOW: Fluxo: cadastro_animal_ativo")
+                        logger.debug("FLOW: Fluxo: cadastro_animal_ativo")
                         if "voltar" in mensagem_recebida:
                             contexto["cadastro_animal_ativo"] = False
                             contexto["registro_animal_etapa"] = None
@@ -2560,15 +5219,15 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             )
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (cadastro animal voltar): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (cadastro animal voltar): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (cadastro animal voltar): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (cadastro animal voltar): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
-                            print(f"DEBUG_FLOW: Resposta gerada (cadastro animal voltar): {resposta}")
+                            logger.debug("FLOW: Resposta gerada (cadastro animal voltar): %s", resposta)
                             send_status, send_resp = send_whatsapp_message(numero, resposta)
-                            print(f"DEBUG_FLOW: Resultado do envio (cadastro animal voltar): Status={send_status}, Resposta={send_resp}")
+                            logger.debug("FLOW: Resultado do envio (cadastro animal voltar): Status=%s, Resposta=%s", send_status, send_resp)
                             return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                         if registro_animal_etapa == 1:
@@ -2576,24 +5235,24 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             contexto["registro_animal_etapa"] = None
                             contexto["cadastro_animal_ativo"] = False
                             contexto["gestao_rebanho_sub_fluxo"] = None
-                            contexto["registros_animais"].append(dados_animal_registro)
+                            add_farmer_record(numero, "registros_animais", dados_animal_registro)
                             resposta = f"✅ Animal '{dados_animal_registro['animal_id'].capitalize()}' cadastrado com sucesso, {nome}! 🎉"
                             resposta += f"\n\nO que você gostaria de fazer agora na Gestão de Rebanho, {nome}? 🐄\n\nDigite:\n1 para Cadastrar novo animal\n2 para Controle de vacinação e vermifugação\n3 para Controle reprodutivo\n4 para Histórico de pesagens\n5 para Consultar Animais\n6 para Gerar Relatório\nOu 'voltar' para o menu principal."
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (cadastro animal): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (cadastro animal): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (cadastro animal): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (cadastro animal): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (cadastro animal): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (cadastro animal): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (cadastro animal): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (cadastro animal): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                     elif vacinacao_vermifugacao_ativo:
-                        print(f"DEBUG_FLOW: Fluxo: vacinacao_vermifugacao_ativo")
+                        logger.debug("FLOW: Fluxo: vacinacao_vermifugacao_ativo")
                         if "voltar" in mensagem_recebida:
                             if registro_vacinacao_etapa is not None or consulta_vacinacao_ativa or registro_vermifugacao_etapa is not None or consulta_vermifugacao_ativa or lembretes_vacinacao_ativo:
                                 contexto["registro_vacinacao_etapa"] = None
@@ -2635,15 +5294,15 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                                 )
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (vac/verm voltar): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (vac/verm voltar): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (vac/verm voltar): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (vac/verm voltar): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
-                            print(f"DEBUG_FLOW: Resposta gerada (vac/verm voltar): {resposta}")
+                            logger.debug("FLOW: Resposta gerada (vac/verm voltar): %s", resposta)
                             send_status, send_resp = send_whatsapp_message(numero, resposta)
-                            print(f"DEBUG_FLOW: Resultado do envio (vac/verm voltar): Status={send_status}, Resposta={send_resp}")
+                            logger.debug("FLOW: Resultado do envio (vac/verm voltar): Status=%s, Resposta=%s", send_status, send_resp)
                             return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                         if vacinacao_vermifugacao_opcao is None:
@@ -2684,19 +5343,19 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                                 )
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (vac/verm sub-menu choice): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (vac/verm sub-menu choice): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (vac/verm sub-menu choice): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (vac/verm sub-menu choice): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
-                            print(f"DEBUG_FLOW: Resposta gerada (vac/verm sub-menu choice): {resposta}")
+                            logger.debug("FLOW: Resposta gerada (vac/verm sub-menu choice): %s", resposta)
                             send_status, send_resp = send_whatsapp_message(numero, resposta)
-                            print(f"DEBUG_FLOW: Resultado do envio (vac/verm sub-menu choice): Status={send_status}, Resposta={send_resp}")
+                            logger.debug("FLOW: Resultado do envio (vac/verm sub-menu choice): Status=%s, Resposta=%s", send_status, send_resp)
                             return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                         elif vacinacao_vermifugacao_opcao == 1:
-                            print(f"DEBUG_FLOW: Fluxo: registro_vacinacao_etapa {registro_vacinacao_etapa}")
+                            logger.debug("FLOW: Fluxo: registro_vacinacao_etapa %s", registro_vacinacao_etapa)
                             if registro_vacinacao_etapa == 1:
                                 dados_vacinacao_registro["animal_id"] = mensagem_recebida.strip()
                                 contexto["registro_vacinacao_etapa"] = 2
@@ -2713,7 +5372,7 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                                 proxima_dose = mensagem_recebida.strip()
                                 dados_vacinacao_registro["proxima_dose"] = proxima_dose if proxima_dose != "não" else "Não informado"
                                 
-                                contexto["registros_vacinacao"].append(dados_vacinacao_registro)
+                                add_farmer_record(numero, "registros_vacinacao", dados_vacinacao_registro)
 
                                 contexto["registro_vacinacao_etapa"] = None
                                 contexto["vacinacao_vermifugacao_opcao"] = None
@@ -2735,27 +5394,24 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                                 
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (registro vacinação etapa {registro_vacinacao_etapa}): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (registro vacinação etapa %s): %s", registro_vacinacao_etapa, contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (registro vacinação etapa {registro_vacinacao_etapa}): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (registro vacinação etapa %s): %s", registro_vacinacao_etapa, e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
-                            print(f"DEBUG_FLOW: Resposta gerada (registro vacinação etapa {registro_vacinacao_etapa}): {resposta}")
+                            logger.debug("FLOW: Resposta gerada (registro vacinação etapa %s): %s", registro_vacinacao_etapa, resposta)
                             send_status, send_resp = send_whatsapp_message(numero, resposta)
-                            print(f"DEBUG_FLOW: Resultado do envio (registro vacinação etapa {registro_vacinacao_etapa}): Status={send_status}, Resposta={send_resp}")
+                            logger.debug("FLOW: Resultado do envio (registro vacinação etapa %s): Status=%s, Resposta=%s", registro_vacinacao_etapa, send_status, send_resp)
                             return jsonify({"status": "sucesso", "resposta": resposta}), 200
                         
                         elif vacinacao_vermifugacao_opcao == 2:
-                            print(f"DEBUG_FLOW: Fluxo: consulta_vacinacao_ativa")
+                            logger.debug("FLOW: Fluxo: consulta_vacinacao_ativa")
                             if awaiting_animal_id_consulta_vac:
                                 animal_id_consulta = mensagem_recebida.strip()
                                 contexto["awaiting_animal_id_consulta_vac"] = False
                                 
-                                historico_animal = [
-                                    reg for reg in contexto["registros_vacinacao"]
-                                    if reg.get("animal_id", "").lower() == animal_id_consulta.lower()
-                                ]
+                                historico_animal = list_farmer_records(numero, "registros_vacinacao", key=animal_id_consulta)
 
                                 if historico_animal:
                                     resposta = f"🐄 **Histórico de Vacinação - {animal_id_consulta.capitalize()}** 🐄\n"
@@ -2774,19 +5430,19 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (consulta vacinação): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (consulta vacinação): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (consulta vacinação): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (consulta vacinação): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
-                            print(f"DEBUG_FLOW: Resposta gerada (consulta vacinação): {resposta}")
+                            logger.debug("FLOW: Resposta gerada (consulta vacinação): %s", resposta)
                             send_status, send_resp = send_whatsapp_message(numero, resposta)
-                            print(f"DEBUG_FLOW: Resultado do envio (consulta vacinação): Status={send_status}, Resposta={send_resp}")
+                            logger.debug("FLOW: Resultado do envio (consulta vacinação): Status=%s, Resposta=%s", send_status, send_resp)
                             return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                         elif vacinacao_vermifugacao_opcao == 3:
-                            print(f"DEBUG_FLOW: Fluxo: registro_vermifugacao_etapa {registro_vermifugacao_etapa}")
+                            logger.debug("FLOW: Fluxo: registro_vermifugacao_etapa %s", registro_vermifugacao_etapa)
                             if registro_vermifugacao_etapa == 1:
                                 dados_vermifugacao_registro["animal_id"] = mensagem_recebida.strip()
                                 contexto["registro_vermifugacao_etapa"] = 2
@@ -2803,7 +5459,7 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                                 proxima_dose_verm = mensagem_recebida.strip()
                                 dados_vermifugacao_registro["proxima_dose"] = proxima_dose_verm if proxima_dose_verm != "não" else "Não informado"
                                 
-                                contexto["registros_vermifugacao"].append(dados_vermifugacao_registro)
+                                add_farmer_record(numero, "registros_vermifugacao", dados_vermifugacao_registro)
 
                                 contexto["registro_vermifugacao_etapa"] = None
                                 contexto["vacinacao_vermifugacao_opcao"] = None
@@ -2823,27 +5479,24 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                                 contexto["awaiting_post_completion_response"] = True
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (registro vermifugação etapa {registro_vermifugacao_etapa}): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (registro vermifugação etapa %s): %s", registro_vermifugacao_etapa, contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (registro vermifugação etapa {registro_vermifugacao_etapa}): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (registro vermifugação etapa %s): %s", registro_vermifugacao_etapa, e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
-                            print(f"DEBUG_FLOW: Resposta gerada (registro vermifugação etapa {registro_vermifugacao_etapa}): {resposta}")
+                            logger.debug("FLOW: Resposta gerada (registro vermifugação etapa %s): %s", registro_vermifugacao_etapa, resposta)
                             send_status, send_resp = send_whatsapp_message(numero, resposta)
-                            print(f"DEBUG_FLOW: Resultado do envio (registro vermifugação etapa {registro_vermifugacao_etapa}): Status={send_status}, Resposta={send_resp}")
+                            logger.debug("FLOW: Resultado do envio (registro vermifugação etapa %s): Status=%s, Resposta=%s", registro_vermifugacao_etapa, send_status, send_resp)
                             return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                         elif vacinacao_vermifugacao_opcao == 4:
-                            print(f"DEBUG_FLOW: Fluxo: consulta_vermifugacao_ativa")
+                            logger.debug("FLOW: Fluxo: consulta_vermifugacao_ativa")
                             if awaiting_animal_id_consulta_verm:
                                 animal_id_consulta = mensagem_recebida.strip()
                                 contexto["awaiting_animal_id_consulta_verm"] = False
                                 
-                                historico_animal_verm = [
-                                    reg for reg in contexto["registros_vermifugacao"]
-                                    if reg.get("animal_id", "").lower() == animal_id_consulta.lower()
-                                ]
+                                historico_animal_verm = list_farmer_records(numero, "registros_vermifugacao", key=animal_id_consulta)
 
                                 if historico_animal_verm:
                                     resposta = f"🐛 **Histórico de Vermifugação - {animal_id_consulta.capitalize()}** 🐛\n"
@@ -2862,19 +5515,19 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (consulta vermifugação): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (consulta vermifugação): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (consulta vermifugação): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (consulta vermifugação): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
-                            print(f"DEBUG_FLOW: Resposta gerada (consulta vermifugação): {resposta}")
+                            logger.debug("FLOW: Resposta gerada (consulta vermifugação): %s", resposta)
                             send_status, send_resp = send_whatsapp_message(numero, resposta)
-                            print(f"DEBUG_FLOW: Resultado do envio (consulta vermifugação): Status={send_status}, Resposta={send_resp}")
+                            logger.debug("FLOW: Resultado do envio (consulta vermifugação): Status=%s, Resposta=%s", send_status, send_resp)
                             return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                         elif vacinacao_vermifugacao_opcao == 5:
-                            print(f"DEBUG_FLOW: Fluxo: lembretes_vacinacao_ativa")
+                            logger.debug("FLOW: Fluxo: lembretes_vacinacao_ativa")
                             if awaiting_lembretes_contato:
                                 contato_lembretes = mensagem_recebida.strip()
                                 contexto["contato_lembretes"] = contato_lembretes
@@ -2888,15 +5541,15 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (lembretes vacinação): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (lembretes vacinação): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (lembretes vacinação): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (lembretes vacinação): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
-                            print(f"DEBUG_FLOW: Resposta gerada (lembretes vacinação): {resposta}")
+                            logger.debug("FLOW: Resposta gerada (lembretes vacinação): %s", resposta)
                             send_status, send_resp = send_whatsapp_message(numero, resposta)
-                            print(f"DEBUG_FLOW: Resultado do envio (lembretes vacinação): Status={send_status}, Resposta={send_resp}")
+                            logger.debug("FLOW: Resultado do envio (lembretes vacinação): Status=%s, Resposta=%s", send_status, send_resp)
                             return jsonify({"status": "sucesso", "resposta": resposta}), 200
                         
                         else:
@@ -2905,19 +5558,19 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             contexto["vacinacao_vermifugacao_opcao"] = None
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (erro vac/verm sub-fluxo): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (erro vac/verm sub-fluxo): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (erro vac/verm sub-fluxo): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (erro vac/verm sub-fluxo): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
-                            print(f"DEBUG_FLOW: Resposta gerada (erro vac/verm sub-fluxo): {resposta}")
+                            logger.debug("FLOW: Resposta gerada (erro vac/verm sub-fluxo): %s", resposta)
                             send_status, send_resp = send_whatsapp_message(numero, resposta)
-                            print(f"DEBUG_FLOW: Resultado do envio (erro vac/verm sub-fluxo): Status={send_status}, Resposta={send_resp}")
+                            logger.debug("FLOW: Resultado do envio (erro vac/verm sub-fluxo): Status=%s, Resposta=%s", send_status, send_resp)
                             return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                     elif controle_reprodutivo_ativo:
-                        print(f"DEBUG_FLOW: Fluxo: controle_reprodutivo_ativo")
+                        logger.debug("FLOW: Fluxo: controle_reprodutivo_ativo")
                         if "voltar" in mensagem_recebida:
                             contexto["controle_reprodutivo_ativo"] = False
                             contexto["gestao_rebanho_sub_fluxo"] = None
@@ -2936,33 +5589,33 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             )
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (controle reprodutivo voltar): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (controle reprodutivo voltar): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (controle reprodutivo voltar): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (controle reprodutivo voltar): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
-                            print(f"DEBUG_FLOW: Resposta gerada (controle reprodutivo voltar): {resposta}")
+                            logger.debug("FLOW: Resposta gerada (controle reprodutivo voltar): %s", resposta)
                             send_status, send_resp = send_whatsapp_message(numero, resposta)
-                            print(f"DEBUG_FLOW: Resultado do envio (controle reprodutivo voltar): Status={send_status}, Resposta={send_resp}")
+                            logger.debug("FLOW: Resultado do envio (controle reprodutivo voltar): Status=%s, Resposta=%s", send_status, send_resp)
                             return jsonify({"status": "sucesso", "resposta": resposta}), 200
                         resposta = f"Você está no fluxo de Controle Reprodutivo, {nome}. Em breve teremos mais funcionalidades aqui! 🤰\n\nDeseja voltar ao menu de Gestão de Rebanho? (Responda 'sim' ou 'não')\n(Ou 'voltar' para o menu de Gestão de Rebanho, ou 'menu' para o principal)"
                         contexto["awaiting_post_completion_response"] = True
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (controle reprodutivo): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (controle reprodutivo): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (controle reprodutivo): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (controle reprodutivo): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (controle reprodutivo): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (controle reprodutivo): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (controle reprodutivo): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (controle reprodutivo): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                     elif historico_pesagens_ativo:
-                        print(f"DEBUG_FLOW: Fluxo: historico_pesagens_ativo")
+                        logger.debug("FLOW: Fluxo: historico_pesagens_ativo")
                         if "voltar" in mensagem_recebida:
                             contexto["historico_pesagens_ativo"] = False
                             contexto["gestao_rebanho_sub_fluxo"] = None
@@ -2981,29 +5634,29 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             )
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (histórico pesagens voltar): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (histórico pesagens voltar): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (histórico pesagens voltar): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (histórico pesagens voltar): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
-                            print(f"DEBUG_FLOW: Resposta gerada (histórico pesagens voltar): {resposta}")
+                            logger.debug("FLOW: Resposta gerada (histórico pesagens voltar): %s", resposta)
                             send_status, send_resp = send_whatsapp_message(numero, resposta)
-                            print(f"DEBUG_FLOW: Resultado do envio (histórico pesagens voltar): Status={send_status}, Resposta={send_resp}")
+                            logger.debug("FLOW: Resultado do envio (histórico pesagens voltar): Status=%s, Resposta=%s", send_status, send_resp)
                             return jsonify({"status": "sucesso", "resposta": resposta}), 200
                         resposta = f"Você está no fluxo de Histórico de Pesagens, {nome}. Em breve teremos mais funcionalidades aqui! ⚖️\n\nDeseja voltar ao menu de Gestão de Rebanho? (Responda 'sim' ou 'não')\n(Ou 'voltar' para o menu de Gestão de Rebanho, ou 'menu' para o principal)"
                         contexto["awaiting_post_completion_response"] = True
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (histórico pesagens): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (histórico pesagens): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (histórico pesagens): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (histórico pesagens): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (histórico pesagens): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (histórico pesagens): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (histórico pesagens): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (histórico pesagens): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                     else:
@@ -3013,20 +5666,20 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                         contexto["gerar_relatorio_rebanho_ativo"] = False
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (erro gestão rebanho sub-fluxo): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (erro gestão rebanho sub-fluxo): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (erro gestão rebanho sub-fluxo): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (erro gestão rebanho sub-fluxo): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (erro gestão rebanho sub-fluxo): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (erro gestão rebanho sub-fluxo): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (erro gestão rebanho sub-fluxo): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (erro gestão rebanho sub-fluxo): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
 
                 elif registration_step:
-                    print(f"DEBUG_FLOW: Fluxo: registration_step (etapa: {registration_step})")
+                    logger.debug("FLOW: Fluxo: registration_step (etapa: %s)", registration_step)
                     current_question_key = registration_step
                     
                     if "voltar" in mensagem_recebida:
@@ -3060,19 +5713,19 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
 
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (cadastro voltar): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (cadastro voltar): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (cadastro voltar): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (cadastro voltar): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (cadastro voltar): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (cadastro voltar): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (cadastro voltar): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (cadastro voltar): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                     if contexto.get("editing_registration"):
-                        print(f"DEBUG_FLOW: Fluxo: editing_registration")
+                        logger.debug("FLOW: Fluxo: editing_registration")
                         if contexto.get("awaiting_field_to_edit"):
                             field_to_edit = None
                             for term, key in EDITABLE_FIELDS_MAP.items():
@@ -3121,15 +5774,15 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                                 resposta = f"Não entendi qual campo você deseja editar, {nome}. Por favor, diga o nome do campo (ex: 'nome completo', 'cpf', 'email') ou diga 'meus dados' para ver o que já está preenchido. 🤔\n(Ou 'voltar' para o menu principal)"
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (edição de cadastro): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (edição de cadastro): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (edição de cadastro): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (edição de cadastro): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
-                            print(f"DEBUG_FLOW: Resposta gerada (edição de cadastro): {resposta}")
+                            logger.debug("FLOW: Resposta gerada (edição de cadastro): %s", resposta)
                             send_status, send_resp = send_whatsapp_message(numero, resposta)
-                            print(f"DEBUG_FLOW: Resultado do envio (edição de cadastro): Status={send_status}, Resposta={send_resp}")
+                            logger.debug("FLOW: Resultado do envio (edição de cadastro): Status=%s, Resposta=%s", send_status, send_resp)
                             return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                         elif contexto.get("current_editing_field"):
@@ -3141,7 +5794,7 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                                     try:
                                         save_conversation_context(numero, contexto)
                                     except Exception as e:
-                                        print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (CPF inválido em edição): {e}")
+                                        logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (CPF inválido em edição): %s", e)
                                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                         send_whatsapp_message(numero, resposta)
                                         return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -3155,7 +5808,7 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                                     try:
                                         save_conversation_context(numero, contexto)
                                     except Exception as e:
-                                        print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (RG inválido em edição): {e}")
+                                        logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (RG inválido em edição): %s", e)
                                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                         send_whatsapp_message(numero, resposta)
                                         return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -3174,7 +5827,7 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                                     try:
                                         save_conversation_context(numero, contexto)
                                     except Exception as e:
-                                        print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (estado civil inválido em edição): {e}")
+                                        logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (estado civil inválido em edição): %s", e)
                                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                         send_whatsapp_message(numero, resposta)
                                         return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -3187,31 +5840,31 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             contexto["awaiting_field_to_edit"] = True
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (campo editado): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (campo editado): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (campo editado): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (campo editado): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
                             resposta = f"'{REGISTRATION_QUESTIONS[field_to_update].splitlines()[0].replace('Qual é seu ', '').replace('Qual o seu ', '').replace('Qual a sua ', '').replace('Qual seu ', '').replace('Qual a ', '').replace('Qual o ', '').replace('Seu ', '').replace('Tem algum ', '').replace('Sua ', '').replace('Sua produção é de que tipo?', 'tipo de produção?').replace('Sua produção é orgânica?', 'produção orgânica?').replace('Utiliza irrigação?', 'utiliza irrigação?').replace('Você deseja adicionar um endereço de e-mail ao seu cadastro? ', 'E-mail: ').replace('Você deseja adicionar um ponto de referência? ', 'Ponto de referência: ')}' atualizado para: {mensagem_recebida.strip()}, {nome}. ✅\n\nDeseja editar outro campo ou diga 'concluído' para finalizar a edição? 🤔\n(Ou 'voltar' para o menu anterior, ou 'menu' para o principal)"
-                            print(f"DEBUG_FLOW: Resposta gerada (campo editado): {resposta}")
+                            logger.debug("FLOW: Resposta gerada (campo editado): %s", resposta)
                             send_status, send_resp = send_whatsapp_message(numero, resposta)
-                            print(f"DEBUG_FLOW: Resultado do envio (campo editado): Status={send_status}, Resposta={send_resp}")
+                            logger.debug("FLOW: Resultado do envio (campo editado): Status=%s, Resposta=%s", send_status, send_resp)
                             return jsonify({"status": "sucesso", "resposta": resposta}), 200
                         else:
                             contexto["awaiting_field_to_edit"] = True
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (início da edição): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (início da edição): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (início da edição): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (início da edição): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
                             resposta = f"Qual campo você gostaria de editar, {nome}? (Ex: 'nome completo', 'cpf', 'endereço', etc.) 📝\n\nSe preferir, posso te mostrar seus dados atuais. Diga 'meus dados'.\n(Ou 'voltar' para o menu principal)"
-                            print(f"DEBUG_FLOW: Resposta gerada (início da edição): {resposta}")
+                            logger.debug("FLOW: Resposta gerada (início da edição): %s", resposta)
                             send_status, send_resp = send_whatsapp_message(numero, resposta)
-                            print(f"DEBUG_FLOW: Resultado do envio (início da edição): Status={send_status}, Resposta={send_resp}")
+                            logger.debug("FLOW: Resultado do envio (início da edição): Status=%s, Resposta=%s", send_status, send_resp)
                             return jsonify({"status": "sucesso", "resposta": resposta}), 200
                     
                     # Handling optional questions' choices (for initial registration or re-asking)
@@ -3237,9 +5890,9 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             resposta = "Não entendi. Por favor, diga '1' para Sim ou '2' para Não."
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (email choice): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (email choice): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (email choice): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (email choice): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -3259,9 +5912,9 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             resposta = f"Cadastro concluído com sucesso, {nome}! 🎉 Posso ajudar com mais alguma coisa? (Responda 'sim' ou 'não')"
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (email value): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (email value): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (email value): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (email value): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -3290,9 +5943,9 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             resposta = "Não entendi. Por favor, diga '1' para Sim ou '2' para Não."
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (ponto_referencia choice): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (ponto_referencia choice): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (ponto_referencia choice): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (ponto_referencia choice): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -3312,9 +5965,9 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             resposta = f"Cadastro concluído com sucesso, {nome}! 🎉 Posso ajudar com mais alguma coisa? (Responda 'sim' ou 'não')"
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (ponto_referencia value): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (ponto_referencia value): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (ponto_referencia value): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (ponto_referencia value): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -3330,7 +5983,7 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                                 try:
                                     save_conversation_context(numero, contexto)
                                 except Exception as e:
-                                    print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (CPF inválido): {e}")
+                                    logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (CPF inválido): %s", e)
                                     resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                     send_whatsapp_message(numero, resposta)
                                     return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -3344,7 +5997,7 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                                 try:
                                     save_conversation_context(numero, contexto)
                                 except Exception as e:
-                                    print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (RG inválido): {e}")
+                                    logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (RG inválido): %s", e)
                                     resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                     send_whatsapp_message(numero, resposta)
                                     return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -3366,7 +6019,7 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                                 try:
                                     save_conversation_context(numero, contexto)
                                 except Exception as e:
-                                    print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (estado civil inválido): {e}")
+                                    logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (estado civil inválido): %s", e)
                                     resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                     send_whatsapp_message(numero, resposta)
                                     return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -3377,9 +6030,9 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                         
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (cadastro etapa {current_question_key}): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (cadastro etapa %s): %s", current_question_key, contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (cadastro etapa {current_question_key}): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (cadastro etapa %s): %s", current_question_key, e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -3397,9 +6050,9 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                                 resposta = REGISTRATION_QUESTIONS[next_question_key]
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (próxima etapa cadastro): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (próxima etapa cadastro): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (próxima etapa cadastro): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (próxima etapa cadastro): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
@@ -3416,21 +6069,21 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                             contexto["awaiting_ponto_referencia_value_input"] = False
                             try:
                                 save_conversation_context(numero, contexto)
-                                print(f"DEBUG_FLOW: Contexto salvo (cadastro concluído): {contexto}")
+                                logger.debug("FLOW: Contexto salvo (cadastro concluído): %s", contexto)
                             except Exception as e:
-                                print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (cadastro concluído): {e}")
+                                logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (cadastro concluído): %s", e)
                                 resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                                 send_whatsapp_message(numero, resposta)
                                 return jsonify({"status": "erro", "resposta": resposta}), 500
                             resposta = f"Cadastro concluído com sucesso, {nome}! 🎉 Posso ajudar com mais alguma coisa? (Responda 'sim' ou 'não')"
-                        print(f"DEBUG_FLOW: Resposta gerada (cadastro concluído): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (cadastro concluído): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
                             
-                        print(f"DEBUG_FLOW: Resultado do envio (cadastro concluído): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (cadastro concluído): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
                 
                 elif awaiting_weather_location: # This must be after other flows, as it expects a city name
-                    print(f"DEBUG_FLOW: Fluxo: awaiting_weather_location")
+                    logger.debug("FLOW: Fluxo: awaiting_weather_location")
                     city_match_explicit = re.search(r"(?:clima|previsão|tempo)\s+(?:em|para)\s+([a-zA-Z\u00C0-\u017F\s-]+)", mensagem_recebida)
                     cidade_solicitada_from_message = ""
 
@@ -3448,35 +6101,35 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                         contexto["localizacao"] = {"cidade": cidade_solicitada_from_message, "estado": "", "pais": pais_solicitado} # State might be unknown, but city is key
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (clima por cidade): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (clima por cidade): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (clima por cidade): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (clima por cidade): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (clima por cidade): {resposta_clima}")
+                        logger.debug("FLOW: Resposta gerada (clima por cidade): %s", resposta_clima)
                         send_status, send_resp = send_whatsapp_message(numero, resposta_clima)
-                        print(f"DEBUG_FLOW: Resultado do envio (clima por cidade): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (clima por cidade): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta_clima}), 200
                     else:
                         resposta = f"Não entendi, {nome}. Por favor, me diga o nome da cidade (ex: 'São Paulo') ou compartilhe sua localização atual pelo WhatsApp. 📍\n(Ou 'voltar' para o menu principal)"
                         try:
                             save_conversation_context(numero, contexto)
-                            print(f"DEBUG_FLOW: Contexto salvo (re-prompt localização): {contexto}")
+                            logger.debug("FLOW: Contexto salvo (re-prompt localização): %s", contexto)
                         except Exception as e:
-                            print(f"DEBUG_FLOW_SAVE_ERROR: Erro ao salvar contexto (re-prompt localização): {e}")
+                            logger.error("FLOW_SAVE_ERROR: Erro ao salvar contexto (re-prompt localização): %s", e)
                             resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                             send_whatsapp_message(numero, resposta)
                             return jsonify({"status": "erro", "resposta": resposta}), 500
-                        print(f"DEBUG_FLOW: Resposta gerada (re-prompt localização): {resposta}")
+                        logger.debug("FLOW: Resposta gerada (re-prompt localização): %s", resposta)
                         send_status, send_resp = send_whatsapp_message(numero, resposta)
-                        print(f"DEBUG_FLOW: Resultado do envio (re-prompt localização): Status={send_status}, Resposta={send_resp}")
+                        logger.debug("FLOW: Resultado do envio (re-prompt localização): Status=%s, Resposta=%s", send_status, send_resp)
                         return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 # 2. Handle Main Menu Options (using exact match for numbers) - UPDATED ORDER
                 # These should be checked *before* the initial greeting logic or general fallback.
                 elif mensagem_recebida.strip() == "1" or "clima" in mensagem_recebida or "previsão climática" in mensagem_recebida:
-                    print(f"DEBUG_MAIN_MENU: Opção 1 - Previsão Climática selecionada.")
+                    logger.debug("MAIN_MENU: Opção 1 - Previsão Climática selecionada.")
                     # Verifica se já temos uma localização salva no contexto
                     if localizacao and localizacao.get("cidade"):
                         cidade_salva = localizacao["cidade"]
@@ -3590,19 +6243,19 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                         contexto["awaiting_ponto_referencia_value_input"] = False
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_MAIN_MENU: Contexto salvo (opção 1): {contexto}")
+                        logger.debug("MAIN_MENU: Contexto salvo (opção 1): %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 1): {e}")
+                        logger.error("MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 1): %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
-                    print(f"DEBUG_MAIN_MENU: Resposta gerada (opção 1): {resposta}")
+                    logger.debug("MAIN_MENU: Resposta gerada (opção 1): %s", resposta)
                     send_status, send_resp = send_whatsapp_message(numero, resposta)
-                    print(f"DEBUG_MAIN_MENU: Resultado do envio (opção 1): Status={send_status}, Resposta={send_resp}")
+                    logger.debug("MAIN_MENU: Resultado do envio (opção 1): Status=%s, Resposta=%s", send_status, send_resp)
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif mensagem_recebida.strip() == "2" or "controle de estoque" in mensagem_recebida or "estoque" in mensagem_recebida:
-                    print(f"DEBUG_MAIN_MENU: Opção 2 - Controle de Estoque selecionada.")
+                    logger.debug("MAIN_MENU: Opção 2 - Controle de Estoque selecionada.")
                     # Reset other awaiting flags
                     contexto["awaiting_menu_return_prompt"] = False
                     contexto["awaiting_weather_location"] = False
@@ -3671,19 +6324,19 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                     )
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_MAIN_MENU: Contexto salvo (opção 2 - controle de estoque): {contexto}")
+                        logger.debug("MAIN_MENU: Contexto salvo (opção 2 - controle de estoque): %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 2 - controle de estoque): {e}")
+                        logger.error("MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 2 - controle de estoque): %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
-                    print(f"DEBUG_MAIN_MENU: Resposta gerada (opção 2 - controle de estoque): {resposta}")
+                    logger.debug("MAIN_MENU: Resposta gerada (opção 2 - controle de estoque): %s", resposta)
                     send_status, send_resp = send_whatsapp_message(numero, resposta)
-                    print(f"DEBUG_MAIN_MENU: Resultado do envio (opção 2 - controle de estoque): Status={send_status}, Resposta={send_resp}")
+                    logger.debug("MAIN_MENU: Resultado do envio (opção 2 - controle de estoque): Status=%s, Resposta=%s", send_status, send_resp)
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif mensagem_recebida.strip() == "3" or "gestão de rebanho" in mensagem_recebida or "gestao de rebanho" in mensagem_recebida or "rebanho" in mensagem_recebida:
-                    print(f"DEBUG_MAIN_MENU: Opção 3 - Gestão de Rebanho selecionada.")
+                    logger.debug("MAIN_MENU: Opção 3 - Gestão de Rebanho selecionada.")
                     # Reset other awaiting flags
                     contexto["awaiting_menu_return_prompt"] = False
                     contexto["awaiting_weather_location"] = False
@@ -3752,19 +6405,19 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                     )
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_MAIN_MENU: Contexto salvo (opção 3 - gestão de rebanho): {contexto}")
+                        logger.debug("MAIN_MENU: Contexto salvo (opção 3 - gestão de rebanho): %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 3 - gestão de rebanho): {e}")
+                        logger.error("MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 3 - gestão de rebanho): %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
-                    print(f"DEBUG_MAIN_MENU: Resposta gerada (opção 3 - gestão de rebanho): {resposta}")
+                    logger.debug("MAIN_MENU: Resposta gerada (opção 3 - gestão de rebanho): %s", resposta)
                     send_status, send_resp = send_whatsapp_message(numero, resposta)
-                    print(f"DEBUG_MAIN_MENU: Resultado do envio (opção 3 - gestão de rebanho): Status={send_status}, Resposta={send_resp}")
+                    logger.debug("MAIN_MENU: Resultado do envio (opção 3 - gestão de rebanho): Status=%s, Resposta=%s", send_status, send_resp)
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif mensagem_recebida.strip() == "4" or "simulação de safra" in mensagem_recebida or "safra" in mensagem_recebida:
-                    print(f"DEBUG_MAIN_MENU: Opção 4 - Simulação de Safra selecionada.")
+                    logger.debug("MAIN_MENU: Opção 4 - Simulação de Safra selecionada.")
                     contexto["awaiting_menu_return_prompt"] = False
                     contexto["awaiting_weather_location"] = False
                     contexto["awaiting_weather_follow_up_choice"] = False
@@ -3828,19 +6481,19 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                     )
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_MAIN_MENU: Contexto salvo (opção 4 - simulação de safra): {contexto}")
+                        logger.debug("MAIN_MENU: Contexto salvo (opção 4 - simulação de safra): %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 4 - simulação de safra): {e}")
+                        logger.error("MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 4 - simulação de safra): %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
-                    print(f"DEBUG_MAIN_MENU: Resposta gerada (opção 4 - simulação de safra): {resposta}")
+                    logger.debug("MAIN_MENU: Resposta gerada (opção 4 - simulação de safra): %s", resposta)
                     send_status, send_resp = send_whatsapp_message(numero, resposta)
-                    print(f"DEBUG_MAIN_MENU: Resultado do envio (opção 4 - simulação de safra): Status={send_status}, Resposta={send_resp}")
+                    logger.debug("MAIN_MENU: Resultado do envio (opção 4 - simulação de safra): Status=%s, Resposta=%s", send_status, send_resp)
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif mensagem_recebida.strip() == "5" or "cadastro" in mensagem_recebida or "cadastra-se" in mensagem_recebida or "editar dados" in mensagem_recebida:
-                    print(f"DEBUG_MAIN_MENU: Opção 5 - Cadastro/Editar selecionada.")
+                    logger.debug("MAIN_MENU: Opção 5 - Cadastro/Editar selecionada.")
                     contexto["awaiting_menu_return_prompt"] = False
                     contexto["awaiting_weather_location"] = False
                     contexto["awaiting_weather_follow_up_choice"] = False
@@ -3901,19 +6554,19 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                         resposta = f"Ótimo, {nome}! Vamos começar seu cadastro. {REGISTRATION_QUESTIONS[contexto['registration_step']]}\n(Ou 'voltar' para cancelar o cadastro, ou 'menu' para o principal)"
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_MAIN_MENU: Contexto salvo (opção 5 - cadastrar/editar): {contexto}")
+                        logger.debug("MAIN_MENU: Contexto salvo (opção 5 - cadastrar/editar): %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 5 - cadastrar/editar): {e}")
+                        logger.error("MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 5 - cadastrar/editar): %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
-                    print(f"DEBUG_MAIN_MENU: Resposta gerada (opção 5 - cadastrar/editar): {resposta}")
+                    logger.debug("MAIN_MENU: Resposta gerada (opção 5 - cadastrar/editar): %s", resposta)
                     send_status, send_resp = send_whatsapp_message(numero, resposta)
-                    print(f"DEBUG_MAIN_MENU: Resultado do envio (opção 5 - cadastrar/editar): Status={send_status}, Resposta={send_resp}")
+                    logger.debug("MAIN_MENU: Resultado do envio (opção 5 - cadastrar/editar): Status=%s, Resposta=%s", send_status, send_resp)
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif mensagem_recebida.strip() == "6" or "alertas" in mensagem_recebida or "pragas" in mensagem_recebida:
-                    print(f"DEBUG_MAIN_MENU: Opção 6 - Alertas de Pragas selecionada.")
+                    logger.debug("MAIN_MENU: Opção 6 - Alertas de Pragas selecionada.")
                     resposta = f"Em breve teremos alertas de pragas para a sua região, {nome}! Fique ligado! 🐛\nDeseja voltar ao menu principal? (Responda 'sim' ou 'não')\n(Ou 'voltar' para o menu principal)"
                     contexto["awaiting_menu_return_prompt"] = True
                     contexto["awaiting_weather_location"] = False
@@ -3963,19 +6616,19 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                     contexto["initial_greeting_step"] = "completed" # <<<< IMPORTANT CHANGE HERE
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_MAIN_MENU: Contexto salvo (opção 6): {contexto}")
+                        logger.debug("MAIN_MENU: Contexto salvo (opção 6): %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 6): {e}")
+                        logger.error("MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 6): %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
-                    print(f"DEBUG_MAIN_MENU: Resposta gerada (opção 6): {resposta}")
+                    logger.debug("MAIN_MENU: Resposta gerada (opção 6): %s", resposta)
                     send_status, send_resp = send_whatsapp_message(numero, resposta)
-                    print(f"DEBUG_MAIN_MENU: Resultado do envio (opção 6): Status={send_status}, Resposta={send_resp}")
+                    logger.debug("MAIN_MENU: Resultado do envio (opção 6): Status=%s, Resposta=%s", send_status, send_resp)
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif mensagem_recebida.strip() == "7" or "análise de mercado" in mensagem_recebida or "mercado" in mensagem_recebida:
-                    print(f"DEBUG_MAIN_MENU: Opção 7 - Análise de Mercado selecionada.")
+                    logger.debug("MAIN_MENU: Opção 7 - Análise de Mercado selecionada.")
                     resposta = f"Em breve teremos análises de mercado para te ajudar a tomar as melhores decisões, {nome}! Aguarde! 📈\nDeseja voltar ao menu principal? (Responda 'sim' ou 'não')\n(Ou 'voltar' para o menu principal)"
                     contexto["awaiting_menu_return_prompt"] = True
                     contexto["awaiting_weather_location"] = False
@@ -4025,19 +6678,19 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                     contexto["initial_greeting_step"] = "completed" # <<<< IMPORTANT CHANGE HERE
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_MAIN_MENU: Contexto salvo (opção 7): {contexto}")
+                        logger.debug("MAIN_MENU: Contexto salvo (opção 7): %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 7): {e}")
+                        logger.error("MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 7): %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
-                    print(f"DEBUG_MAIN_MENU: Resposta gerada (opção 7): {resposta}")
+                    logger.debug("MAIN_MENU: Resposta gerada (opção 7): %s", resposta)
                     send_status, send_resp = send_whatsapp_message(numero, resposta)
-                    print(f"DEBUG_MAIN_MENU: Resultado do envio (opção 7): Status={send_status}, Resposta={send_resp}")
+                    logger.debug("MAIN_MENU: Resultado do envio (opção 7): Status=%s, Resposta=%s", send_status, send_resp)
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif mensagem_recebida.strip() == "8" or "localização" in mensagem_recebida or "minha localização" in mensagem_recebida or "onde estou" in mensagem_recebida:
-                    print(f"DEBUG_MAIN_MENU: Opção 8 - Localização selecionada.")
+                    logger.debug("MAIN_MENU: Opção 8 - Localização selecionada.")
                     contexto["awaiting_menu_return_prompt"] = False
                     contexto["awaiting_weather_follow_up_choice"] = False
                     contexto["registration_step"] = None
@@ -4093,19 +6746,19 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                         contexto["awaiting_menu_return_prompt"] = True
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_MAIN_MENU: Contexto salvo (opção 8): {contexto}")
+                        logger.debug("MAIN_MENU: Contexto salvo (opção 8): %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 8): {e}")
+                        logger.error("MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 8): %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
-                    print(f"DEBUG_MAIN_MENU: Resposta gerada (opção 8): {resposta}")
+                    logger.debug("MAIN_MENU: Resposta gerada (opção 8): %s", resposta)
                     send_status, send_resp = send_whatsapp_message(numero, resposta)
-                    print(f"DEBUG_MAIN_MENU: Resultado do envio (opção 8): Status={send_status}, Resposta={send_resp}")
+                    logger.debug("MAIN_MENU: Resultado do envio (opção 8): Status=%s, Resposta=%s", send_status, send_resp)
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 elif mensagem_recebida.strip() == "9" or "outras informações" in mensagem_recebida or "outras informacoes" in mensagem_recebida:
-                    print(f"DEBUG_MAIN_MENU: Opção 9 - Outras Informações selecionada.")
+                    logger.debug("MAIN_MENU: Opção 9 - Outras Informações selecionada.")
                     resposta = f"Para outras informações, você pode visitar nosso site em www.campointeligente.com.br ou entrar em contato com nosso suporte técnico. 💡\n\nDeseja voltar ao menu principal? (Responda 'sim' ou 'não')\n(Ou 'voltar' para o menu principal)"
                     contexto["awaiting_menu_return_prompt"] = True
                     contexto["awaiting_weather_location"] = False
@@ -4155,20 +6808,20 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                     contexto["initial_greeting_step"] = "completed" # <<<< IMPORTANT CHANGE HERE
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_MAIN_MENU: Contexto salvo (opção 9): {contexto}")
+                        logger.debug("MAIN_MENU: Contexto salvo (opção 9): %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 9): {e}")
+                        logger.error("MAIN_MENU_SAVE_ERROR: Erro ao salvar contexto (opção 9): %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
-                    print(f"DEBUG_MAIN_MENU: Resposta gerada (opção 9): {resposta}")
+                    logger.debug("MAIN_MENU: Resposta gerada (opção 9): %s", resposta)
                     send_status, send_resp = send_whatsapp_message(numero, resposta)
-                    print(f"DEBUG_MAIN_MENU: Resultado do envio (opção 9): Status={send_status}, Resposta={send_resp}")
+                    logger.debug("MAIN_MENU: Resultado do envio (opção 9): Status=%s, Resposta=%s", send_status, send_resp)
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
                 # Fallback para mensagens não reconhecidas
                 else:
-                    print(f"DEBUG_FALLBACK: Mensagem não reconhecida: '{mensagem_recebida}'")
+                    logger.debug("FALLBACK: Mensagem não reconhecida: '%s'", mensagem_recebida)
                     resposta = (
                         f"Desculpe, {nome}, não entendi sua mensagem. 🤔\n"
                         f"Por favor, escolha uma das opções do menu principal ou diga 'menu' para vê-las novamente:\n"
@@ -4184,28 +6837,55 @@ Data de Saída: {dados_saida_estoque_registro.get("data_saida", "N/A")}
                     )
                     try:
                         save_conversation_context(numero, contexto)
-                        print(f"DEBUG_FALLBACK: Contexto salvo (fallback): {contexto}")
+                        logger.debug("FALLBACK: Contexto salvo (fallback): %s", contexto)
                     except Exception as e:
-                        print(f"DEBUG_FALLBACK_SAVE_ERROR: Erro ao salvar contexto (fallback): {e}")
+                        logger.error("FALLBACK_SAVE_ERROR: Erro ao salvar contexto (fallback): %s", e)
                         resposta = "Desculpe, tive um problema ao salvar suas informações. Por favor, tente novamente."
                         send_whatsapp_message(numero, resposta)
                         return jsonify({"status": "erro", "resposta": resposta}), 500
-                    print(f"DEBUG_FALLBACK: Resposta gerada (fallback): {resposta}")
+                    logger.debug("FALLBACK: Resposta gerada (fallback): %s", resposta)
                     send_status, send_resp = send_whatsapp_message(numero, resposta)
-                    print(f"DEBUG_FALLBACK: Resultado do envio (fallback): Status={send_status}, Resposta={send_resp}")
+                    logger.debug("FALLBACK: Resultado do envio (fallback): Status=%s, Resposta=%s", send_status, send_resp)
                     return jsonify({"status": "sucesso", "resposta": resposta}), 200
 
             else:
-                print(f"DEBUG_WEBHOOK_END: Mensagem ou número não fornecidos.")
+                logger.debug("WEBHOOK_END: Mensagem ou número não fornecidos.")
                 return jsonify({"status": "erro", "mensagem": "Mensagem ou número não fornecidos."}), 400
         else:
-            print(f"DEBUG_WEBHOOK_END: Evento não suportado: {event}")
+            logger.debug("WEBHOOK_END: Evento não suportado: %s", event)
             return jsonify({"status": "erro", "mensagem": f"Evento '{event}' não suportado."}), 400
 
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
-        print(f"DEBUG_WEBHOOK_ERROR: Erro inesperado no webhook: {e}")
+        logger.error("WEBHOOK_ERROR: Erro inesperado no webhook: %s", e)
         return jsonify({"status": "erro", "mensagem": str(e)}), 500
 
 if __name__ == "__main__":
-    init_db() # Inicializa o banco de dados ao iniciar o aplicativo
-    app.run(debug=True, port=5000) # Rodar em debug=True para desenvolvimento
+    parser = argparse.ArgumentParser(description="Chatbot Campo Inteligente")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("runserver", help="inicializa o banco e roda o servidor de desenvolvimento (padrão)")
+    commands.add_parser("init-db", help="cria/atualiza as tabelas e sai")
+    export_parser = commands.add_parser("export-contexts", help="exporta conversation_contexts com COPY")
+    export_parser.add_argument("path", help="arquivo de saída (.gz para comprimir)")
+    export_parser.add_argument("--anonymize", action="store_true", help="troca CPF, RG e telefones por pseudônimos")
+    import_parser = commands.add_parser("import-contexts", help="importa um arquivo gerado por export-contexts")
+    import_parser.add_argument("path", help="arquivo de entrada (.gz se comprimido)")
+    import_parser.add_argument("--batch-rows", type=int, default=COPY_IMPORT_BATCH_ROWS, help="linhas por transação")
+    farmers_parser = commands.add_parser("list-farmers", help="lista os produtores cadastrados de um município")
+    farmers_parser.add_argument("municipio", help="nome do município (sem diferenciar maiúsculas)")
+    args = parser.parse_args()
+
+    if args.command == "init-db":
+        sys.exit(0 if init_db() else 1)
+    elif args.command == "export-contexts":
+        export_conversation_contexts(args.path, anonymize=args.anonymize)
+    elif args.command == "import-contexts":
+        init_db()
+        import_conversation_contexts(args.path, batch_rows=args.batch_rows)
+    elif args.command == "list-farmers":
+        for farmer in list_registered_farmers(args.municipio):
+            print(f"{farmer['phone_number']}\t{farmer['nome_completo'] or ''}")
+    else:
+        init_db() # Inicializa o banco de dados ao iniciar o aplicativo
+        app.run(debug=True, port=5000) # Rodar em debug=True para desenvolvimento
@@ -0,0 +1,330 @@
+# Acesso assíncrono ao PostgreSQL (asyncpg) para rodar o webhook num event loop.
+# Usa o mesmo esquema, as mesmas consultas e as mesmas regras de chatbot.py: forma compacta do
+# contexto, versão com compare-and-swap, NOTIFY para o cache dos outros workers, cadastro
+# materializado e unidade de trabalho por mensagem. Só o driver e o pool de conexões mudam.
+import asyncio
+import copy
+import logging
+import os
+
+import asyncpg
+
+from chatbot import (
+    CONVERSATION_STATE_DEFAULTS,
+    DB_HOST,
+    DB_NAME,
+    DB_PASSWORD,
+    DB_PORT,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_TIMEOUT_SECONDS,
+    DB_USER,
+    INSERT_CONTEXT_SQL,
+    LOAD_CONTEXT_SQL,
+    LOCK_CONTEXT_SQL,
+    MIGRATE_CONTEXT_SQL,
+    PATCH_CONTEXT_SQL,
+    REGISTRATION_STATUS_SQL,
+    RESTORE_ARCHIVED_CONTEXT_SQL,
+    UPSERT_CONTEXT_SQL,
+    DatabaseUnavailableError,
+    StaleContextError,
+    _context_sweeper_stats,
+    _context_unit_of_work,
+    _ensure_context_cache_listener,
+    _ensure_context_sweeper,
+    _ensure_dead_letter_replayer,
+    context_patch_params,
+    context_upsert_params,
+    conversa_contextos,
+    expand_conversation_state,
+    farmer_record_insert,
+    is_legacy_context,
+    is_registration_complete,
+    json_dumps,
+    json_loads,
+    legacy_context_keys,
+    numbered_placeholders,
+    schema_statements,
+)
+
+logger = logging.getLogger("chatbot.async_db")
+
+# Tempo máximo (segundos) de uma conexão ociosa no pool antes de ser fechada
+DB_ASYNC_POOL_MAX_IDLE_SECONDS = float(os.getenv("DB_ASYNC_POOL_MAX_IDLE_SECONDS", 300))
+
+# Os placeholders do psycopg2 (%s) viram os numerados do asyncpg ($1, $2, ...). O asyncpg já
+# prepara cada consulta no servidor e guarda o prepared statement em cache por conexão.
+asyncpg_sql = numbered_placeholders
+
+_LOAD_CONTEXT_SQL = asyncpg_sql(LOAD_CONTEXT_SQL)
+_RESTORE_ARCHIVED_CONTEXT_SQL = asyncpg_sql(RESTORE_ARCHIVED_CONTEXT_SQL)
+_LOCK_CONTEXT_SQL = asyncpg_sql(LOCK_CONTEXT_SQL)
+_MIGRATE_CONTEXT_SQL = asyncpg_sql(MIGRATE_CONTEXT_SQL)
+_UPSERT_CONTEXT_SQL = asyncpg_sql(UPSERT_CONTEXT_SQL)
+_INSERT_CONTEXT_SQL = asyncpg_sql(INSERT_CONTEXT_SQL)
+_PATCH_CONTEXT_SQL = asyncpg_sql(PATCH_CONTEXT_SQL)
+_REGISTRATION_STATUS_SQL = asyncpg_sql(REGISTRATION_STATUS_SQL)
+
+# Pool assíncrono do processo. Um pool do asyncpg pertence a um event loop: é recriado se o
+# loop mudar ou depois de um fork (as conexões herdadas do processo pai não são reaproveitadas).
+_async_pool_task = None
+_async_pool_loop = None
+_async_pool_pid = None
+
+
+# Função para preparar cada conexão nova do pool: JSONB entra e sai como objetos Python
+async def _init_connection(conn):
+    await conn.set_type_codec("jsonb", encoder=json_dumps, decoder=json_loads, schema="pg_catalog")
+
+
+async def _create_pool():
+    pool = await asyncpg.create_pool(
+        host=DB_HOST,
+        port=int(DB_PORT),
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=DB_ASYNC_POOL_MAX_IDLE_SECONDS,
+        init=_init_connection,
+    )
+    logger.info("DB_POOL: Pool assíncrono criado no processo %s (min=%s, max=%s).", os.getpid(), DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE)
+    return pool
+
+
+# Função para obter o pool assíncrono do processo (criado na primeira chamada dentro do loop)
+async def get_async_db_pool():
+    global _async_pool_task, _async_pool_loop, _async_pool_pid
+    loop = asyncio.get_running_loop()
+    if _async_pool_task is None or _async_pool_loop is not loop or _async_pool_pid != os.getpid():
+        _async_pool_task = loop.create_task(_create_pool())
+        _async_pool_loop = loop
+        _async_pool_pid = os.getpid()
+    task = _async_pool_task
+    try:
+        return await asyncio.shield(task)
+    except Exception:
+        # Falha ao conectar: a próxima chamada tenta criar o pool de novo
+        if _async_pool_task is task:
+            _async_pool_task = None
+        raise
+
+
+# Função para fechar o pool assíncrono (ao encerrar o servidor)
+async def close_async_db_pool():
+    global _async_pool_task
+    task, _async_pool_task = _async_pool_task, None
+    if task is not None and _async_pool_loop is asyncio.get_running_loop() and _async_pool_pid == os.getpid():
+        try:
+            pool = await task
+        except Exception:
+            return
+        await pool.close()
+
+
+# Função para obter estatísticas do pool assíncrono
+def get_async_db_pool_stats():
+    task = _async_pool_task
+    if task is None or not task.done() or task.cancelled() or task.exception() is not None:
+        return {"pid": os.getpid(), "created": False}
+    pool = task.result()
+    return {
+        "pid": os.getpid(),
+        "created": True,
+        "size": pool.get_size(),
+        "idle": pool.get_idle_size(),
+        "in_use": pool.get_size() - pool.get_idle_size(),
+        "min_size": pool.get_min_size(),
+        "max_size": pool.get_max_size(),
+    }
+
+
+# Função para pegar uma conexão do pool com o mesmo tempo máximo de espera do pool síncrono
+async def _acquire():
+    pool = await get_async_db_pool()
+    return pool.acquire(timeout=DB_POOL_TIMEOUT_SECONDS)
+
+
+# Função para inicializar as tabelas (mesmos comandos de chatbot.init_db)
+async def init_db():
+    try:
+        async with await _acquire() as conn:
+            async with conn.transaction():
+                for sql, params in schema_statements():
+                    await conn.execute(asyncpg_sql(sql), *params)
+        logger.info("DB_INIT: Tabela 'conversation_contexts' e tabelas de registros verificadas/criadas com sucesso.")
+    except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as e:
+        logger.error("DB_INIT_ERROR: Erro ao inicializar o banco de dados: %s", e)
+
+
+# Função para ajustar um contexto no formato antigo (mesma migração de chatbot._migrate_legacy_context)
+async def _migrate_legacy_context(conn, phone_number, context):
+    row = await conn.fetchrow(_LOCK_CONTEXT_SQL, phone_number)
+    if row is None:
+        logger.debug("DB_MIGRATE: Contexto de %s não existe mais; nada a migrar.", phone_number)
+        return None
+    locked_context = row[0] or {}
+    kinds, default_keys = legacy_context_keys(locked_context)
+    for kind in kinds:
+        await _insert_farmer_records(conn, phone_number, kind, locked_context[kind] or [])
+    for key in kinds + default_keys:
+        context.pop(key, None)
+    version = await conn.fetchval(
+        _MIGRATE_CONTEXT_SQL, kinds + default_keys, kinds + default_keys, list(CONVERSATION_STATE_DEFAULTS), phone_number
+    )
+    logger.info("DB_MIGRATE: Contexto de %s migrado (listas movidas: %s, flags padrão removidas: %s).", phone_number, kinds, len(default_keys))
+    return version
+
+
+# Função para inserir registros de um produtor na tabela correspondente ao tipo
+async def _insert_farmer_records(conn, phone_number, kind, records):
+    for record in records:
+        sql, key_value, record_date = farmer_record_insert(kind, record)
+        # O asyncpg não converte tipos sozinho como o psycopg2: a coluna indexada é TEXT
+        key_value = str(key_value) if key_value is not None else None
+        await conn.execute(asyncpg_sql(sql), phone_number, key_value, record_date, record)
+
+
+# Função para carregar o contexto da conversa (do cache compartilhado quando possível, senão do banco)
+async def load_conversation_context(phone_number):
+    uow = _context_unit_of_work.get()
+    _ensure_context_cache_listener()
+    _ensure_context_sweeper()
+    _ensure_dead_letter_replayer()
+    cached = conversa_contextos.get(phone_number)
+    if cached is not None:
+        snapshot, version = cached
+        logger.debug("DB_LOAD: Contexto de %s servido do cache (versão %s): %s", phone_number, version, snapshot)
+        if uow is not None:
+            uow.track_load(phone_number, snapshot, version)
+        return copy.deepcopy(snapshot)
+    try:
+        async with await _acquire() as conn:
+            row = await conn.fetchrow(_LOAD_CONTEXT_SQL, phone_number)
+            if row is None:
+                async with conn.transaction():
+                    row = await conn.fetchrow(_RESTORE_ARCHIVED_CONTEXT_SQL, phone_number, list(CONVERSATION_STATE_DEFAULTS))
+                if row is not None:
+                    _context_sweeper_stats.restored_total += 1
+                    logger.debug("DB_LOAD: Contexto de %s restaurado do arquivo.", phone_number)
+            if row is None:
+                logger.debug("DB_LOAD: Nenhum contexto encontrado no DB para %s. Retornando vazio.", phone_number)
+                return expand_conversation_state({})
+            loaded_context, version = row["context"] or {}, row["version"]
+            if is_legacy_context(loaded_context):
+                async with conn.transaction():
+                    migrated_version = await _migrate_legacy_context(conn, phone_number, loaded_context)
+                if migrated_version is not None:
+                    version = migrated_version
+    except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as e:
+        # Como na versão síncrona: seguir com um contexto vazio apagaria o cadastro na próxima gravação
+        logger.error("DB_LOAD_ERROR: Erro ao carregar contexto da conversa do banco de dados para %s: %s", phone_number, e)
+        raise DatabaseUnavailableError(f"Erro ao carregar o contexto de {phone_number}: {e}") from e
+    expand_conversation_state(loaded_context)
+    logger.debug("DB_LOAD: Contexto carregado do DB para %s: %s", phone_number, loaded_context)
+    snapshot = copy.deepcopy(loaded_context)
+    conversa_contextos.put(phone_number, snapshot, version)
+    if uow is not None:
+        uow.track_load(phone_number, snapshot, version)
+    return loaded_context
+
+
+# Função para carregar o contexto e o status de cadastro do usuário com uma única leitura
+async def load_conversation_state(phone_number):
+    context = await load_conversation_context(phone_number)
+    return context, is_registration_complete(context)
+
+
+# Função para gravar o documento completo do contexto e devolver a nova versão da linha
+async def _upsert_context(conn, phone_number, context, expect_new=False):
+    version = await conn.fetchval(
+        _INSERT_CONTEXT_SQL if expect_new else _UPSERT_CONTEXT_SQL, *context_upsert_params(phone_number, context)
+    )
+    if version is None:
+        raise StaleContextError(f"Contexto de {phone_number} foi criado por outra requisição antes desta gravação.")
+    logger.debug("DB_SAVE: Contexto para %s salvo/atualizado no DB (versão %s): %s", phone_number, version, context)
+    return version
+
+
+# Função para gravar só o delta do contexto, com compare-and-swap pela versão lida
+async def _patch_context(conn, phone_number, previous, context, expected_version):
+    params = context_patch_params(phone_number, previous, context, expected_version)
+    if params is None:
+        return expected_version
+    version = await conn.fetchval(_PATCH_CONTEXT_SQL, *params)
+    if version is None:
+        raise StaleContextError(f"Contexto de {phone_number} mudou desde a leitura (versão {expected_version}); gravação descartada.")
+    logger.debug("DB_SAVE: Contexto para %s atualizado no DB (versão %s, alteradas: %s, removidas: %s)", phone_number, version, list(params[1]), params[0])
+    return version
+
+
+# Função para salvar o contexto da conversa (adiada até flush_context_unit_of_work quando há
+# unidade de trabalho ativa). Fora dela a gravação é incondicional, como na versão síncrona.
+async def save_conversation_context(phone_number, context):
+    uow = _context_unit_of_work.get()
+    if uow is not None:
+        uow.register_save(phone_number, context)
+        return
+    try:
+        async with await _acquire() as conn:
+            version = await _upsert_context(conn, phone_number, context)
+    except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as e:
+        logger.error("DB_SAVE_ERROR: Erro ao salvar contexto da conversa no banco de dados para %s: %s", phone_number, e)
+        raise
+    conversa_contextos.put(phone_number, copy.deepcopy(context), version)
+
+
+# Função para gravar numa única transação o que a unidade de trabalho acumulou
+# (equivalente assíncrono de ContextUnitOfWork.flush)
+async def flush_context_unit_of_work(uow):
+    if not uow.pending_records and all(
+        context == uow.loaded.get(phone_number) for phone_number, context in uow.pending.items()
+    ):
+        if uow.pending:
+            logger.debug("DB_SAVE: Contexto de %s não mudou. Nenhuma gravação necessária.", ', '.join(uow.pending))
+        uow.pending.clear()
+        return
+    saved_versions = {}
+    try:
+        async with await _acquire() as conn:
+            async with conn.transaction():
+                for (phone_number, kind), records in uow.pending_records.items():
+                    await _insert_farmer_records(conn, phone_number, kind, records)
+                for phone_number, context in uow.pending.items():
+                    previous = uow.loaded.get(phone_number)
+                    if context == previous:
+                        continue
+                    if previous is None:
+                        saved_versions[phone_number] = await _upsert_context(conn, phone_number, context, expect_new=True)
+                    else:
+                        saved_versions[phone_number] = await _patch_context(conn, phone_number, previous, context, uow.versions[phone_number])
+    except StaleContextError as e:
+        for phone_number in uow.pending:
+            conversa_contextos.invalidate(phone_number)
+        logger.warning("DB_SAVE_CONFLICT: %s", e)
+        raise
+    except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as e:
+        logger.error("DB_SAVE_ERROR: Erro ao salvar contexto da conversa no banco de dados para %s: %s", ', '.join(uow.pending_phone_numbers()), e)
+        raise
+    for phone_number, version in saved_versions.items():
+        snapshot = copy.deepcopy(uow.pending[phone_number])
+        uow.track_load(phone_number, snapshot, version)
+        conversa_contextos.put(phone_number, snapshot, version)
+    uow.pending.clear()
+    uow.pending_records.clear()
+
+
+# Função para verificar se o usuário está cadastrado (coluna materializada, busca pela chave primária)
+async def is_user_registered(phone_number):
+    try:
+        async with await _acquire() as conn:
+            return bool(await conn.fetchval(_REGISTRATION_STATUS_SQL, phone_number))
+    except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as e:
+        logger.error("REGISTRATION_ERROR: Erro ao verificar cadastro do usuário: %s", e)
+        return False
+
+
+if __name__ == "__main__":
+    asyncio.run(init_db())
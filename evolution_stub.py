@@ -0,0 +1,167 @@
+# Servidor substituto da Evolution API para testes locais de carga e latência.
+# Implementa POST /message/sendText/<instance>, guarda as mensagens recebidas e pode simular
+# latência, erros e respostas 429 (limite de taxa). Para usar com o bot:
+#   python evolution_stub.py --port 8080 --latency-ms 80 --error-rate 0.02
+#   EVOLUTION_API_URL=http://127.0.0.1:8080 gunicorn chatbot:app
+import argparse
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+
+# Configuração das falhas simuladas (pode ser alterada em tempo de execução via POST /stub/config)
+stub_config = {
+    "latency_ms": float(os.getenv("STUB_LATENCY_MS", 0)),
+    "jitter_ms": float(os.getenv("STUB_JITTER_MS", 0)),
+    "error_rate": float(os.getenv("STUB_ERROR_RATE", 0)),
+    "error_status": int(os.getenv("STUB_ERROR_STATUS", 500)),
+    "rate_limit_per_second": float(os.getenv("STUB_RATE_LIMIT_PER_SECOND", 0)),
+}
+STUB_MAX_DELIVERIES = int(os.getenv("STUB_MAX_DELIVERIES", 100000))
+
+_lock = threading.Lock()
+deliveries = deque(maxlen=STUB_MAX_DELIVERIES)
+stub_stats = {
+    "requests_total": 0,
+    "delivered_total": 0,
+    "errors_injected_total": 0,
+    "rate_limited_total": 0,
+    "bad_requests_total": 0,
+    "first_delivery_at": None,
+    "last_delivery_at": None,
+}
+# Janela de um segundo por instância para o limite de taxa: instância -> [início da janela, contagem]
+_rate_windows = {}
+
+
+# Função para verificar o limite de taxa da instância (janela fixa de um segundo)
+def _rate_limited(instance):
+    limit = stub_config["rate_limit_per_second"]
+    if limit <= 0:
+        return False
+    now = time.monotonic()
+    with _lock:
+        window = _rate_windows.setdefault(instance, [now, 0])
+        if now - window[0] >= 1:
+            window[0], window[1] = now, 0
+        if window[1] >= limit:
+            return True
+        window[1] += 1
+        return False
+
+
+# Rota que imita o envio de texto da Evolution API
+@app.route("/message/sendText/<instance>", methods=["POST"])
+def send_text(instance):
+    with _lock:
+        stub_stats["requests_total"] += 1
+
+    latency_ms = stub_config["latency_ms"] + random.uniform(-1, 1) * stub_config["jitter_ms"]
+    if latency_ms > 0:
+        time.sleep(latency_ms / 1000)
+
+    data = request.get_json(silent=True) or {}
+    numero = data.get("number")
+    texto = (data.get("textMessage") or {}).get("text")
+    if not numero or texto is None:
+        with _lock:
+            stub_stats["bad_requests_total"] += 1
+        return jsonify({"status": 400, "error": "Bad Request", "response": {"message": ["number and textMessage.text are required"]}}), 400
+
+    if _rate_limited(instance):
+        with _lock:
+            stub_stats["rate_limited_total"] += 1
+        response = jsonify({"status": 429, "error": "Too Many Requests"})
+        response.headers["Retry-After"] = "1"
+        return response, 429
+
+    if stub_config["error_rate"] > 0 and random.random() < stub_config["error_rate"]:
+        with _lock:
+            stub_stats["errors_injected_total"] += 1
+        status = stub_config["error_status"]
+        return jsonify({"status": status, "error": "Injected failure"}), status
+
+    message_id = uuid.uuid4().hex[:20].upper()
+    now = time.time()
+    with _lock:
+        deliveries.append({"id": message_id, "instance": instance, "number": numero, "text": texto, "received_at": now})
+        stub_stats["delivered_total"] += 1
+        if stub_stats["first_delivery_at"] is None:
+            stub_stats["first_delivery_at"] = now
+        stub_stats["last_delivery_at"] = now
+    return jsonify({
+        "key": {"remoteJid": numero, "fromMe": True, "id": message_id},
+        "message": {"extendedTextMessage": {"text": texto}},
+        "messageTimestamp": str(int(now)),
+        "status": "PENDING",
+    }), 201
+
+
+# Rota para consultar as mensagens recebidas (filtro opcional por número)
+@app.route("/stub/deliveries", methods=["GET"])
+def list_deliveries():
+    numero = request.args.get("number")
+    limit = int(request.args.get("limit", 100))
+    with _lock:
+        items = [d for d in deliveries if numero is None or d["number"] == numero]
+    return jsonify(items[-limit:] if limit > 0 else items), 200
+
+
+# Rota para limpar as mensagens e os contadores entre uma rodada de teste e outra
+@app.route("/stub/deliveries", methods=["DELETE"])
+def clear_deliveries():
+    with _lock:
+        deliveries.clear()
+        _rate_windows.clear()
+        for key in stub_stats:
+            stub_stats[key] = None if key.endswith("_at") else 0
+    return jsonify({"status": "ok"}), 200
+
+
+# Rota com os contadores e a vazão observada (mensagens entregues por segundo)
+@app.route("/stub/stats", methods=["GET"])
+def get_stats():
+    with _lock:
+        stats = dict(stub_stats)
+    elapsed = (stats["last_delivery_at"] or 0) - (stats["first_delivery_at"] or 0)
+    stats["deliveries_per_second"] = round(stats["delivered_total"] / elapsed, 2) if elapsed > 0 else None
+    stats["config"] = dict(stub_config)
+    return jsonify(stats), 200
+
+
+# Rota para mudar a latência/erros simulados sem reiniciar (ex: simular uma queda no meio do teste)
+@app.route("/stub/config", methods=["POST"])
+def update_config():
+    data = request.get_json(silent=True) or {}
+    unknown = sorted(set(data) - set(stub_config))
+    if unknown:
+        return jsonify({"erro": f"Opções desconhecidas: {', '.join(unknown)}"}), 400
+    for key, value in data.items():
+        stub_config[key] = type(stub_config[key])(value)
+    return jsonify(stub_config), 200
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor substituto da Evolution API para testes locais.")
+    parser.add_argument("--host", default=os.getenv("STUB_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("STUB_PORT", 8080)))
+    parser.add_argument("--latency-ms", type=float, default=stub_config["latency_ms"], help="latência média de cada envio")
+    parser.add_argument("--jitter-ms", type=float, default=stub_config["jitter_ms"], help="variação (+/-) da latência")
+    parser.add_argument("--error-rate", type=float, default=stub_config["error_rate"], help="fração dos envios que falham (0 a 1)")
+    parser.add_argument("--error-status", type=int, default=stub_config["error_status"], help="status HTTP das falhas simuladas")
+    parser.add_argument("--rate-limit", type=float, default=stub_config["rate_limit_per_second"], help="envios/s por instância antes de responder 429 (0 = sem limite)")
+    args = parser.parse_args()
+    stub_config.update(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        rate_limit_per_second=args.rate_limit,
+    )
+    app.run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,34 @@
+# Configuração do Gunicorn (lida automaticamente ao rodar "gunicorn chatbot:app" nesta pasta)
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# Vários processos e threads: mensagens de números diferentes são atendidas em paralelo,
+# e as de um mesmo número continuam em ordem (fila por número + advisory lock no PostgreSQL).
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+worker_class = "gthread"
+
+# As threads do gunicorn só validam e enfileiram o webhook; quem processa são as WEBHOOK_WORKER_THREADS
+# threads da fila. Cada mensagem em andamento usa até 2 conexões do pool (o lock da conversa e as
+# leituras/gravações); por padrão DB_POOL_MAX_SIZE é calculado a partir dessas threads e das de envio
+# e de manutenção (2 x WEBHOOK_WORKER_THREADS + OUTBOUND_SENDER_THREADS + 2). Ao definir um valor
+# menor, o worker avisa no log ao criar o pool.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+
+# Migração do banco na subida: antes de criar os workers, o processo principal roda chatbot.init_db()
+# (idempotente), que cria ou atualiza as tabelas, colunas e índices. Sem isso, um banco de uma versão
+# anterior não tem a coluna version e todo webhook falha. Se a migração falhar o gunicorn não sobe.
+# Réplicas subindo juntas migram uma de cada vez (advisory lock). Para migrar num passo separado do
+# deploy ("python chatbot.py init-db"), use DB_MIGRATE_ON_START=0.
+DB_MIGRATE_ON_START = os.getenv("DB_MIGRATE_ON_START", "1") != "0"
+
+
+def on_starting(server):
+    if not DB_MIGRATE_ON_START:
+        return
+    import chatbot
+    if not chatbot.init_db():
+        raise RuntimeError("Falha ao migrar o banco de dados (veja DB_INIT_ERROR no log).")
+    # Os workers abrem o próprio pool depois do fork; o processo principal não precisa de conexões
+    chatbot.get_db_pool().closeall()
@@ -0,0 +1,28 @@
+import asyncio
+
+import pytest
+
+import chatbot
+import chatbot_async_db
+
+
+class _FailingAcquire:
+    async def __aenter__(self):
+        raise OSError("connection refused")
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def test_load_conversation_context_raises_when_database_fails(monkeypatch):
+    async def acquire():
+        return _FailingAcquire()
+
+    monkeypatch.setattr(chatbot_async_db, "_acquire", acquire)
+    monkeypatch.setattr(chatbot_async_db, "_ensure_context_cache_listener", lambda: None)
+    monkeypatch.setattr(chatbot_async_db, "_ensure_context_sweeper", lambda: None)
+    monkeypatch.setattr(chatbot_async_db, "_ensure_dead_letter_replayer", lambda: None)
+    chatbot.conversa_contextos.invalidate("5511999990000@s.whatsapp.net")
+
+    with pytest.raises(chatbot.DatabaseUnavailableError):
+        asyncio.run(chatbot_async_db.load_conversation_context("5511999990000@s.whatsapp.net"))
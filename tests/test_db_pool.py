@@ -0,0 +1,22 @@
+import chatbot
+
+
+class _FakeConnection:
+    closed = False
+    status = None
+
+    def close(self):
+        self.closed = True
+
+
+def test_recent_checkouts_are_pruned_without_stats(monkeypatch):
+    monkeypatch.setattr(chatbot.DatabaseConnectionPool, "_connect", lambda self: _FakeConnection())
+    pool = chatbot.DatabaseConnectionPool(0, 1, 1, 30)
+    clock = [1000.0]
+    monkeypatch.setattr(chatbot.time, "monotonic", lambda: clock[0])
+    for _ in range(100):
+        pool._recent_checkouts.append(clock[0])
+    clock[0] += 61
+    conn = pool.getconn()
+    assert list(pool._recent_checkouts) == [clock[0]]
+    pool.putconn(conn, close=True)
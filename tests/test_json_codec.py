@@ -0,0 +1,29 @@
+import datetime
+
+import pytest
+
+import chatbot
+
+pytestmark = pytest.mark.skipif(chatbot.orjson is None, reason="orjson não está instalado")
+
+
+@pytest.fixture(params=[False, True], ids=["json", "orjson"])
+def codec(request, monkeypatch):
+    monkeypatch.setattr(chatbot, "USE_ORJSON", request.param)
+
+
+def test_large_integers_round_trip(codec):
+    document = {"n": 123456789012345678901234, "m": -9223372036854775809, "texto": "João"}
+    assert chatbot.json_loads(chatbot.json_dumps(document)) == document
+    assert chatbot.json_loads(chatbot.json_dumps(document).encode()) == document
+
+
+def test_long_digit_strings_stay_strings(codec):
+    document = {"id": "12345678901234567890123", "timestamp": 1717171717}
+    assert chatbot.json_loads(chatbot.json_dumps(document)) == document
+
+
+def test_jsonify_keeps_http_date_format(codec):
+    with chatbot.app.app_context():
+        body = chatbot.jsonify({"data_hora": datetime.datetime(2024, 5, 31, 12)}).get_json()
+    assert body == {"data_hora": "Fri, 31 May 2024 12:00:00 GMT"}
@@ -0,0 +1,28 @@
+import pytest
+
+import chatbot
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("remoteJid=5511987654321@s.whatsapp.net", "remoteJid=*******4321@s.whatsapp.net"),
+    ("numero 551134567890", "numero *******7890"),
+    ("celular 11987654321", "celular *******4321"),
+    ("celular (11) 98765-4321", "celular *******4321"),
+    ("cpf 123.456.789-09 e 12345678909", "cpf ***.***.***-** e ***********"),
+    ("rg 12.345.678-X", "rg **.***.***-*"),
+    ("contexto {'cpf': '12345678909', 'rg': '1234567'}", "contexto {'cpf': '***', 'rg': '***'}"),
+    ("email fulano@exemplo.com.br", "email ***@***"),
+])
+def test_personal_data_is_masked(message, expected):
+    assert chatbot.redact_pii(message) == expected
+
+
+@pytest.mark.parametrize("message", [
+    "messageTimestamp=1717171717",
+    "messageTimestamp=1717171717000",
+    "id=3EB0C767D26A1D0AB2F1 status=200",
+    "120 cabeças, 4500 kg de ração, pedido 20240531",
+    "grupo 120363025246125486@g.us",
+])
+def test_other_numbers_stay_readable(message):
+    assert chatbot.redact_pii(message) == message
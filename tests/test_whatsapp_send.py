@@ -0,0 +1,43 @@
+import pytest
+import requests
+
+import chatbot
+
+
+def _response(status_code, body, content_type="text/plain"):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers["Content-Type"] = content_type
+    return response
+
+
+class _FakeSession:
+    def __init__(self, response):
+        self.response = response
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        return self.response
+
+
+@pytest.mark.parametrize("status_code, body", [(204, b""), (201, b"PENDING"), (200, b"<html>ok</html>")])
+def test_post_whatsapp_message_accepts_2xx_without_json(monkeypatch, status_code, body):
+    monkeypatch.setattr(chatbot, "get_evolution_session", lambda: _FakeSession(_response(status_code, body)))
+    assert chatbot._post_whatsapp_message("5511999990000@s.whatsapp.net", "oi") == (status_code, None)
+
+
+def test_deliver_does_not_resend_a_2xx_without_json(monkeypatch):
+    session = _FakeSession(_response(201, b"PENDING"))
+    monkeypatch.setattr(chatbot, "get_evolution_session", lambda: session)
+    monkeypatch.setattr(chatbot, "_dead_letter_whatsapp_message", lambda *args: pytest.fail("mensagem aceita foi para a dead letter"))
+    status, _ = chatbot._deliver_whatsapp_message("5511999990000@s.whatsapp.net", "oi")
+    assert status == 201
+    assert session.calls == 1
+
+
+def test_post_whatsapp_message_returns_json_body(monkeypatch):
+    response = _response(201, b'{"key": {"id": "ABC"}}', "application/json")
+    monkeypatch.setattr(chatbot, "get_evolution_session", lambda: _FakeSession(response))
+    assert chatbot._post_whatsapp_message("5511999990000@s.whatsapp.net", "oi") == (201, {"key": {"id": "ABC"}})